@@ -0,0 +1,207 @@
+"""Columnar sales analytics.
+
+Keeps a copy of the sales history in NumPy arrays, one per column, and
+answers dashboard questions with vectorized operations instead of a SQL
+aggregate per metric. Sales are append-only, so refresh() only reads the
+rows added since the last refresh, found by rowid. Months moved to the
+sales archive are read from their Parquet files on the first refresh,
+through the inventory service when the database is remote.
+
+    analytics = SalesAnalytics(get_database())
+    analytics.refresh()
+    analytics.top_products(5, days=30)
+    analytics.rolling_profit(days=90, window=7)
+    analytics.leaderboard('week', 5)        # kept current as sales arrive
+    analytics.percentiles('revenue', (50, 90, 99))
+"""
+import threading
+
+import numpy as np
+
+from database import ProductProfit, day_label, today
+from leaderboard import Leaderboard, SIZE as LEADERBOARD_SIZE
+
+# Sales read per round trip while catching up
+CHUNK_SIZE = 100000
+
+# Column arrays grow by at least this factor, so appends are amortized O(1)
+GROWTH = 1.5
+
+# Columns held for every sale, with their array types
+COLUMNS = (
+    ('sku_id', np.int32),
+    ('day', np.int32),          # days since 1970-01-01 (UTC, like date_sold)
+    ('quantity', np.int32),
+    ('revenue', np.float64),    # quantity * sale_price
+    ('cost', np.float64),       # cost allocated when the sale was made
+)
+
+
+class SalesAnalytics:
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # Forget everything loaded; the next refresh reads the whole history
+        self.last_id = 0
+        self.size = 0
+        self._columns = {name: np.empty(0, dtype) for name, dtype in COLUMNS}
+        self._archive_loaded = False
+        self._archived = []
+        self._leaderboard = Leaderboard()
+        # SKU names never change, so each is looked up once
+        self._names = {}
+
+    def refresh(self):
+        # Appends the sales recorded since the last refresh and returns how
+        # many there were
+        with self._lock:
+            while True:
+                loading = not self._archive_loaded
+                added = self._load_archive() if loading else 0
+                added += self._catch_up()
+                # A month archived between reading the month list and the
+                # hot sales is in neither; start again if that happened
+                if not loading or self._archived == self._archive_months():
+                    return added
+                self.reset()
+
+    def _catch_up(self):
+        added = 0
+        while True:
+            rows = self.db.sales.rows_after(self.last_id, CHUNK_SIZE)
+            if not rows:
+                break
+            self._append(rows)
+            added += len(rows)
+            if len(rows) < CHUNK_SIZE:
+                break
+        return added
+
+    def _archive_months(self):
+        return [month.month for month in self.db.archive.months()]
+
+    def _load_archive(self):
+        # Archived months go in first; their sales are older than any hot
+        # one. The files sit next to the database, so a remote terminal
+        # has the service read them.
+        self._archive_loaded = True
+        self._archived = self._archive_months()
+        added = 0
+        archive = self.db.archive
+        for month in self._archived:
+            if self.db.remote:
+                lists = archive.column_lists(month)
+                block = {name: np.asarray(lists[name], dtype) for name, dtype in COLUMNS}
+            else:
+                block = archive.columns(month)
+            self._extend(block)
+            added += len(block['day'])
+        return added
+
+    def _append(self, rows):
+        # rows are (id, sku_id, day, quantity, revenue, cost) tuples in id order
+        block = np.array(rows, dtype=np.float64)
+        self._extend({name: block[:, index] for index, (name, _) in enumerate(COLUMNS, start=1)})
+        self.last_id = int(block[-1, 0])
+
+    def _extend(self, block):
+        # block maps each column name to an array of the same length
+        needed = self.size + len(block['day'])
+        capacity = len(self._columns['day'])
+        if needed > capacity:
+            capacity = max(needed, int(capacity * GROWTH))
+            for name, dtype in COLUMNS:
+                grown = np.empty(capacity, dtype)
+                grown[:self.size] = self._columns[name][:self.size]
+                self._columns[name] = grown
+        for name, _ in COLUMNS:
+            self._columns[name][self.size:needed] = block[name]
+        self.size = needed
+        self._leaderboard.add(block['sku_id'], block['day'], block['revenue'], block['cost'])
+
+    def column(self, name):
+        # A read-only view of one column over the loaded sales; no copy
+        view = self._columns[name][:self.size]
+        view.flags.writeable = False
+        return view
+
+    def _since(self, days):
+        # Mask of the sales made within the last days days (None: all)
+        if days is None:
+            return slice(None)
+        return self.column('day') >= today() - days
+
+    def daily(self, days=30):
+        # (first day, revenue per day, cost per day) over the last days
+        # days, including days without sales
+        start = today() - days
+        mask = self._since(days)
+        offsets = self.column('day')[mask] - start
+        length = days + 1
+        revenue = np.bincount(offsets, weights=self.column('revenue')[mask], minlength=length)
+        cost = np.bincount(offsets, weights=self.column('cost')[mask], minlength=length)
+        return start, revenue[:length], cost[:length]
+
+    def rolling_profit(self, days=90, window=7):
+        # Trailing window-day mean of daily profit for each of the last
+        # days days, as (date, mean) pairs
+        start, revenue, cost = self.daily(days + window - 1)
+        profit = revenue - cost
+        sums = np.cumsum(np.concatenate(([0.0], profit)))
+        means = (sums[window:] - sums[:-window]) / window
+        first = start + window - 1
+        return [(day_label(first + offset), float(mean)) for offset, mean in enumerate(means)]
+
+    def percentiles(self, column='revenue', q=(50, 90, 99), days=None):
+        # Per-sale percentiles of a column ('profit' is revenue - cost)
+        mask = self._since(days)
+        if column == 'profit':
+            values = self.column('revenue')[mask] - self.column('cost')[mask]
+        else:
+            values = self.column(column)[mask]
+        if not len(values):
+            return {pct: 0.0 for pct in q}
+        return dict(zip(q, (float(value) for value in np.percentile(values, q))))
+
+    def by_sku(self, days=None):
+        # (revenue, cost, units) arrays indexed by SKU id
+        mask = self._since(days)
+        sku_ids = self.column('sku_id')[mask]
+        revenue = np.bincount(sku_ids, weights=self.column('revenue')[mask])
+        cost = np.bincount(sku_ids, weights=self.column('cost')[mask])
+        units = np.bincount(sku_ids, weights=self.column('quantity')[mask])
+        return revenue, cost, units
+
+    def leaderboard(self, window='all', limit=5):
+        # Top SKUs by profit for 'today', 'week', 'month' or 'all', read
+        # from rankings maintained as sales are loaded
+        if limit > LEADERBOARD_SIZE:
+            return self.top_products(limit)
+        ranked = self._leaderboard.top(window, limit)
+        names = self.names([sku_id for sku_id, _, _ in ranked])
+        return [ProductProfit(names.get(sku_id, ''), revenue, cost) for sku_id, revenue, cost in ranked]
+
+    def names(self, sku_ids):
+        missing = [sku_id for sku_id in sku_ids if sku_id not in self._names]
+        if missing:
+            self._names.update(self.db.skus.names(missing))
+        return self._names
+
+    def top_products(self, limit=5, days=None):
+        # Same ranking as StatsRepository.top_products, over any number of
+        # days; only the names of the winners are looked up
+        if days is None and limit <= LEADERBOARD_SIZE:
+            return self.leaderboard('all', limit)
+        revenue, cost, _ = self.by_sku(days)
+        sold = np.flatnonzero(np.bincount(self.column('sku_id')[self._since(days)],
+                                          minlength=len(revenue)))
+        if not len(sold):
+            return []
+        profit = revenue[sold] - cost[sold]
+        ranked = sold[np.argsort(-profit, kind='stable')[:limit]]
+        names = self.names([int(sku_id) for sku_id in ranked])
+        return [ProductProfit(names.get(int(sku_id), ''), float(revenue[sku_id]), float(cost[sku_id]))
+                for sku_id in ranked]
@@ -0,0 +1,306 @@
+"""Online backups.
+
+backup_database() copies the live database with the sqlite3 backup API,
+PAGES_PER_STEP pages at a time. The source connection holds a single
+read transaction for the whole copy. In WAL mode that pins one snapshot:
+writers carry on committing throughout, and the copy never has to
+restart because of them. Every few backups the copy is made with VACUUM
+INTO instead, which writes a defragmented file from the same kind of
+snapshot. Archived months of sales (see sales_archive) are linked or
+copied next to the backup. Their files never change once written.
+
+BackupScheduler runs backups on a background thread, keeps the newest
+few, and afterwards gives free pages back to the file system in short
+incremental-vacuum transactions, if the database is set up for that.
+Each result reports the throughput and the longest wait any writer in
+this process had for the write lock while the backup ran.
+
+restore_database() copies a backup back over the database, through the
+backup API, after checking it. Other terminals should be closed first.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sales_archive import archive_directory
+
+# Pages copied per backup step (4 KiB each)
+PAGES_PER_STEP = 256
+# Pause between steps, in seconds, so other threads get the disk and the GIL
+STEP_PAUSE = 0.001
+
+# Seconds between scheduled backups, and how many backups to keep
+BACKUP_INTERVAL = 6 * 3600
+KEEP_BACKUPS = 7
+# Every this many scheduled backups is a compacted VACUUM INTO copy
+COMPACT_EVERY = 4
+
+# Free pages released per incremental-vacuum transaction
+VACUUM_PAGES = 1000
+
+BackupProgress = namedtuple('BackupProgress', 'copied total')
+BackupResult = namedtuple('BackupResult',
+                          'path bytes seconds mb_per_sec longest_stall_ms archive_files compacted')
+
+
+class BackupError(Exception):
+    pass
+
+
+def backup_directory(db_path):
+    return os.path.splitext(os.path.abspath(db_path))[0] + '_backups'
+
+
+def backup_path(db_path, when=None):
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    stamp = (when or datetime.now()).strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(backup_directory(db_path), f'{name}-{stamp}.db')
+    # Two backups in the same second get a counter rather than overwrite
+    count = 1
+    while os.path.exists(path):
+        count += 1
+        path = os.path.join(backup_directory(db_path), f'{name}-{stamp}-{count}.db')
+    return path
+
+
+def list_backups(db_path):
+    # Oldest first
+    directory = backup_directory(db_path)
+    if not os.path.isdir(directory):
+        return []
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.db')]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def quick_check(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        # Not an SQLite file at all
+        result = str(e)
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise BackupError(f"{path} failed its integrity check: {result}")
+
+
+def backup_database(pool, destination, compact=False, progress=None, pages=PAGES_PER_STEP):
+    # Writes a consistent copy of the pool's database to destination.
+    # progress, if given, gets a BackupProgress after every step and may
+    # raise to abandon the backup.
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    temporary = destination + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    started = time.perf_counter()
+    mark = pool.lock_wait_count
+
+    source = pool.connect()
+    try:
+        if compact:
+            source.execute('VACUUM INTO ?', (temporary,))
+            if progress is not None:
+                progress(BackupProgress(1, 1))
+        else:
+            # Pin one snapshot for every step
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_schema').fetchone()
+
+            def step(status, remaining, total):
+                if progress is not None:
+                    progress(BackupProgress(total - remaining, total))
+                time.sleep(STEP_PAUSE)
+
+            target = sqlite3.connect(temporary)
+            try:
+                source.backup(target, pages=pages, progress=step)
+            finally:
+                target.close()
+            source.execute('COMMIT')
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    finally:
+        source.close()
+
+    # The copy inherits WAL mode from the header; a backup is better as a
+    # single self-contained file
+    conn = sqlite3.connect(temporary)
+    try:
+        conn.execute('PRAGMA journal_mode = DELETE').fetchone()
+    finally:
+        conn.close()
+    quick_check(temporary)
+    with open(temporary, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(temporary, destination)
+    archive_files = copy_archive(archive_directory(pool.path), destination)
+
+    seconds = time.perf_counter() - started
+    size = os.path.getsize(destination)
+    waits = pool.lock_waits_since(mark)
+    return BackupResult(destination, size, seconds, size / seconds / 1e6 if seconds else 0.0,
+                        max(waits) * 1000 if waits else 0.0, archive_files, compact)
+
+
+def copy_archive(source_directory, database):
+    # Copies the archived months a database file relies on from
+    # source_directory into the database's own archive directory; hard
+    # links where the file system allows, since the files never change
+    conn = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    try:
+        months = conn.execute('SELECT month, path FROM archived_months').fetchall()
+    except sqlite3.OperationalError:
+        # Made before the archive existed
+        months = []
+    finally:
+        conn.close()
+    if not months:
+        return 0
+
+    target_directory = archive_directory(database)
+    os.makedirs(target_directory, exist_ok=True)
+    copied = 0
+    for month, path in months:
+        for name in (path, f'allocations-{month}.parquet'):
+            source = os.path.join(source_directory, name)
+            target = os.path.join(target_directory, name)
+            if os.path.exists(target):
+                continue
+            if not os.path.exists(source):
+                raise BackupError(f"Archived file {source} is missing")
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+            copied += 1
+    return copied
+
+
+def restore_database(pool, backup, progress=None, pages=PAGES_PER_STEP):
+    # Replaces the pool's database with backup, and puts back any
+    # archived months it needs that are missing
+    if not os.path.exists(backup):
+        raise BackupError(f"No backup at {backup}")
+    quick_check(backup)
+
+    def step(status, remaining, total):
+        if progress is not None:
+            progress(BackupProgress(total - remaining, total))
+
+    source = sqlite3.connect(f'file:{backup}?mode=ro', uri=True)
+    try:
+        with pool.connection() as target:
+            source.backup(target, pages=pages, progress=step)
+    finally:
+        source.close()
+    return copy_archive(archive_directory(backup), pool.path)
+
+
+def release_free_pages(pool, pages=VACUUM_PAGES):
+    # Gives free pages back to the file system a batch per transaction, so
+    # writers wait for one batch at most. Only databases created or
+    # vacuumed with auto_vacuum = INCREMENTAL can; returns None otherwise.
+    with pool.connection() as conn:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return None
+    released = 0
+    while True:
+        with pool.transaction() as conn:
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free:
+                return released
+            # incremental_vacuum frees one page per step, and sqlite3 steps a
+            # statement that returns no rows only once, so it takes a call a page
+            for _ in range(min(free, pages)):
+                conn.execute('PRAGMA incremental_vacuum')
+            released += free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def prune_backups(db_path, keep=KEEP_BACKUPS):
+    for path in list_backups(db_path)[:-keep or None]:
+        os.remove(path)
+        shutil.rmtree(archive_directory(path), ignore_errors=True)
+
+
+class BackupScheduler:
+    # Backs the database up every interval seconds on a daemon thread.
+    # progress is the BackupProgress of the backup running now, if any;
+    # last and error describe the most recent one. released is how many
+    # free pages the last run gave back, or None when the database is not
+    # set up for incremental vacuum and never shrinks.
+    def __init__(self, pool, interval=BACKUP_INTERVAL, keep=KEEP_BACKUPS, compact_every=COMPACT_EVERY):
+        self.pool = pool
+        self.interval = interval
+        self.keep = keep
+        self.compact_every = compact_every
+        self.progress = None
+        self.last = None
+        self.error = None
+        self.released = 0
+        self._runs = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # A backup in progress is abandoned at its next step
+        self._stopped.set()
+
+    def next_delay(self):
+        # Counted from the newest backup, so restarts do not back up again
+        backups = list_backups(self.pool.path)
+        if not backups:
+            return 0
+        return max(0, os.path.getmtime(backups[-1]) + self.interval - time.time())
+
+    def _run(self):
+        while not self._stopped.wait(self.next_delay()):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.error = e
+                # Try again after a full interval rather than straight away
+                if self._stopped.wait(self.interval):
+                    break
+
+    def _report(self, progress):
+        if self._stopped.is_set():
+            raise BackupError("Backup abandoned on shutdown")
+        self.progress = progress
+
+    def run_once(self):
+        self._runs += 1
+        compact = self._runs % self.compact_every == 0
+        try:
+            self.last = backup_database(self.pool, backup_path(self.pool.path), compact,
+                                        progress=self._report)
+        finally:
+            self.progress = None
+        self.error = None
+        prune_backups(self.pool.path, self.keep)
+        self.released = release_free_pages(self.pool)
+        return self.last
+
+
+_scheduler = None
+
+
+def start_scheduler(pool, **kwargs):
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = BackupScheduler(pool, **kwargs).start()
+    return _scheduler
+
+
+def get_scheduler():
+    return _scheduler
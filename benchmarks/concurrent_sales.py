@@ -0,0 +1,108 @@
+"""Concurrent checkout benchmark.
+
+Runs N writer processes against one database file, each recording sales
+through SaleRepository.record, and reports throughput, write-lock wait
+percentiles and whether any stock was oversold.
+
+    python benchmarks/concurrent_sales.py --processes 4 --sales 2000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, InsufficientStockError
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def writer(path, sku_ids, sales, start_event, results):
+    recorded = rejected = 0
+    db = Database(path, pool_size=1)
+    try:
+        start_event.wait()
+        # Only time the sales themselves, not schema setup
+        db.pool.lock_waits.clear()
+        for _ in range(sales):
+            try:
+                db.sales.record(random.choice(sku_ids), random.randint(1, 3), 9.99)
+                recorded += 1
+            except InsufficientStockError:
+                rejected += 1
+    finally:
+        # Always report back so the parent never waits on a dead worker
+        results.put((recorded, rejected, list(db.pool.lock_waits)))
+        db.close()
+
+
+def seed(path, products, stock):
+    db = Database(path)
+    db.products.add_many([(f"Bench product {i}", stock, 4.50, 1) for i in range(products)])
+    sku_ids = [sku.id for sku in db.skus.page_in_stock(limit=products)]
+    db.close()
+    return sku_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--sales', type=int, default=1000, help='sales attempted per process')
+    parser.add_argument('--products', type=int, default=10)
+    parser.add_argument('--stock', type=int, default=1000, help='initial stock per product')
+    parser.add_argument('--db', help='database file (default: a temporary file)')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    sku_ids = seed(path, args.products, args.stock)
+
+    start_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=writer,
+                                       args=(path, sku_ids, args.sales, start_event, results))
+               for _ in range(args.processes)]
+    for process in workers:
+        process.start()
+
+    started = time.perf_counter()
+    start_event.set()
+    outcomes = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+    for process in workers:
+        process.join()
+
+    recorded = sum(outcome[0] for outcome in outcomes)
+    rejected = sum(outcome[1] for outcome in outcomes)
+    waits = [wait * 1000 for outcome in outcomes for wait in outcome[2]]
+
+    db = Database(path)
+    with db.pool.connection() as conn:
+        remaining, negative = conn.execute(
+            'SELECT SUM(quantity), SUM(quantity < 0) FROM products').fetchone()
+        sold = conn.execute('SELECT COALESCE(SUM(quantity), 0) FROM sales').fetchone()[0]
+    db.close()
+
+    print(f"processes:        {args.processes}")
+    print(f"sales recorded:   {recorded} ({rejected} rejected for stock)")
+    print(f"throughput:       {recorded / elapsed:,.0f} sales/sec")
+    print(f"lock wait p50:    {percentile(waits, 50):.2f} ms")
+    print(f"lock wait p95:    {percentile(waits, 95):.2f} ms")
+    print(f"lock wait p99:    {percentile(waits, 99):.2f} ms")
+    print(f"lock wait max:    {max(waits, default=0):.2f} ms")
+    oversold = negative or remaining + sold != args.products * args.stock
+    print(f"stock consistent: {'no' if oversold else 'yes'}")
+    return 1 if oversold else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Synthetic data generator.
+
+Fills a database with products and a sales history for benchmarking.
+Product popularity follows a Zipf-like curve, and sales grow over time
+with weekly and end-of-year seasonality, so recent days and best sellers
+dominate the way they do in a real shop. Stock levels are independent of
+the generated history.
+
+    python benchmarks/generate_data.py --db bench.db --products 1000000 --sales 20000000
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, DB_PATH
+
+# Rows written per transaction
+CHUNK_SIZE = 50000
+
+BRANDS = ['Acme', 'Northwind', 'Contoso', 'Globex', 'Initech', 'Umbrella', 'Stark', 'Wayne',
+          'Hooli', 'Vandelay', 'Soylent', 'Tyrell', 'Cyberdyne', 'Wonka', 'Gringotts', 'Oceanic']
+ADJECTIVES = ['Classic', 'Organic', 'Premium', 'Light', 'Extra', 'Fresh', 'Smoked', 'Spicy',
+              'Sweet', 'Salted', 'Roasted', 'Frozen', 'Wholegrain', 'Sparkling', 'Vanilla',
+              'Lemon', 'Cherry', 'Mint', 'Dark', 'Golden', 'Herbal', 'Wild', 'Crunchy', 'Mild']
+NOUNS = ['Cola', 'Coffee', 'Tea', 'Chocolate', 'Biscuits', 'Crisps', 'Pasta', 'Rice', 'Soup',
+         'Juice', 'Water', 'Yogurt', 'Cheese', 'Butter', 'Bread', 'Cereal', 'Honey', 'Jam',
+         'Sauce', 'Oil', 'Vinegar', 'Soap', 'Shampoo', 'Detergent', 'Batteries', 'Candles',
+         'Noodles', 'Beans', 'Nuts', 'Flour', 'Sugar', 'Salt', 'Pepper', 'Mustard', 'Olives']
+SIZES = ['100g', '250g', '500g', '1kg', '330ml', '500ml', '1L', '2L', '6 pack', '12 pack']
+
+# Relative sales per weekday, Monday first
+WEEKDAY_WEIGHTS = [0.85, 0.8, 0.9, 0.95, 1.15, 1.4, 0.95]
+
+
+def product_rows(count, rng):
+    for _ in range(count):
+        name = (f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} "
+                f"{rng.choice(SIZES)}")
+        cost = round(rng.lognormvariate(1.2, 0.8) + 0.05, 2)
+        quantity = 0 if rng.random() < 0.1 else int(rng.paretovariate(1.2) * 20)
+        yield (name, quantity, cost, 0 if rng.random() < 0.05 else 1)
+
+
+def day_weights(days, growth):
+    # Oldest day first. Yearly growth, weekly rhythm and a December peak.
+    today = datetime.now().date()
+    weights = []
+    for back in range(days - 1, -1, -1):
+        day = today - timedelta(days=back)
+        weight = (1 + growth) ** (-back / 365) * WEEKDAY_WEIGHTS[day.weekday()]
+        if day.month == 12:
+            weight *= 1.5
+        weights.append((day, weight))
+    return weights
+
+
+def sales_rows(total, product_ids, costs, days, growth, zipf, rng):
+    # Chronological, so sale ids grow with date_sold as they do in real use
+    population = list(range(len(product_ids)))
+    rng.shuffle(population)
+    cum_popularity = list(itertools.accumulate(1 / (rank + 1) ** zipf for rank in range(len(population))))
+
+    weights = day_weights(days, growth)
+    scale = total / sum(weight for _, weight in weights)
+    carry = 0.0
+    for day, weight in weights:
+        carry += weight * scale
+        count = int(carry)
+        carry -= count
+        if not count:
+            continue
+        picks = rng.choices(population, cum_weights=cum_popularity, k=count)
+        # Opening hours 08:00-21:00, busiest around midday and early evening
+        seconds = sorted(int(min(max(rng.gauss(14.5, 3.0), 8), 20.99) * 3600) for _ in range(count))
+        date = day.isoformat()
+        for index, second in zip(picks, seconds):
+            quantity = 1 if rng.random() < 0.7 else rng.randint(2, 6)
+            price = round(costs[index] * rng.uniform(1.15, 1.9), 2)
+            yield (product_ids[index], quantity, price, quantity * costs[index],
+                   f"{date} {second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}")
+
+
+def chunked(rows, size):
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def report(label, done, total, started):
+    rate = done / max(time.perf_counter() - started, 1e-9)
+    print(f"\r{label}: {done:,}/{total:,} ({rate:,.0f}/s)", end='', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=DB_PATH, help='database file (default: %(default)s)')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--sales', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=730, help='length of the sales history')
+    parser.add_argument('--growth', type=float, default=0.3, help='yearly sales growth')
+    parser.add_argument('--zipf', type=float, default=1.0, help='product popularity skew')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--append', action='store_true',
+                        help='add to a database that already holds products')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db = Database(args.db)
+    try:
+        with db.pool.connection() as conn:
+            existing = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        if existing and not args.append:
+            print(f"{args.db} already holds {existing:,} products; pass --append to add more")
+            return 1
+
+        # Generated data needs no per-statement timing
+        db.query_stats.enabled = False
+
+        started = time.perf_counter()
+        done = 0
+        for chunk in chunked(product_rows(args.products, rng), CHUNK_SIZE):
+            db.products.add_many(chunk, notify=False)
+            done += len(chunk)
+            report("products", done, args.products, started)
+        print()
+
+        with db.pool.connection() as conn:
+            rows = conn.execute('SELECT id, cost_per_unit FROM products ORDER BY id DESC LIMIT ?',
+                                (args.products,)).fetchall()
+        product_ids = [row[0] for row in rows]
+        costs = [row[1] for row in rows]
+
+        started = time.perf_counter()
+        done = 0
+        insert = '''INSERT INTO sales (product_id, sku_id, quantity, sale_price, cost, date_sold, day)
+                    VALUES (?1, (SELECT sku_id FROM products WHERE id = ?1), ?2, ?3, ?4, ?5,
+                            CAST(julianday(?5) - 2440587.5 AS INTEGER))'''
+        # History is costed against the lot each sale names
+        allocate = '''INSERT INTO sale_allocations (sale_id, lot_id, quantity, cost_per_unit)
+                      SELECT id, product_id, quantity, cost / quantity FROM sales WHERE id > ?'''
+        if product_ids and args.sales:
+            for chunk in chunked(sales_rows(args.sales, product_ids, costs, args.days, args.growth,
+                                            args.zipf, rng), CHUNK_SIZE):
+                with db.pool.transaction() as conn:
+                    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM sales').fetchone()[0]
+                    conn.executemany(insert, chunk)
+                    conn.execute(allocate, (last_id,))
+                done += len(chunk)
+                report("sales", done, args.sales, started)
+            print()
+
+        with db.pool.connection() as conn:
+            conn.execute('ANALYZE')
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
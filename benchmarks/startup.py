@@ -0,0 +1,91 @@
+"""Cold-start benchmark.
+
+Starts the application in fresh interpreters under the offscreen Qt
+platform and reports how long importing main.py takes, how long until
+the main window first paints, and how long until the first tab has
+loaded its data. Each run uses a fresh interpreter so imports are cold.
+
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a child interpreter; prints one JSON line with its timings
+PROBE = r'''
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+
+import main
+imported = time.perf_counter()
+
+from PyQt6.QtCore import QEvent, QObject, QTimer
+from PyQt6.QtWidgets import QApplication
+
+timings = {'import_ms': (imported - started) * 1000}
+
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and 'first_paint_ms' not in timings:
+            timings['first_paint_ms'] = (time.perf_counter() - started) * 1000
+        return False
+
+
+def first_tab_ready():
+    # The first tab exists and its deferred load has had a chance to run
+    if window.tabs[0] is None:
+        QTimer.singleShot(1, first_tab_ready)
+        return
+    timings['first_tab_ms'] = (time.perf_counter() - started) * 1000
+    timings['matplotlib_loaded'] = 'matplotlib' in sys.modules
+    app.quit()
+
+
+app = QApplication([])
+window = main.MainWindow()
+paint_filter = FirstPaint()
+window.installEventFilter(paint_filter)
+window.show()
+QTimer.singleShot(0, lambda: QTimer.singleShot(0, first_tab_ready))
+app.exec()
+print(json.dumps(timings))
+'''
+
+
+def run_once(workdir):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    result = subprocess.run([sys.executable, '-c', PROBE, ROOT], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--db-dir', help='directory holding warehouse.db (default: a fresh one)')
+    args = parser.parse_args()
+
+    workdir = args.db_dir or tempfile.mkdtemp()
+    runs = [run_once(workdir) for _ in range(args.runs)]
+
+    for key, label in (('import_ms', 'import main.py'),
+                       ('first_paint_ms', 'time to first paint'),
+                       ('first_tab_ms', 'first tab loaded')):
+        values = [run[key] for run in runs if key in run]
+        if values:
+            print(f"{label + ':':22}median {statistics.median(values):8.1f} ms   "
+                  f"min {min(values):8.1f} ms")
+    eager = any(run.get('matplotlib_loaded') for run in runs)
+    print(f"{'matplotlib at start:':22}{'loaded' if eager else 'deferred'}")
+
+
+if __name__ == '__main__':
+    main()
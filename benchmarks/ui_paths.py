@@ -0,0 +1,218 @@
+"""Headless UI path benchmark.
+
+Builds the tabs under the offscreen Qt platform against an existing
+database and times the paths a user waits on: loading each tab, the
+product picker, recording a sale, the dashboard refresh and each chart
+update including its render. Results are written as JSON and can be
+compared against a stored baseline; the run fails when a path got slower
+than the baseline by more than the tolerance.
+
+    python benchmarks/generate_data.py --db bench.db
+    python benchmarks/ui_paths.py --db bench.db --output baseline.json
+    python benchmarks/ui_paths.py --db bench.db --baseline baseline.json
+
+record_sale really records sales, one per run, so use a scratch copy of
+any database you care about.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QT_VERSION_STR
+from PyQt6.QtWidgets import QApplication, QMessageBox
+
+import database
+
+# A path only counts as slower when it lost at least this much time too,
+# so sub-millisecond noise on fast paths does not fail the run
+MIN_REGRESSION_MS = 2.0
+
+
+def pump(app, until=None, timeout=60.0):
+    # Run the event loop until until() is true (or just once through)
+    deadline = time.perf_counter() + timeout
+    app.processEvents()
+    while until is not None and not until():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("timed out waiting for the UI")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+class Suite:
+    def __init__(self, app, search_text):
+        from warehouse_tab import WarehouseTab
+        from sales_tab import SalesTab
+        from dashboard_tab import DashboardTab
+
+        self.app = app
+        self.search_text = search_text
+
+        # Modal boxes would block the run
+        QMessageBox.exec = lambda box: 0
+        QMessageBox.information = staticmethod(lambda *args, **kwargs: None)
+        QMessageBox.warning = staticmethod(lambda *args, **kwargs: None)
+
+        self.warehouse = WarehouseTab()
+        self.sales = SalesTab()
+        self.dashboard = DashboardTab()
+        for tab in (self.warehouse, self.sales, self.dashboard):
+            tab.resize(1200, 800)
+            tab.show()
+
+        self.dashboard_data = None
+        self.dashboard.refresher.finished.connect(self._dashboard_loaded)
+        # Let the deferred initial loads finish before anything is timed
+        pump(app, lambda: self.dashboard_data is not None)
+
+        self.sales.product_search.setText(search_text)
+        self.sales.search_products()
+        if self.sales.search_model.rowCount():
+            self.sales.select_product(self.sales.search_model.index(0))
+
+    def _dashboard_loaded(self, data):
+        self.dashboard_data = data
+
+    def paths(self):
+        return [
+            ('warehouse.load_data', self.warehouse.load_data),
+            ('sales.load_data', self.sales.load_data),
+            ('sales.search_products', self.sales.search_products),
+            ('sales.update_product_list', self.sales.update_product_list),
+            ('sales.record_sale', self.record_sale),
+            ('dashboard.fetch_data', self.dashboard.fetch_data),
+            ('dashboard.load_data', self.dashboard_load),
+            ('dashboard.profit_chart', self.profit_chart),
+            ('dashboard.all_time_chart', self.all_time_chart),
+            ('dashboard.products_chart', self.products_chart),
+        ]
+
+    def record_sale(self):
+        # Includes the change-bus refresh of every subscribed view
+        self.sales.quantity_input.setValue(1)
+        self.sales.price_input.setValue(1.0)
+        self.sales.record_sale()
+        pump(self.app)
+
+    def dashboard_load(self):
+        # Query on the worker thread, then cards and charts on this one
+        self.dashboard_data = None
+        self.dashboard.load_data()
+        pump(self.app, lambda: self.dashboard_data is not None)
+        self.dashboard.profit_canvas.draw()
+        self.dashboard.products_canvas.draw()
+
+    def profit_chart(self):
+        self.dashboard.update_profit_chart(self.dashboard_data.profit_series)
+        self.dashboard.profit_canvas.draw()
+
+    def all_time_chart(self):
+        # Every day of the history from the day index, downsampled for the redraw
+        self.dashboard.update_profit_chart(self.dashboard.fetch_profit_series(None, None))
+        self.dashboard.profit_canvas.draw()
+
+    def products_chart(self):
+        self.dashboard.update_products_chart(self.dashboard_data.top_products)
+        self.dashboard.products_canvas.draw()
+
+
+def time_path(fn, repeat, warmup):
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': statistics.median(runs), 'min_ms': min(runs), 'max_ms': max(runs),
+            'runs': runs}
+
+
+def describe(path):
+    with sqlite3.connect(path) as conn:
+        products = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        sales = conn.execute('SELECT COUNT(*) FROM sales').fetchone()[0]
+    return {'products': products, 'sales': sales}
+
+
+def compare(results, baseline, tolerance):
+    # Prints a side-by-side table; returns the names of regressed paths
+    regressions = []
+    print(f"{'path':28}{'baseline':>12}{'now':>12}{'change':>10}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:28}{'-':>12}{result['median_ms']:10.2f}ms{'new':>10}")
+            continue
+        old, new = before['median_ms'], result['median_ms']
+        change = (new - old) / old if old else 0.0
+        regressed = change > tolerance and new - old >= MIN_REGRESSION_MS
+        if regressed:
+            regressions.append(name)
+        print(f"{name:28}{old:10.2f}ms{new:10.2f}ms{change:+9.0%}{'  SLOWER' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='database to benchmark against')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--search', default='cho', help='text typed into the product picker')
+    parser.add_argument('--only', nargs='*', help='run just these paths')
+    parser.add_argument('--skip', nargs='*', default=[], help='leave these paths out')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against results from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown against the baseline (default: %(default)s = 20%%)')
+    args = parser.parse_args()
+
+    database.DB_PATH = args.db
+    app = QApplication([])
+    suite = Suite(app, args.search)
+
+    results = {}
+    for name, fn in suite.paths():
+        if name in args.skip or (args.only and name not in args.only):
+            continue
+        results[name] = time_path(fn, args.repeat, args.warmup)
+        print(f"{name:28}median {results[name]['median_ms']:9.2f} ms   "
+              f"min {results[name]['min_ms']:9.2f} ms", flush=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'database': describe(args.db),
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'qt': QT_VERSION_STR,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} path(s) slower than the baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+import csv
+import gc
+import io
+import operator
+import os
+import threading
+from collections import namedtuple
+from operator import itemgetter
+from queue import Queue, Empty
+
+# Rows per transaction. Large enough that commits and the per-SKU stock
+# update are paid rarely, small enough that other terminals are never
+# locked out for long (about 0.3 s a chunk).
+CHUNK_SIZE = 50000
+
+# Parsed chunks allowed to wait for the writer before the reader pauses
+READ_AHEAD = 2
+
+# Only the first few rejected lines are kept for the report
+MAX_ERRORS = 100
+
+# Lines validated together, a column at a time; a block with a bad line
+# in it is checked again line by line to find it
+PARSE_BLOCK = 500
+
+COLUMNS = ('name', 'quantity', 'cost_per_unit', 'has_arrived')
+REQUIRED_COLUMNS = {'name', 'quantity', 'cost_per_unit'}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'arrived'}
+FALSE_VALUES = {'', '0', 'false', 'no', 'n', 'pending'}
+ARRIVED_VALUES = {**dict.fromkeys(TRUE_VALUES, 1), **dict.fromkeys(FALSE_VALUES, 0)}
+
+ImportResult = namedtuple('ImportResult', 'inserted rejected errors')
+ImportProgress = namedtuple('ImportProgress', 'rows fraction')
+
+
+class ManifestError(Exception):
+    pass
+
+
+def parse_row(name, quantity, cost_per_unit, has_arrived):
+    # Turns one manifest line into an INSERT tuple, raising ValueError
+    # with a readable message when a field is missing or out of range
+    raw_quantity, raw_cost, raw_arrived = quantity, cost_per_unit, has_arrived
+
+    name = (name or '').strip()
+    if not name:
+        raise ValueError("missing product name")
+
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"invalid quantity {raw_quantity!r}")
+    # int() would quietly drop the fraction of a Parquet float or decimal
+    if not isinstance(raw_quantity, str) and quantity != raw_quantity:
+        raise ValueError(f"quantity must be a whole number, got {raw_quantity!r}")
+    if quantity < 1:
+        raise ValueError(f"quantity must be at least 1, got {quantity}")
+
+    try:
+        cost_per_unit = float(cost_per_unit)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid cost_per_unit {raw_cost!r}")
+    if not cost_per_unit > 0:
+        raise ValueError(f"cost_per_unit must be positive, got {cost_per_unit}")
+
+    if has_arrived is None or isinstance(has_arrived, (bool, int)):
+        has_arrived = 1 if has_arrived else 0
+    else:
+        has_arrived = str(has_arrived).strip().lower()
+        if has_arrived in TRUE_VALUES:
+            has_arrived = 1
+        elif has_arrived in FALSE_VALUES:
+            has_arrived = 0
+        else:
+            raise ValueError(f"invalid has_arrived {raw_arrived!r}")
+
+    return (name, quantity, cost_per_unit, has_arrived)
+
+
+def parse_columns(chunk):
+    # parse_row over a block of lines, a column at a time. Raises on the
+    # first bad line without saying which; parse_chunk then finds it.
+    _, names, quantities, costs, arrived = zip(*chunk)
+    names = [name.strip() for name in names]
+    if not all(names):
+        raise ValueError
+
+    whole = list(map(int, quantities))
+    if not isinstance(quantities[0], str) and any(map(operator.ne, whole, quantities)):
+        raise ValueError
+    if not all(map((0).__lt__, whole)):
+        raise ValueError
+
+    costs = list(map(float, costs))
+    # Also false for NaN, as in parse_row
+    if not all(map((0.0).__lt__, costs)):
+        raise ValueError
+
+    if isinstance(arrived[0], str):
+        arrived = [ARRIVED_VALUES[value.strip().lower()] for value in arrived]
+    elif all(value is None or isinstance(value, int) for value in arrived):
+        arrived = [1 if value else 0 for value in arrived]
+    else:
+        raise ValueError
+
+    return list(zip(names, whole, costs, arrived))
+
+
+def parse_chunk(chunk):
+    # (rows, errors) for a chunk of (line number, *fields)
+    rows, errors = [], []
+    for start in range(0, len(chunk), PARSE_BLOCK):
+        block = chunk[start:start + PARSE_BLOCK]
+        try:
+            rows.extend(parse_columns(block))
+            continue
+        except (AttributeError, KeyError, OverflowError, TypeError, ValueError):
+            pass
+        for line, *fields in block:
+            try:
+                rows.append(parse_row(*fields))
+            except ValueError as e:
+                errors.append((line, str(e)))
+    return rows, errors
+
+
+def check_columns(columns):
+    missing = REQUIRED_COLUMNS - set(columns)
+    if missing:
+        raise ManifestError(f"Manifest is missing columns: {', '.join(sorted(missing))}")
+
+
+def read_csv(path, chunk_size):
+    # Yields (chunk, fraction of the file read) with chunk a list of
+    # (line number, name, quantity, cost_per_unit, has_arrived)
+    total = os.path.getsize(path) or 1
+    with open(path, 'rb') as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [column.strip().lower() for column in header]
+        check_columns(header)
+        indexes = [header.index(column) if column in header else None for column in COLUMNS]
+        width = max(index for index in indexes if index is not None) + 1
+        # Short lines are padded past the last column, and an optional
+        # column the manifest leaves out reads that padding: an empty field
+        pick = itemgetter(*(width if index is None else index for index in indexes))
+
+        chunk = []
+        for line in reader:
+            if len(line) <= width:
+                line += [''] * (width + 1 - len(line))
+            chunk.append((reader.line_num, *pick(line)))
+            if len(chunk) >= chunk_size:
+                yield chunk, min(raw.tell() / total, 1.0)
+                chunk = []
+        if chunk:
+            yield chunk, 1.0
+
+
+def read_parquet(path, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ManifestError("Reading Parquet manifests requires pyarrow (pip install pyarrow)")
+
+    manifest = pq.ParquetFile(path)
+    names = manifest.schema_arrow.names
+    check_columns(names)
+
+    total = manifest.metadata.num_rows or 1
+    done = 0
+    present = [column for column in COLUMNS if column in names]
+    for batch in manifest.iter_batches(batch_size=chunk_size, columns=present):
+        count = batch.num_rows
+        values = [batch.column(present.index(column)).to_pylist() if column in present
+                  else [None] * count for column in COLUMNS]
+        yield list(zip(range(done + 1, done + count + 1), *values)), (done + count) / total
+        done += count
+
+
+READERS = {
+    '.csv': read_csv,
+    '.parquet': read_parquet,
+    '.pq': read_parquet,
+}
+
+
+def parse_chunks(reader, path, chunk_size, chunks, stop):
+    # Runs on a helper thread so reading and validating the next chunk
+    # overlaps with SQLite writing the previous one
+    try:
+        for chunk, fraction in reader(path, chunk_size):
+            if stop.is_set():
+                return
+            rows, errors = parse_chunk(chunk)
+            chunks.put((rows, errors, fraction))
+        chunks.put(None)
+    except (UnicodeDecodeError, csv.Error) as e:
+        chunks.put(ManifestError(f"Could not read manifest: {e}"))
+    except Exception as e:
+        chunks.put(e)
+
+
+def import_manifest(db, path, chunk_size=CHUNK_SIZE, progress=None):
+    # Streams a CSV or Parquet receiving manifest into the products table,
+    # one transaction per chunk. Invalid lines are skipped and reported.
+    # Listeners hear about the new products once, at the end.
+    reader = READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ManifestError(f"Unsupported manifest type: {os.path.basename(path)}")
+
+    # Each line turns into a few tuples that live until its chunk is
+    # written. The cyclic collector would go over every one of them again
+    # and again, for cycles a manifest never makes.
+    collecting = gc.isenabled()
+    gc.disable()
+
+    chunks = Queue(maxsize=READ_AHEAD)
+    stop = threading.Event()
+    parser = threading.Thread(target=parse_chunks, args=(reader, path, chunk_size, chunks, stop),
+                              daemon=True)
+    parser.start()
+
+    inserted = rejected = 0
+    errors = []
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            rows, chunk_errors, fraction = item
+            rejected += len(chunk_errors)
+            errors.extend(chunk_errors[:MAX_ERRORS - len(errors)])
+            if rows:
+                db.products.add_many(rows, notify=False)
+                inserted += len(rows)
+            if progress is not None:
+                progress(ImportProgress(inserted + rejected, fraction))
+    finally:
+        # Unblock the parser if we stopped early, then let it wind down
+        stop.set()
+        while parser.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except Empty:
+                pass
+        if collecting:
+            gc.enable()
+        if inserted:
+            db.notify('products')
+
+    return ImportResult(inserted, rejected, errors)
@@ -0,0 +1,86 @@
+from collections import defaultdict
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+
+from database import get_database
+
+
+class ChangeBus(QObject):
+    # Tells subscribed tabs when a table they show has changed. Writes made
+    # in this process are announced as soon as they commit; writes from
+    # other processes are picked up by polling PRAGMA data_version, which
+    # only moves when another connection commits to the database file.
+    changed = pyqtSignal(tuple)
+
+    POLL_INTERVAL = 1000
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._subscribers = defaultdict(list)
+        self._versions = db.table_versions()
+
+        # Listeners fire on the writing thread; the signal hops to ours
+        self.changed.connect(self._dispatch)
+        db.add_listener(self.changed.emit)
+
+        # The inventory service announces every terminal's commits itself
+        if db.remote:
+            return
+
+        # A dedicated connection: data_version is tracked per connection
+        self._watch_conn = db.pool.connect()
+        self._data_version = self._read_data_version()
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.poll)
+        self._timer.start(self.POLL_INTERVAL)
+
+    def subscribe(self, tables, callback):
+        for table in tables:
+            self._subscribers[table].append(callback)
+
+    def _read_data_version(self):
+        return self._watch_conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def poll(self):
+        data_version = self._read_data_version()
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+
+        # Something was committed elsewhere; find out which tables moved
+        versions = self.db.table_versions()
+        tables = tuple(table for table, version in versions.items()
+                       if self._versions.get(table) != version)
+        self._versions = versions
+        if tables:
+            self._notify(tables)
+
+    @pyqtSlot(tuple)
+    def _dispatch(self, tables):
+        # Our own write: remember the new versions so the poll that sees
+        # the same commit does not announce it a second time
+        self._versions = self.db.table_versions()
+        self._notify(tables)
+
+    def _notify(self, tables):
+        # Each subscriber runs once, however many of its tables changed
+        callbacks = []
+        for table in tables:
+            for callback in self._subscribers[table]:
+                if callback not in callbacks:
+                    callbacks.append(callback)
+        for callback in callbacks:
+            callback()
+
+
+_change_bus = None
+
+
+def get_change_bus():
+    # Created lazily on the UI thread and shared by every tab
+    global _change_bus
+    if _change_bus is None:
+        _change_bus = ChangeBus(get_database())
+    return _change_bus
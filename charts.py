@@ -0,0 +1,187 @@
+from datetime import datetime
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
+
+
+# Charts build their Figure directly instead of going through pyplot, so
+# nothing is registered in pyplot's global figure manager, and each chart
+# keeps its artists for its whole lifetime. An update only moves data
+# into the existing artists and schedules a repaint with draw_idle.
+
+# Matplotlib's date number of 1970-01-01, where day numbers start
+EPOCH_NUM = mdates.date2num(datetime(1970, 1, 1))
+
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: indices of at most threshold points
+    # of (x, y) that keep the shape of the line. The first and last points
+    # stay; from each bucket in between it keeps the point spanning the
+    # largest triangle with the point kept before it and the average of
+    # the next bucket.
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        following = slice(hi, edges[bucket + 2]) if bucket + 2 < len(edges) else slice(count - 1, count)
+        next_x, next_y = x[following].mean(), y[following].mean()
+        area = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous]) -
+                      (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+class Chart(FigureCanvas):
+    def __init__(self, title, xlabel, ylabel, parent=None):
+        figure = Figure(figsize=(6, 4))
+        super().__init__(figure)
+        self.setParent(parent)
+
+        self.ax = figure.add_subplot(111)
+        self.ax.set_title(title)
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+        self.ax.tick_params(axis='x', labelrotation=45)
+
+        # Fixed margins instead of tight_layout on every redraw
+        figure.subplots_adjust(left=0.15, right=0.95, top=0.9, bottom=0.3)
+
+    def rescale(self):
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+        self.draw_idle()
+
+
+class LineChart(Chart):
+    # Holds the whole series, however long, and hands the line only the
+    # part in view, reduced to at most MAX_POINTS with LTTB, so a redraw
+    # costs the same for a week as for ten years. The wheel zooms around
+    # the cursor, dragging pans, and a double click shows everything.
+    MAX_POINTS = 500
+    # Markers only while the points are far enough apart to see them
+    MARKER_POINTS = 60
+    ZOOM_STEP = 1.25
+    # Narrowest view, in days
+    MIN_SPAN = 2
+
+    def __init__(self, title, xlabel, ylabel, parent=None):
+        super().__init__(title, xlabel, ylabel, parent)
+        self.line, = self.ax.plot([], [], marker='o')
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+        # True once the user zoomed or panned; new data then keeps the view
+        self.zoomed = False
+        self._drag = None
+
+        locator = mdates.AutoDateLocator()
+        self.ax.xaxis.set_major_locator(locator)
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+
+        self.mpl_connect('scroll_event', self.on_scroll)
+        self.mpl_connect('button_press_event', self.on_press)
+        self.mpl_connect('motion_notify_event', self.on_motion)
+        self.mpl_connect('button_release_event', self.on_release)
+
+    def set_series(self, dates, values):
+        # dates are 'YYYY-MM-DD' strings as returned by SQLite date()
+        x = [mdates.date2num(datetime.strptime(date, '%Y-%m-%d')) for date in dates]
+        self.set_points(x, values)
+
+    def set_days(self, days, values):
+        # days count from 1970-01-01, like sales.day
+        self.set_points(np.asarray(days, dtype=np.float64) + EPOCH_NUM, values)
+
+    def set_points(self, x, y):
+        # x must be ascending
+        self._x = np.asarray(x, dtype=np.float64)
+        self._y = np.asarray(y, dtype=np.float64)
+        if self.zoomed:
+            self.show_range(*self.ax.get_xlim())
+        else:
+            self.show_all()
+
+    def show_all(self):
+        self.zoomed = False
+        if not len(self._x):
+            self.line.set_data([], [])
+            self.draw_idle()
+            return
+        lo, hi = self._x[0], self._x[-1]
+        if hi - lo < self.MIN_SPAN:
+            lo, hi = lo - self.MIN_SPAN / 2, hi + self.MIN_SPAN / 2
+        self.show_range(lo, hi)
+
+    def show_range(self, lo, hi):
+        # One point either side of the view too, so the line runs off the edges
+        first = max(int(np.searchsorted(self._x, lo)) - 1, 0)
+        last = min(int(np.searchsorted(self._x, hi, 'right')) + 1, len(self._x))
+        x, y = self._x[first:last], self._y[first:last]
+        kept = lttb(x, y, self.MAX_POINTS)
+        self.line.set_data(x[kept], y[kept])
+        self.line.set_marker('o' if len(kept) <= self.MARKER_POINTS else '')
+        self.ax.set_xlim(lo, hi)
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=False)
+        self.draw_idle()
+
+    def on_scroll(self, event):
+        if event.inaxes is not self.ax or not len(self._x):
+            return
+        lo, hi = self.ax.get_xlim()
+        scale = 1 / self.ZOOM_STEP if event.button == 'up' else self.ZOOM_STEP
+        # The day under the cursor stays put
+        lo = event.xdata - (event.xdata - lo) * scale
+        hi = event.xdata + (hi - event.xdata) * scale
+        if hi - lo < self.MIN_SPAN:
+            return
+        self.zoomed = True
+        self.show_range(lo, hi)
+
+    def on_press(self, event):
+        if event.inaxes is not self.ax or event.button != 1:
+            return
+        if event.dblclick:
+            self.show_all()
+            return
+        # In pixels: data coordinates move under the cursor while panning
+        self._drag = (event.x, self.ax.get_xlim())
+
+    def on_motion(self, event):
+        if self._drag is None or event.x is None:
+            return
+        start, (lo, hi) = self._drag
+        shift = (event.x - start) * (hi - lo) / self.ax.bbox.width
+        self.zoomed = True
+        self.show_range(lo - shift, hi - shift)
+
+    def on_release(self, event):
+        self._drag = None
+
+
+class BarChart(Chart):
+    def __init__(self, title, xlabel, ylabel, bars=5, parent=None):
+        super().__init__(title, xlabel, ylabel, parent)
+        positions = range(bars)
+        self.bars = self.ax.bar(positions, [0] * bars)
+        self.ax.set_xticks(positions)
+        self.ax.axhline(0, color='#999', linewidth=0.8)
+
+    def set_values(self, labels, values):
+        # Unused slots are hidden rather than removed so the artists survive
+        for i, bar in enumerate(self.bars):
+            if i < len(values):
+                bar.set_height(values[i])
+                bar.set_visible(True)
+            else:
+                bar.set_height(0)
+                bar.set_visible(False)
+        labels = list(labels) + [''] * (len(self.bars) - len(labels))
+        self.ax.set_xticklabels(labels)
+        self.rescale()
@@ -1,22 +1,67 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-                           QLabel, QFrame)
-from PyQt6.QtCore import Qt, QTimer
-from PyQt6.QtGui import QFont
-import sqlite3
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from datetime import datetime, timedelta
+                           QLabel, QFrame, QComboBox, QDateEdit)
+from PyQt6.QtCore import QTimer, QDate
+from collections import namedtuple
+from database import get_database, today
+from analytics import SalesAnalytics
+from workers import CoalescingRunner
+from charts import LineChart, BarChart
+from change_bus import get_change_bus
+
+DashboardData = namedtuple('DashboardData', 'totals profit_series top_products weekly_profit sale_sizes')
+
+# Profit chart ranges: label -> days back from today, None for all time,
+# 'custom' for the date pickers
+RANGES = [
+    ("Last 7 days", 7),
+    ("Last 30 days", 30),
+    ("Last year", 365),
+    ("All time", None),
+    ("Custom", 'custom'),
+]
+DEFAULT_RANGE = 1
+
+# Top products windows, ranked as sales arrive (see leaderboard)
+TOP_WINDOWS = [
+    ("All time", 'all'),
+    ("This month", 'month'),
+    ("This week", 'week'),
+    ("Today", 'today'),
+]
+
+# Day numbers count from here, like sales.day
+EPOCH_QDATE = QDate(1970, 1, 1)
+
+# Days in the trailing average profit card
+PROFIT_WINDOW = 7
+
+# Percentiles of the revenue of single sales shown in the cards
+SALE_PERCENTILES = (50, 90)
 
 class DashboardTab(QWidget):
     def __init__(self):
         super().__init__()
+        self.db = get_database()
+        # Columnar copy of the sales history, topped up on each refresh
+        self.analytics = SalesAnalytics(self.db)
+        
+        # Queries run on a pool thread; results are applied on the UI thread
+        self.refresher = CoalescingRunner(self.fetch_data, parent=self)
+        self.refresher.finished.connect(self.show_data)
+        
+        # What the profit chart shows, as set by the range controls; read
+        # by fetch_data on the worker thread, so never a widget
+        self.series_range = RANGES[DEFAULT_RANGE][1]
+        self.top_window = TOP_WINDOWS[0][1]
+        
         self.init_ui()
-        self.load_data()
+        self.stale = False
+        
+        # Load after the tab has been painted once
+        QTimer.singleShot(0, self.load_data)
         
-        # Set up auto-refresh timer
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.load_data)
-        self.timer.start(30000)  # Refresh every 30 seconds
+        # Refresh when sales or product costs change instead of polling
+        get_change_bus().subscribe(['sales', 'products'], self.on_data_changed)
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -47,15 +92,57 @@ class DashboardTab(QWidget):
         
         layout.addLayout(stats_layout)
         
+        # Cards computed from the analytics snapshot, archive included
+        snapshot_layout = QHBoxLayout()
+        
+        self.weekly_profit_card = self.create_stat_card(f"Average Daily Profit ({PROFIT_WINDOW} days)", "$0.00")
+        snapshot_layout.addWidget(self.weekly_profit_card)
+        
+        self.median_sale_card = self.create_stat_card("Median Sale", "$0.00")
+        snapshot_layout.addWidget(self.median_sale_card)
+        
+        self.large_sale_card = self.create_stat_card("90th Percentile Sale", "$0.00")
+        snapshot_layout.addWidget(self.large_sale_card)
+        
+        layout.addLayout(snapshot_layout)
+        
+        # Profit chart range; the chart itself zooms and pans within it
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(QLabel("Profit range:"))
+        self.range_box = QComboBox()
+        for label, days in RANGES:
+            self.range_box.addItem(label, days)
+        self.range_box.setCurrentIndex(DEFAULT_RANGE)
+        self.range_box.currentIndexChanged.connect(lambda index: self.change_range())
+        range_layout.addWidget(self.range_box)
+        self.start_edit = QDateEdit(QDate.currentDate().addMonths(-3))
+        self.end_edit = QDateEdit(QDate.currentDate())
+        for edit in (self.start_edit, self.end_edit):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat('yyyy-MM-dd')
+            edit.setVisible(False)
+            edit.dateChanged.connect(lambda date: self.change_range())
+            range_layout.addWidget(edit)
+        range_layout.addStretch()
+        range_layout.addWidget(QLabel("Top products:"))
+        self.window_box = QComboBox()
+        for label, window in TOP_WINDOWS:
+            self.window_box.addItem(label, window)
+        self.window_box.currentIndexChanged.connect(lambda index: self.change_window())
+        range_layout.addWidget(self.window_box)
+        layout.addLayout(range_layout)
+        
         # Charts
         charts_layout = QHBoxLayout()
         
         # Profit over time chart
-        self.profit_chart = self.create_chart("Profit Over Time")
+        self.profit_canvas = LineChart('Daily Profit', 'Date', 'Profit ($)')
+        self.profit_chart = self.create_chart("Profit Over Time", self.profit_canvas)
         charts_layout.addWidget(self.profit_chart)
         
         # Top products chart
-        self.products_chart = self.create_chart("Top Products by Profit")
+        self.products_canvas = BarChart('Top Products by Profit', 'Product', 'Profit ($)', bars=5)
+        self.products_chart = self.create_chart("Top Products by Profit", self.products_canvas)
         charts_layout.addWidget(self.products_chart)
         
         layout.addLayout(charts_layout)
@@ -87,7 +174,7 @@ class DashboardTab(QWidget):
         
         return card
 
-    def create_chart(self, title):
+    def create_chart(self, title, canvas):
         chart = QFrame()
         chart.setStyleSheet("""
             QFrame {
@@ -103,31 +190,77 @@ class DashboardTab(QWidget):
         title_label.setStyleSheet("color: #333; font-size: 16px; font-weight: bold;")
         layout.addWidget(title_label)
         
-        # Create matplotlib figure
-        fig, ax = plt.subplots(figsize=(6, 4))
-        canvas = FigureCanvas(fig)
+        # The chart canvas owns its figure and artists for the tab's lifetime
         layout.addWidget(canvas)
         
         return chart
 
+    def change_range(self):
+        days = self.range_box.currentData()
+        custom = days == 'custom'
+        self.start_edit.setVisible(custom)
+        self.end_edit.setVisible(custom)
+        if custom:
+            days = ('custom', EPOCH_QDATE.daysTo(self.start_edit.date()),
+                    EPOCH_QDATE.daysTo(self.end_edit.date()))
+        self.series_range = days
+        # A new range starts from the whole of it, not the old zoom
+        self.profit_canvas.zoomed = False
+        self.load_data()
+
+    def change_window(self):
+        self.top_window = self.window_box.currentData()
+        self.load_data()
+
+    def profit_days(self):
+        # (start, end) day numbers for the chart; None runs from the first
+        # sale or to the last one
+        days = self.series_range
+        if days is None:
+            return None, None
+        if isinstance(days, tuple):
+            return days[1], days[2]
+        end = today()
+        return end - days, end
+
+    def on_data_changed(self):
+        # Nobody is looking at a hidden dashboard; catch up when it is shown
+        if self.isVisible():
+            self.load_data()
+        else:
+            self.stale = True
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.stale:
+            self.stale = False
+            self.load_data()
+
     def load_data(self):
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        
-        # Calculate total revenue
-        c.execute('''
-            SELECT SUM(quantity * sale_price)
-            FROM sales
-        ''')
-        total_revenue = c.fetchone()[0] or 0
-        
-        # Calculate total cost
-        c.execute('''
-            SELECT SUM(s.quantity * p.cost_per_unit)
-            FROM sales s
-            JOIN products p ON s.product_id = p.id
-        ''')
-        total_cost = c.fetchone()[0] or 0
+        # Overlapping requests are coalesced into at most one queued refresh
+        self.refresher.request()
+
+    def fetch_data(self):
+        # Runs off the UI thread; must not touch any widgets. Reads only the
+        # sales recorded since the last refresh, then every metric comes
+        # from the same in-memory snapshot. The headline totals come from
+        # the running summary, which also counts archived sales.
+        self.analytics.refresh()
+        return DashboardData(totals=self.db.stats.totals(),
+                             profit_series=self.fetch_profit_series(*self.profit_days()),
+                             top_products=self.analytics.leaderboard(self.top_window, limit=5),
+                             weekly_profit=self.analytics.rolling_profit(days=1, window=PROFIT_WINDOW)[-1][1],
+                             sale_sizes=self.analytics.percentiles('revenue', SALE_PERCENTILES))
+
+    def fetch_profit_series(self, start, end):
+        # (days, profits) for the days with sales in the range, grouped by
+        # SQLite on the stored day bucket (see StatsRepository.day_profit)
+        rows = self.db.stats.day_profit(start, end)
+        return [row.day for row in rows], [row.revenue - row.cost for row in rows]
+
+    def show_data(self, data):
+        # Calculate total revenue and total cost
+        total_revenue, total_cost = data.totals
         
         # Calculate total profit
         total_profit = total_revenue - total_cost
@@ -148,82 +281,30 @@ class DashboardTab(QWidget):
         labels = self.margin_card.findChildren(QLabel)
         labels[1].setText(f"{profit_margin:.1f}%")
         
+        labels = self.weekly_profit_card.findChildren(QLabel)
+        labels[1].setText(f"${data.weekly_profit:,.2f}")
+        
+        median, large = (data.sale_sizes[pct] for pct in SALE_PERCENTILES)
+        labels = self.median_sale_card.findChildren(QLabel)
+        labels[1].setText(f"${median:,.2f}")
+        
+        labels = self.large_sale_card.findChildren(QLabel)
+        labels[1].setText(f"${large:,.2f}")
+        
         # Update profit over time chart
-        self.update_profit_chart()
+        self.update_profit_chart(data.profit_series)
         
         # Update top products chart
-        self.update_products_chart()
-        
-        conn.close()
-
-    def update_profit_chart(self):
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        
-        # Get last 30 days of sales
-        c.execute('''
-            SELECT date(s.date_sold) as date,
-                   SUM(s.quantity * s.sale_price) as revenue,
-                   SUM(s.quantity * p.cost_per_unit) as cost
-            FROM sales s
-            JOIN products p ON s.product_id = p.id
-            WHERE s.date_sold >= date('now', '-30 days')
-            GROUP BY date(s.date_sold)
-            ORDER BY date
-        ''')
-        data = c.fetchall()
-        
-        if data:
-            dates = [row[0] for row in data]
-            profits = [row[1] - row[2] for row in data]
-            
-            # Clear previous plot
-            self.profit_chart.findChild(FigureCanvas).figure.clear()
-            ax = self.profit_chart.findChild(FigureCanvas).figure.add_subplot(111)
-            
-            # Plot new data
-            ax.plot(dates, profits, marker='o')
-            ax.set_title('Daily Profit')
-            ax.set_xlabel('Date')
-            ax.set_ylabel('Profit ($)')
-            plt.xticks(rotation=45)
-            self.profit_chart.findChild(FigureCanvas).figure.tight_layout()
-            self.profit_chart.findChild(FigureCanvas).draw()
-        
-        conn.close()
-
-    def update_products_chart(self):
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        
-        # Get top 5 products by profit
-        c.execute('''
-            SELECT p.name,
-                   SUM(s.quantity * s.sale_price) as revenue,
-                   SUM(s.quantity * p.cost_per_unit) as cost
-            FROM sales s
-            JOIN products p ON s.product_id = p.id
-            GROUP BY p.id
-            ORDER BY (revenue - cost) DESC
-            LIMIT 5
-        ''')
-        data = c.fetchall()
-        
-        if data:
-            products = [row[0] for row in data]
-            profits = [row[1] - row[2] for row in data]
-            
-            # Clear previous plot
-            self.products_chart.findChild(FigureCanvas).figure.clear()
-            ax = self.products_chart.findChild(FigureCanvas).figure.add_subplot(111)
-            
-            # Plot new data
-            ax.bar(products, profits)
-            ax.set_title('Top Products by Profit')
-            ax.set_xlabel('Product')
-            ax.set_ylabel('Profit ($)')
-            plt.xticks(rotation=45)
-            self.products_chart.findChild(FigureCanvas).figure.tight_layout()
-            self.products_chart.findChild(FigureCanvas).draw()
-        
-        conn.close() 
\ No newline at end of file
+        self.update_products_chart(data.top_products)
+
+    def update_profit_chart(self, series):
+        # (days, profits) for the days with sales in the selected range;
+        # the chart downsamples long ranges itself
+        days, profits = series
+        self.profit_canvas.set_days(days, profits)
+
+    def update_products_chart(self, data):
+        # data holds the top 5 products by profit
+        products = [row.name for row in data]
+        profits = [row.revenue - row.cost for row in data]
+        self.products_canvas.set_values(products, profits)
@@ -0,0 +1,769 @@
+import heapq
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from itertools import chain
+from datetime import date, timedelta
+from operator import itemgetter
+from contextlib import contextmanager
+from queue import Queue, Empty, Full
+
+import migrations
+from query_stats import QueryStats, InstrumentedConnection, add_plumbing
+
+DB_PATH = 'warehouse.db'
+
+# Connection tuning applied to every pooled connection
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 268435456',
+)
+
+# Seconds sqlite waits on a locked database before raising
+BUSY_TIMEOUT = 5.0
+
+# Extra attempts at taking the write lock once the busy timeout has expired
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+# Compiled statements kept per connection, keyed by SQL text
+STATEMENT_CACHE_SIZE = 256
+
+# Lots written by each multi-row INSERT of a bulk add. Every statement
+# run also rewrites the products row of sqlite_sequence, so one per lot
+# costs about as much as the lot itself.
+LOTS_PER_INSERT = 200
+
+# host:port of an inventory service to use instead of opening DB_PATH, or
+# 'local' to start a stand-in service inside this process
+SERVICE_ENV = 'WMS_SERVICE'
+
+# Query call sites are reported as the code calling into this module
+add_plumbing(__file__)
+
+
+class InsufficientStockError(Exception):
+    def __init__(self, sku_id, requested, available):
+        super().__init__(f"Not enough stock available. Current stock: {available}")
+        self.sku_id = sku_id
+        self.requested = requested
+        self.available = available
+
+
+def is_busy_error(error):
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+
+def prefix_query(text):
+    # FTS5 query matching names with a word starting with each typed word:
+    # 'coca co' becomes '"coca"* "co"*'. Quoting keeps punctuation and FTS
+    # keywords in the search text from being read as query syntax.
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+Product = namedtuple('Product', 'id name quantity cost_per_unit has_arrived date_added')
+ProductVersion = namedtuple('ProductVersion', 'seq last_id')
+ProductChanges = namedtuple('ProductChanges', 'version products removed_ids')
+Sku = namedtuple('Sku', 'id name quantity incoming stock_value last_received')
+SkuChanges = namedtuple('SkuChanges', 'version skus')
+# cost_per_unit of an SKU on offer is the average over its lots on hand
+AvailableSku = namedtuple('AvailableSku', 'id name quantity cost_per_unit')
+SaleRow = namedtuple('SaleRow', 'id product_name quantity sale_price cost_per_unit')
+Totals = namedtuple('Totals', 'revenue cost')
+SummaryCheck = namedtuple('SummaryCheck', 'stored recomputed consistent')
+DailyProfit = namedtuple('DailyProfit', 'date revenue cost')
+DayProfit = namedtuple('DayProfit', 'day revenue cost')
+ProductProfit = namedtuple('ProductProfit', 'name revenue cost')
+
+# sales.day counts days from here, in UTC like date_sold
+EPOCH = date(1970, 1, 1)
+
+
+def today():
+    return int(time.time() // 86400)
+
+
+def day_label(day):
+    return (EPOCH + timedelta(days=int(day))).isoformat()
+
+
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=4, query_stats=None):
+        self.path = path
+        self.size = size
+        self.query_stats = query_stats
+        self._idle = Queue(maxsize=size)
+        self._lock = threading.Lock()
+        self._closed = False
+        # Seconds spent acquiring the write lock, most recent transactions
+        # last, and how many have ever been recorded
+        self.lock_waits = deque(maxlen=10000)
+        self.lock_wait_count = 0
+
+    def connect(self):
+        # Autocommit mode: transactions are opened explicitly by transaction()
+        conn = sqlite3.connect(self.path,
+                               timeout=BUSY_TIMEOUT,
+                               isolation_level=None,
+                               check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE,
+                               factory=InstrumentedConnection if self.query_stats else sqlite3.Connection)
+        if self.query_stats:
+            conn.query_stats = self.query_stats
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            return self.connect()
+
+    def release(self, conn):
+        if self._closed or conn.in_transaction:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def _begin(self, conn, mode):
+        started = time.perf_counter()
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                conn.execute(f'BEGIN {mode}')
+                break
+            except sqlite3.OperationalError as error:
+                if not is_busy_error(error) or attempt == BUSY_RETRIES:
+                    raise
+                # Jittered exponential backoff so competing terminals spread out
+                time.sleep(BUSY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+        if mode != 'DEFERRED':
+            self.lock_waits.append(time.perf_counter() - started)
+            self.lock_wait_count += 1
+
+    def lock_waits_since(self, count):
+        # The waits recorded after lock_wait_count was count, as far as
+        # lock_waits still reaches back
+        return list(self.lock_waits)[-(self.lock_wait_count - count):] if self.lock_wait_count > count else []
+
+    @contextmanager
+    def transaction(self, mode='IMMEDIATE'):
+        # IMMEDIATE takes the write lock up front, so a read-then-write
+        # sequence inside the transaction cannot be interleaved with
+        # another writer and never fails on lock upgrade. Read-only
+        # snapshots pass mode='DEFERRED'.
+        with self.connection() as conn:
+            self._begin(conn, mode)
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except Empty:
+                    break
+
+
+class Repository:
+    def __init__(self, pool, notify=None):
+        self.pool = pool
+        self.notify = notify or (lambda *tables: None)
+
+    def _fetchall(self, sql, params=()):
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _fetchone(self, sql, params=()):
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+
+def read_changes(conn, version, limit, changed_sql):
+    # Runs changed_sql, which takes (log seq, last product id, limit), for
+    # the products changed since version. Returns (latest version, rows),
+    # or None when the change log no longer reaches back to version or
+    # more than limit rows changed; either way the caller is better off
+    # with a full reload.
+    latest = ProductVersion._make(conn.execute(ProductRepository.LATEST_CHANGE).fetchone())
+    if latest == version:
+        return latest, []
+    if latest.seq > version.seq:
+        oldest = conn.execute(ProductRepository.OLDEST_CHANGE).fetchone()[0]
+        if oldest is None or oldest > version.seq + 1:
+            return None
+    if limit is not None and latest.last_id - version.last_id > limit:
+        return None
+    rows = conn.execute(changed_sql, (version.seq, version.last_id,
+                                      -1 if limit is None else limit + 1)).fetchall()
+    if limit is not None and len(rows) > limit:
+        return None
+    return latest, rows
+
+
+class ProductRepository(Repository):
+    # Products rows are lots: one per receipt, each with its own cost.
+    # Screens list SKUs (see SkuRepository); lots are read when selling.
+    GET = '''SELECT id, name, quantity, cost_per_unit, has_arrived, date_added
+             FROM products
+             WHERE id = ?'''
+    # Products are versioned by (last change log seq, highest product id):
+    # updates and deletes go through the log, new rows are found by id
+    LATEST_CHANGE = '''SELECT (SELECT COALESCE(MAX(seq), 0) FROM product_changes),
+                              (SELECT COALESCE(MAX(id), 0) FROM products)'''
+    OLDEST_CHANGE = 'SELECT MIN(seq) FROM product_changes'
+    CHANGED_SINCE = '''SELECT c.product_id, p.id, p.name, p.quantity, p.cost_per_unit,
+                              p.has_arrived, p.date_added
+                       FROM (SELECT product_id FROM product_changes WHERE seq > ?
+                             UNION
+                             SELECT id FROM products WHERE id > ?) c
+                       LEFT JOIN products p ON p.id = c.product_id
+                       LIMIT ?'''
+    PRUNE_CHANGES = 'DELETE FROM product_changes WHERE seq <= ?'
+    ADD_SKU = 'INSERT OR IGNORE INTO skus (name) VALUES (?)'
+    LAST_SKU_ID = 'SELECT COALESCE(MAX(id), 0) FROM skus'
+    # Search index entries for SKUs created after the given id
+    INDEX_NAMES = '''INSERT INTO skus_fts (rowid, name)
+                     SELECT id, name FROM skus WHERE id > ?'''
+    # Ids of the SKUs named in a JSON array
+    SKU_IDS = 'SELECT s.name, s.id FROM json_each(?) j JOIN skus s ON s.name = j.value'
+    INSERT = '''INSERT INTO products (name, quantity, cost_per_unit, has_arrived, sku_id)
+                VALUES (?, ?, ?, ?, ?)'''
+    INSERT_MANY = INSERT + ', (?, ?, ?, ?, ?)' * (LOTS_PER_INSERT - 1)
+    LAST_ID = 'SELECT COALESCE(MAX(id), 0) FROM products'
+    # Adds the lots after the given id, summed per SKU, to the SKU's stock
+    ADD_TO_SKUS = '''UPDATE skus SET quantity = skus.quantity + t.quantity,
+                                     incoming = skus.incoming + t.incoming,
+                                     stock_value = skus.stock_value + t.stock_value,
+                                     last_received = CURRENT_TIMESTAMP
+                     FROM (SELECT sku_id,
+                                  SUM(CASE WHEN has_arrived THEN quantity ELSE 0 END) AS quantity,
+                                  SUM(CASE WHEN has_arrived THEN 0 ELSE quantity END) AS incoming,
+                                  SUM(CASE WHEN has_arrived THEN quantity * cost_per_unit ELSE 0 END)
+                                      AS stock_value
+                           FROM products WHERE id > ? GROUP BY sku_id) AS t
+                     WHERE skus.id = t.sku_id'''
+    TOGGLE_ARRIVED = 'UPDATE products SET has_arrived = NOT has_arrived WHERE id = ?'
+
+    def get(self, product_id):
+        row = self._fetchone(self.GET, (product_id,))
+        return Product._make(row) if row else None
+
+    def latest_change(self):
+        return ProductVersion._make(self._fetchone(self.LATEST_CHANGE))
+
+    def changes_since(self, version, limit=None):
+        # None when a full reload is cheaper; see read_changes
+        with self.pool.transaction('DEFERRED') as conn:
+            changes = read_changes(conn, ProductVersion._make(version), limit, self.CHANGED_SINCE)
+        if changes is None:
+            return None
+        latest, rows = changes
+        products, removed_ids = [], []
+        for row in rows:
+            if row[1] is None:
+                removed_ids.append(row[0])
+            else:
+                products.append(Product._make(row[1:]))
+        return ProductChanges(latest, products, removed_ids)
+
+    def prune_changes(self, keep=10000):
+        with self.pool.transaction() as conn:
+            latest = conn.execute(self.LATEST_CHANGE).fetchone()[0]
+            conn.execute(self.PRUNE_CHANGES, (latest - keep,))
+
+    def add(self, name, quantity, cost_per_unit, has_arrived):
+        with self.pool.transaction() as conn:
+            product_id = self.apply_add(conn, name, quantity, cost_per_unit, has_arrived)
+        self.notify('products')
+        return product_id
+
+    def add_many(self, rows, notify=True):
+        # rows are (name, quantity, cost_per_unit, has_arrived) tuples, all
+        # inserted in one transaction. Bulk callers may pass notify=False and
+        # announce the change once when they are done.
+        with self.pool.transaction() as conn:
+            self.apply_add_many(conn, rows)
+        if notify:
+            self.notify('products')
+
+    def toggle_arrived(self, product_id):
+        with self.pool.transaction() as conn:
+            self.apply_toggle_arrived(conn, product_id)
+        self.notify('products')
+
+    # The apply_* methods make a change inside the caller's transaction;
+    # the methods above wrap them in one of their own and notify
+
+    def apply_add(self, conn, name, quantity, cost_per_unit, has_arrived):
+        self.apply_add_many(conn, [(name, quantity, cost_per_unit, has_arrived)])
+        return conn.execute(self.LAST_ID).fetchone()[0]
+
+    def apply_add_many(self, conn, rows):
+        # Each lot joins the SKU of its name, created on first receipt. The
+        # SKU ids are looked up once per distinct name, the lots written
+        # LOTS_PER_INSERT at a time and the stock sums added once per SKU.
+        rows = rows if isinstance(rows, list) else list(rows)
+        names = sorted(set(row[0] for row in rows))
+        sku_ids = dict(conn.execute(self.SKU_IDS, (json.dumps(names),)).fetchall())
+        new_names = [name for name in names if name not in sku_ids]
+        if new_names:
+            last_sku_id = conn.execute(self.LAST_SKU_ID).fetchone()[0]
+            conn.executemany(self.ADD_SKU, [(name,) for name in new_names])
+            conn.execute(self.INDEX_NAMES, (last_sku_id,))
+            sku_ids.update(conn.execute(self.SKU_IDS, (json.dumps(new_names),)).fetchall())
+
+        lots = [(*row, sku_ids[row[0]]) for row in rows]
+        # In SKU order the FIFO index is written in runs rather than at
+        # random; the sort is stable, so each SKU's lots keep their order
+        lots.sort(key=itemgetter(4))
+        last_id = conn.execute(self.LAST_ID).fetchone()[0]
+        whole = len(lots) - len(lots) % LOTS_PER_INSERT
+        conn.executemany(self.INSERT_MANY, [list(chain.from_iterable(lots[start:start + LOTS_PER_INSERT]))
+                                            for start in range(0, whole, LOTS_PER_INSERT)])
+        conn.executemany(self.INSERT, lots[whole:])
+        conn.execute(self.ADD_TO_SKUS, (last_id,))
+
+    def apply_toggle_arrived(self, conn, product_id):
+        conn.execute(self.TOGGLE_ARRIVED, (product_id,))
+
+
+class SkuRepository(Repository):
+    # Keyset pages over SKUs with stock on hand or on the way, most
+    # recently received first, so fetching a page never has to skip over
+    # the rows already shown
+    COLUMNS = 'id, name, quantity, incoming, stock_value, last_received'
+    FIRST_PAGE = f'''SELECT {COLUMNS}
+                    FROM skus
+                    WHERE quantity + incoming > 0
+                    ORDER BY last_received DESC, id DESC
+                    LIMIT ?'''
+    NEXT_PAGE = f'''SELECT {COLUMNS}
+                   FROM skus
+                   WHERE quantity + incoming > 0 AND (last_received, id) < (?, ?)
+                   ORDER BY last_received DESC, id DESC
+                   LIMIT ?'''
+    GET = f'SELECT {COLUMNS} FROM skus WHERE id = ?'
+    # SKUs of the lots changed since a products version
+    CHANGED_SINCE = f'''SELECT {COLUMNS}
+                        FROM skus
+                        WHERE id IN (SELECT sku_id FROM products
+                                     WHERE id IN (SELECT product_id FROM product_changes
+                                                  WHERE seq > ?)
+                                     UNION
+                                     SELECT sku_id FROM products WHERE id > ?)
+                        LIMIT ?'''
+    # Newest matches first, so the full-text index is read in rowid order
+    # and the LIMIT stops it after the first page of SKUs on hand
+    SEARCH_AVAILABLE = '''SELECT s.id, s.name, s.quantity, s.stock_value / s.quantity
+                          FROM skus_fts f
+                          JOIN skus s ON s.id = f.rowid
+                          WHERE skus_fts MATCH ? AND s.quantity > 0
+                          ORDER BY f.rowid DESC
+                          LIMIT ?'''
+    RECEIVE_PENDING = 'UPDATE products SET has_arrived = 1 WHERE sku_id = ? AND NOT has_arrived'
+    NAMES = 'SELECT id, name FROM skus WHERE id IN ({})'
+
+    def page_in_stock(self, after=None, limit=200):
+        # after is the (last_received, id) key of the last row already loaded
+        if after is None:
+            rows = self._fetchall(self.FIRST_PAGE, (limit,))
+        else:
+            rows = self._fetchall(self.NEXT_PAGE, (*after, limit))
+        return [Sku._make(row) for row in rows]
+
+    def search_available(self, text, limit=20):
+        query = prefix_query(text)
+        if not query:
+            return []
+        return [AvailableSku._make(row) for row in self._fetchall(self.SEARCH_AVAILABLE, (query, limit))]
+
+    def get(self, sku_id):
+        row = self._fetchone(self.GET, (sku_id,))
+        return Sku._make(row) if row else None
+
+    def names(self, sku_ids):
+        # (id, name) pairs for the given SKU ids
+        if not sku_ids:
+            return []
+        sql = self.NAMES.format(', '.join('?' * len(sku_ids)))
+        return [tuple(row) for row in self._fetchall(sql, tuple(sku_ids))]
+
+    def latest_change(self):
+        # SKUs change only through their lots, so they share the products version
+        return ProductVersion._make(self._fetchone(ProductRepository.LATEST_CHANGE))
+
+    def changes_since(self, version, limit=None):
+        with self.pool.transaction('DEFERRED') as conn:
+            changes = read_changes(conn, ProductVersion._make(version), limit, self.CHANGED_SINCE)
+        if changes is None:
+            return None
+        latest, rows = changes
+        return SkuChanges(latest, [Sku._make(row) for row in rows])
+
+    def receive_pending(self, sku_id):
+        # Marks every lot of the SKU still on its way as arrived
+        with self.pool.transaction() as conn:
+            self.apply_receive_pending(conn, sku_id)
+        self.notify('products')
+
+    def apply_receive_pending(self, conn, sku_id):
+        conn.execute(self.RECEIVE_PENDING, (sku_id,))
+
+
+class SaleRepository(Repository):
+    # Keyset pages over the sales in the database, newest first, read
+    # backwards along the primary key. The first page starts above the
+    # largest rowid SQLite can assign.
+    COLUMNS = 's.id, k.name, s.quantity, s.sale_price, s.cost / s.quantity'
+    PAGE = f'''SELECT {COLUMNS}
+              FROM sales s
+              JOIN skus k ON s.sku_id = k.id
+              WHERE s.id < ?
+              ORDER BY s.id DESC
+              LIMIT ?'''
+    MAX_ID = 2 ** 63 - 1
+    # Sales recorded after the newest one a list already shows, newest
+    # first, read from the primary key
+    LIST_AFTER = f'''SELECT {COLUMNS}
+                    FROM sales s
+                    JOIN skus k ON s.sku_id = k.id
+                    WHERE s.id > ?
+                    ORDER BY s.id DESC'''
+    OLDEST_ID = 'SELECT MIN(id) FROM sales'
+    # product_id is the first lot the sale drew on; sale_allocations has
+    # them all. 'now' is fixed for the statement, so day matches the
+    # CURRENT_TIMESTAMP that fills date_sold.
+    INSERT = '''INSERT INTO sales (sku_id, product_id, quantity, sale_price, cost, day)
+                VALUES (?, ?, ?, ?, ?, CAST(julianday('now') - 2440587.5 AS INTEGER))'''
+    # Lots of the SKU with stock left, oldest receipt first. Walks
+    # idx_products_fifo, so a sale reads only the lots it consumes (plus
+    # one) after a single seek.
+    FIFO_LOTS = '''SELECT id, quantity, cost_per_unit
+                   FROM products
+                   WHERE sku_id = ? AND quantity > 0 AND has_arrived = 1
+                   ORDER BY id'''
+    TAKE_FROM_LOT = 'UPDATE products SET quantity = quantity - ? WHERE id = ?'
+    # Sales in rowid order for the columnar analytics snapshot; day counts
+    # from 1970-01-01
+    ROWS_AFTER = '''SELECT id, COALESCE(sku_id, 0), day,
+                           quantity, quantity * sale_price, cost
+                    FROM sales
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?'''
+    INSERT_ALLOCATION = '''INSERT INTO sale_allocations (sale_id, lot_id, quantity, cost_per_unit)
+                           VALUES (?, ?, ?, ?)'''
+
+    def page(self, before=None, limit=200):
+        # before is the id of the oldest sale already loaded
+        rows = self._fetchall(self.PAGE, (self.MAX_ID if before is None else before, limit))
+        return [SaleRow._make(row) for row in rows]
+
+    def list_after(self, after_id):
+        return [SaleRow._make(row) for row in self._fetchall(self.LIST_AFTER, (after_id,))]
+
+    def oldest_id(self):
+        # None once every sale has been archived
+        return self._fetchone(self.OLDEST_ID)[0]
+
+    def rows_after(self, after_id, limit=100000):
+        # Raw (id, sku_id, day, quantity, revenue, cost) tuples; see analytics
+        return self._fetchall(self.ROWS_AFTER, (after_id, limit))
+
+    def record(self, sku_id, quantity, sale_price):
+        with self.pool.transaction() as conn:
+            sale_id = self.apply_sale(conn, sku_id, quantity, sale_price)
+        self.notify('sales', 'products')
+        return sale_id
+
+    def record_many(self, sales):
+        # Records (sku_id, quantity, sale_price) tuples in one
+        # transaction. Each result is the new sale id, or the
+        # InsufficientStockError or ValueError that rejected that sale; a
+        # rejected sale has written nothing, so the rest of the batch goes
+        # through.
+        with self.pool.transaction() as conn:
+            results = self.apply_record_many(conn, sales)
+        if any(not isinstance(result, Exception) for result in results):
+            self.notify('sales', 'products')
+        return results
+
+    def apply_record_many(self, conn, sales):
+        results = []
+        for sku_id, quantity, sale_price in sales:
+            try:
+                results.append(self.apply_sale(conn, sku_id, quantity, sale_price))
+            except (InsufficientStockError, ValueError) as e:
+                results.append(e)
+        return results
+
+    def apply_sale(self, conn, sku_id, quantity, sale_price):
+        # Stock rules for every sale: the SKU's arrived lots must together
+        # hold at least the quantity sold. The lots are consumed oldest
+        # first and the sale stores the cost it took from them. Runs inside
+        # the caller's transaction.
+        if quantity < 1:
+            raise ValueError(f"Sale quantity must be at least 1, got {quantity}")
+        if sale_price < 0:
+            raise ValueError(f"Sale price cannot be negative, got {sale_price}")
+        allocations = self.allocate(conn, sku_id, quantity)
+        cost = 0.0
+        for lot_id, taken, cost_per_unit in allocations:
+            conn.execute(self.TAKE_FROM_LOT, (taken, lot_id))
+            cost += taken * cost_per_unit
+        sale_id = conn.execute(self.INSERT, (sku_id, allocations[0][0], quantity, sale_price,
+                                             cost)).lastrowid
+        conn.executemany(self.INSERT_ALLOCATION, [(sale_id, *allocation) for allocation in allocations])
+        return sale_id
+
+    def allocate(self, conn, sku_id, quantity):
+        # (lot id, quantity taken, cost per unit) for each lot the sale
+        # draws on, in FIFO order. Nothing is written, so a shortfall
+        # leaves the stock as it was.
+        allocations = []
+        needed = quantity
+        for lot_id, available, cost_per_unit in conn.execute(self.FIFO_LOTS, (sku_id,)):
+            taken = min(needed, available)
+            allocations.append((lot_id, taken, cost_per_unit))
+            needed -= taken
+            if needed == 0:
+                return allocations
+        raise InsufficientStockError(sku_id, quantity, quantity - needed)
+
+
+class StatsRepository(Repository):
+    TOTALS = 'SELECT revenue, cost FROM sales_summary WHERE id = 1'
+    # Full recompute of what the sales_summary triggers maintain: the sales
+    # in the database plus the months moved out to the archive
+    RECOMPUTE = '''SELECT h.revenue + a.revenue, h.cost + a.cost,
+                          h.units + a.units, h.sale_count + a.sale_count
+                   FROM (SELECT COALESCE(SUM(quantity * sale_price), 0) AS revenue,
+                                COALESCE(SUM(cost), 0) AS cost,
+                                COALESCE(SUM(quantity), 0) AS units,
+                                COUNT(*) AS sale_count
+                         FROM sales) h,
+                        (SELECT COALESCE(SUM(revenue), 0) AS revenue,
+                                COALESCE(SUM(cost), 0) AS cost,
+                                COALESCE(SUM(units), 0) AS units,
+                                COALESCE(SUM(sale_count), 0) AS sale_count
+                         FROM archived_months) a'''
+    SUMMARY = 'SELECT revenue, cost, units, sale_count FROM sales_summary WHERE id = 1'
+    REBUILD = '''INSERT OR REPLACE INTO sales_summary (id, revenue, cost, units, sale_count)
+                 VALUES (1, ?, ?, ?, ?)'''
+    # Costs were allocated when each sale was made, so a range of days is
+    # grouped on the stored day bucket and read from idx_sales_day alone
+    PROFIT_SERIES = '''SELECT day,
+                              SUM(quantity * sale_price) as revenue,
+                              SUM(cost) as cost
+                       FROM sales
+                       WHERE day BETWEEN ? AND ?
+                       GROUP BY day
+                       ORDER BY day'''
+    # Ranked per SKU, however many lots each was sold from
+    TOP_PRODUCTS = '''SELECT k.name,
+                             SUM(s.quantity * s.sale_price) as revenue,
+                             SUM(s.cost) as cost
+                      FROM sales s
+                      JOIN skus k ON s.sku_id = k.id
+                      GROUP BY s.sku_id
+                      ORDER BY (revenue - cost) DESC
+                      LIMIT ?'''
+    # Per-SKU sums of the sales still in the database, to merge with the archive
+    SKU_TOTALS = '''SELECT sku_id, SUM(quantity * sale_price), SUM(cost)
+                    FROM sales
+                    GROUP BY sku_id'''
+
+    def __init__(self, pool, notify=None, archive=None):
+        super().__init__(pool, notify)
+        # Closed months moved out of the database (see sales_archive)
+        self.archive = archive
+
+    def totals(self):
+        # Running totals maintained by triggers on sales and products
+        row = self._fetchone(self.TOTALS)
+        return Totals(*row) if row else Totals(0, 0)
+
+    def rebuild_summary(self):
+        with self.pool.transaction() as conn:
+            row = conn.execute(self.RECOMPUTE).fetchone()
+            conn.execute(self.REBUILD, row)
+        self.notify('sales')
+        return Totals(row[0], row[1])
+
+    def check_summary(self):
+        # Compare the running totals with a full recompute from one snapshot
+        with self.pool.transaction('DEFERRED') as conn:
+            stored = conn.execute(self.SUMMARY).fetchone() or (0, 0, 0, 0)
+            recomputed = conn.execute(self.RECOMPUTE).fetchone()
+        consistent = (stored[2:] == recomputed[2:] and
+                      all(math.isclose(a, b, rel_tol=1e-9, abs_tol=0.005)
+                          for a, b in zip(stored[:2], recomputed[:2])))
+        return SummaryCheck(Totals(*stored[:2]), Totals(*recomputed[:2]), consistent)
+
+    def daily_profit(self, days=30):
+        end = today()
+        return self.profit_series(end - days, end)
+
+    def profit_series(self, start, end):
+        # Days with sales from day start to day end inclusive (days since
+        # 1970-01-01), oldest first
+        return [DailyProfit(day_label(row.day), row.revenue, row.cost)
+                for row in self.day_profit(start, end)]
+
+    def day_profit(self, start=None, end=None):
+        # DayProfit rows for the same days; None runs from the first sale
+        # or to today
+        start = 0 if start is None else start
+        end = today() if end is None else end
+        rows = [DayProfit._make(row) for row in self._fetchall(self.PROFIT_SERIES, (start, end))]
+        if self.archive is None:
+            return rows
+        # Only a range reaching back past the hot months finds anything here
+        cold = self.archive.daily(start, end)
+        if not cold:
+            return rows
+        for row in rows:
+            revenue, cost = cold.get(row.day, (0.0, 0.0))
+            cold[row.day] = (revenue + row.revenue, cost + row.cost)
+        return [DayProfit(day, revenue, cost) for day, (revenue, cost) in sorted(cold.items())]
+
+    def top_products(self, limit=5):
+        if self.archive is None or not self.archive.months():
+            return [ProductProfit._make(row) for row in self._fetchall(self.TOP_PRODUCTS, (limit,))]
+        # The ranking spans the whole history: archived per-SKU sums
+        # (cached per month) plus the hot ones
+        totals = self.archive.by_sku()
+        for sku_id, revenue, cost in self._fetchall(self.SKU_TOTALS):
+            before = totals.get(sku_id, (0.0, 0.0))
+            totals[sku_id] = (before[0] + revenue, before[1] + cost)
+        ranked = heapq.nlargest(limit, totals.items(), key=lambda item: item[1][0] - item[1][1])
+        ids = [sku_id for sku_id, _ in ranked]
+        names = dict(self._fetchall(SkuRepository.NAMES.format(', '.join('?' * len(ids))), ids))
+        return [ProductProfit(names.get(sku_id, ''), revenue, cost)
+                for sku_id, (revenue, cost) in ranked]
+
+
+class Database:
+    # Opens the file itself, so commits by other processes are only seen
+    # by polling (see ChangeBus); a RemoteDatabase is told by the service
+    remote = False
+
+    SALES_VERSION = '''SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'sales'),
+                              revenue, cost, units, sale_count
+                       FROM sales_summary WHERE id = 1'''
+
+    def __init__(self, path=None, pool_size=4):
+        # Every statement is timed; see query_stats and the diagnostics panel
+        self.query_stats = QueryStats()
+        # DB_PATH is read here, not at import, so tools can point it elsewhere
+        self.pool = ConnectionPool(path or DB_PATH, pool_size, self.query_stats)
+        self._listeners = []
+        self.setup_schema()
+        self.products = ProductRepository(self.pool, self.notify)
+        self.skus = SkuRepository(self.pool, self.notify)
+        self.sales = SaleRepository(self.pool, self.notify)
+        from sales_archive import SalesArchive
+        self.archive = SalesArchive(self.pool, self.notify)
+        self.stats = StatsRepository(self.pool, self.notify, self.archive)
+        self.products.prune_changes()
+
+    def add_listener(self, callback):
+        # callback(tables) runs after each committed write made through this
+        # Database, on whichever thread made the write
+        self._listeners.append(callback)
+
+    def notify(self, *tables):
+        for callback in list(self._listeners):
+            callback(tables)
+
+    def table_versions(self):
+        # Cheap per-table fingerprints; a value changes whenever that
+        # table's contents do, whichever process wrote them
+        with self.pool.transaction('DEFERRED') as conn:
+            products = conn.execute(ProductRepository.LATEST_CHANGE).fetchone()
+            sales = conn.execute(self.SALES_VERSION).fetchone()
+        return {'products': products, 'sales': sales}
+
+    def setup_schema(self):
+        return migrations.migrate(self.pool)
+
+    def check_query_plans(self):
+        # Returns {query name: [plan steps]} for hot queries that fell back
+        # to a full table scan; empty when every one of them uses an index
+        offenders = {}
+        with self.pool.connection() as conn:
+            for name, (sql, params) in HOT_QUERIES.items():
+                scans = migrations.table_scans(conn, sql, params)
+                if scans:
+                    offenders[name] = scans
+        return offenders
+
+    def close(self):
+        self.pool.close()
+
+
+# Queries on the interactive paths that must stay index driven. The top
+# products ranking is left out: it aggregates every sale anyway.
+HOT_QUERIES = {
+    'skus.first_page': (SkuRepository.FIRST_PAGE, (200,)),
+    'skus.next_page': (SkuRepository.NEXT_PAGE, ('', 0, 200)),
+    'skus.search': (SkuRepository.SEARCH_AVAILABLE, ('"a"*', 20)),
+    'sales.page': (SaleRepository.PAGE, (SaleRepository.MAX_ID, 200)),
+    'sales.list_after': (SaleRepository.LIST_AFTER, (0,)),
+    'sales.fifo_lots': (SaleRepository.FIFO_LOTS, (1,)),
+    'stats.profit_series': (StatsRepository.PROFIT_SERIES, (20000, 20030)),
+    'stats.totals': (StatsRepository.TOTALS, ()),
+}
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_database():
+    # One shared Database per process so all tabs reuse the same pool, or
+    # a client of the inventory service when SERVICE_ENV names one
+    global _database
+    with _database_lock:
+        if _database is None:
+            service = os.environ.get(SERVICE_ENV)
+            if service:
+                from service_client import RemoteDatabase
+                if service == 'local':
+                    from inventory_service import start_in_thread
+                    host, port = start_in_thread()
+                else:
+                    host, _, port = service.rpartition(':')
+                _database = RemoteDatabase(host, int(port))
+            else:
+                _database = Database()
+        return _database
@@ -0,0 +1,147 @@
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
+                           QTableWidget, QTableWidgetItem, QLabel, QFileDialog,
+                           QAbstractItemView, QSplitter)
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QColor
+from database import get_database
+from stall_watchdog import get_watchdog
+from backup import get_scheduler
+
+# How often the open panel re-reads the counters, in milliseconds
+REFRESH_INTERVAL = 1000
+
+
+class DiagnosticsPanel(QWidget):
+    # Hidden developer window (Ctrl+Shift+D) showing what every SQL
+    # statement has cost since startup, busiest first
+    HEADERS = ["Statement", "Calls", "Total ms", "Mean ms", "p50 ms", "p95 ms",
+               "Max ms", "Rows", "Slow", "Top call site"]
+    SLOW_HEADERS = ["ms", "Rows", "Call site", "Statement"]
+    STALL_HEADERS = ["UI stalls by slot", "Stalls", "Total ms", "Worst ms", "Hottest line in worst"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.WindowType.Window)
+        self.setWindowTitle("Query Diagnostics")
+        self.resize(1100, 600)
+        self.stats = get_database().query_stats
+        self.init_ui()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        toolbar = QHBoxLayout()
+        self.summary = QLabel()
+        toolbar.addWidget(self.summary)
+        toolbar.addStretch()
+        self.backup_status = QLabel()
+        toolbar.addWidget(self.backup_status)
+        for text, slot in (("Refresh", self.refresh), ("Reset", self.reset),
+                           ("Export JSON...", self.export_json)):
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            toolbar.addWidget(button)
+        layout.addLayout(toolbar)
+
+        self.table = self.create_table(self.HEADERS)
+        self.slow_table = self.create_table(self.SLOW_HEADERS)
+        # Filled only when the stall watchdog runs (main.py starts it)
+        self.stall_table = self.create_table(self.STALL_HEADERS)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        splitter.addWidget(self.table)
+        splitter.addWidget(self.slow_table)
+        splitter.addWidget(self.stall_table)
+        splitter.setSizes([350, 150, 100])
+        layout.addWidget(splitter)
+
+    def create_table(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+    def refresh(self):
+        statements = self.stats.statements()
+        slow_queries = self.stats.slow_queries()
+        calls = sum(row['calls'] for row in statements)
+        total = sum(row['total_ms'] for row in statements)
+        self.summary.setText(f"{len(statements)} statements, {calls:,} calls, {total:,.1f} ms "
+                             f"in SQLite; slow threshold {self.stats.slow_ms:g} ms")
+
+        slow = QColor('#e74c3c')
+        self.table.setRowCount(len(statements))
+        for i, row in enumerate(statements):
+            top_site = next(iter(row['call_sites']), '')
+            values = [row['sql'], f"{row['calls']:,}", f"{row['total_ms']:.1f}",
+                      f"{row['mean_ms']:.3f}", f"{row['p50_ms']:.3f}", f"{row['p95_ms']:.3f}",
+                      f"{row['max_ms']:.3f}", f"{row['rows']:,}", str(row['slow']), top_site]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == 0:
+                    item.setToolTip(row['sql'])
+                if row['slow']:
+                    item.setForeground(slow)
+                self.table.setItem(i, column, item)
+
+        # Most recent first
+        self.slow_table.setRowCount(len(slow_queries))
+        for i, query in enumerate(reversed(slow_queries)):
+            values = [f"{query['ms']:.1f}", f"{query['rows']:,}", query['call_site'], query['sql']]
+            for column, value in enumerate(values):
+                self.slow_table.setItem(i, column, QTableWidgetItem(value))
+
+        self.backup_status.setText(self.describe_backups())
+
+        watchdog = get_watchdog()
+        stalls = watchdog.worst() if watchdog is not None else []
+        self.stall_table.setRowCount(len(stalls))
+        for i, row in enumerate(stalls):
+            values = [row.slot, str(row.stalls), f"{row.total_ms:,.0f}", f"{row.max_ms:,.0f}",
+                      row.hottest]
+            for column, value in enumerate(values):
+                self.stall_table.setItem(i, column, QTableWidgetItem(value))
+
+    def describe_backups(self):
+        scheduler = get_scheduler()
+        if scheduler is None:
+            return ""
+        progress = scheduler.progress
+        if progress is not None:
+            return f"Backing up: {progress.copied / progress.total:.0%}"
+        if scheduler.error is not None:
+            return f"Last backup failed: {scheduler.error}"
+        last = scheduler.last
+        if last is None:
+            return "No backup this session"
+        if scheduler.released is None:
+            vacuum = "incremental vacuum not enabled (manage.py compact --enable-incremental)"
+        else:
+            vacuum = f"{scheduler.released:,} free pages released"
+        return (f"Last backup {last.bytes / 1e6:,.1f} MB at {last.mb_per_sec:,.1f} MB/s, "
+                f"longest writer stall {last.longest_stall_ms:.1f} ms, {vacuum}")
+
+    def reset(self):
+        self.stats.reset()
+        self.refresh()
+
+    def export_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Query Statistics",
+                                              "query_stats.json", "JSON (*.json)")
+        if path:
+            self.stats.export_json(path)
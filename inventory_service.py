@@ -0,0 +1,273 @@
+"""Local inventory service.
+
+Owns the database for every terminal on the network. Clients connect
+over TCP and exchange newline-delimited JSON:
+
+    -> {"id": 1, "method": "sales.record", "args": [12, 2, 9.5], "kwargs": {}}
+    <- {"id": 1, "result": 431}
+    <- {"id": 2, "error": {"type": "InsufficientStockError", ...}}
+    <- {"event": "changed", "tables": ["sales", "products"]}
+
+Reads run concurrently on the connection pool. Writes go through a
+single writer task that commits whatever has queued up since its last
+commit as one transaction (group commit), each request inside its own
+savepoint so a rejected sale does not take its neighbours with it.
+After every commit, and whenever another process commits to the file,
+all clients are told which tables changed.
+
+    python inventory_service.py --db warehouse.db --port 8765
+"""
+import argparse
+import asyncio
+import json
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from backup import backup_directory, start_scheduler
+from database import Database, InsufficientStockError, DB_PATH
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Most write requests committed together in one transaction
+MAX_GROUP = 256
+
+# Seconds between checks for commits made by other processes
+POLL_INTERVAL = 1.0
+
+# Requests carry whole manifest chunks, so allow long lines
+LINE_LIMIT = 64 * 1024 * 1024
+
+# Read-only repository methods clients may call
+READS = {
+    'products.get', 'products.latest_change', 'products.changes_since',
+    'skus.page_in_stock', 'skus.search_available', 'skus.get', 'skus.latest_change',
+    'skus.changes_since',
+    'sales.page', 'sales.list_after', 'sales.oldest_id', 'sales.rows_after',
+    'skus.names',
+    'stats.totals', 'stats.daily_profit', 'stats.profit_series', 'stats.day_profit',
+    'stats.top_products',
+    'stats.check_summary',
+    'archive.months', 'archive.sales', 'archive.column_lists',
+}
+
+# Writes: method -> (apply function, tables it changes). The apply
+# functions run inside the writer's transaction.
+WRITES = {
+    'products.add': (lambda db, conn, *args: db.products.apply_add(conn, *args), ('products',)),
+    'products.add_many': (lambda db, conn, rows, notify=True: db.products.apply_add_many(conn, rows),
+                          ('products',)),
+    'products.toggle_arrived': (lambda db, conn, product_id:
+                                db.products.apply_toggle_arrived(conn, product_id), ('products',)),
+    'skus.receive_pending': (lambda db, conn, sku_id: db.skus.apply_receive_pending(conn, sku_id),
+                             ('products',)),
+    'sales.record': (lambda db, conn, *args: db.sales.apply_sale(conn, *args), ('sales', 'products')),
+    'sales.record_many': (lambda db, conn, sales: db.sales.apply_record_many(conn, sales),
+                          ('sales', 'products')),
+}
+
+
+def encode_error(error):
+    if isinstance(error, InsufficientStockError):
+        return {'type': 'InsufficientStockError', 'message': str(error),
+                'sku_id': error.sku_id, 'requested': error.requested,
+                'available': error.available}
+    return {'type': type(error).__name__, 'message': str(error)}
+
+
+def encode_result(value):
+    # record_many reports a rejected sale as an exception in its results
+    if isinstance(value, list):
+        return [{'error': encode_error(item)} if isinstance(item, Exception) else item
+                for item in value]
+    return value
+
+
+class InventoryService:
+    def __init__(self, db):
+        self.db = db
+        self.clients = set()
+        # The event loop only keeps weak references to running tasks
+        self.tasks = set()
+        self.writes = None
+        self.readers = ThreadPoolExecutor(max_workers=db.pool.size, thread_name_prefix='service-read')
+        # SQLite has one writer; a single thread keeps it that way
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='service-write')
+        self.versions = db.table_versions()
+        self.groups = 0
+        self.grouped = 0
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.writes = asyncio.Queue()
+        server = await asyncio.start_server(self.handle_client, host, port, limit=LINE_LIMIT)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[:2])
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.write_loop(), self.watch_loop())
+
+    async def handle_client(self, reader, writer):
+        client = (writer, asyncio.Lock())
+        self.clients.add(client)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                self.spawn(self.answer(client, request))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    async def answer(self, client, request):
+        method = request.get('method')
+        args = request.get('args', [])
+        kwargs = request.get('kwargs', {})
+        try:
+            if method in READS:
+                repository, name = method.split('.')
+                call = getattr(getattr(self.db, repository), name)
+                result = await self.loop.run_in_executor(self.readers, lambda: call(*args, **kwargs))
+            elif method in WRITES:
+                done = self.loop.create_future()
+                await self.writes.put((method, args, kwargs, done))
+                result = await done
+            elif method == 'db.table_versions':
+                result = await self.loop.run_in_executor(self.readers, self.db.table_versions)
+            elif method == 'db.notify':
+                self.broadcast(args)
+                result = None
+            else:
+                raise ValueError(f"Unknown method {method!r}")
+            response = {'id': request.get('id'), 'result': encode_result(result)}
+        except Exception as e:
+            response = {'id': request.get('id'), 'error': encode_error(e)}
+        await self.send(client, response)
+
+    async def send(self, client, message):
+        writer, lock = client
+        async with lock:
+            try:
+                writer.write(json.dumps(message).encode() + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                self.clients.discard(client)
+
+    def broadcast(self, tables):
+        event = {'event': 'changed', 'tables': sorted(set(tables))}
+        for client in list(self.clients):
+            self.spawn(self.send(client, event))
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def write_loop(self):
+        while True:
+            group = [await self.writes.get()]
+            while len(group) < MAX_GROUP and not self.writes.empty():
+                group.append(self.writes.get_nowait())
+            try:
+                outcomes, tables = await self.loop.run_in_executor(self.writer, self.commit, group)
+            except Exception as e:
+                # The whole group rolled back
+                outcomes = [e] * len(group)
+                tables = set()
+            for (_, _, _, done), outcome in zip(group, outcomes):
+                if isinstance(outcome, Exception):
+                    done.set_exception(outcome)
+                else:
+                    done.set_result(outcome)
+            if tables:
+                self.versions = await self.loop.run_in_executor(self.readers, self.db.table_versions)
+                self.broadcast(tables)
+
+    def commit(self, group):
+        # Runs on the writer thread: one transaction for the whole group
+        self.groups += 1
+        self.grouped += len(group)
+        outcomes = []
+        tables = set()
+        with self.db.pool.transaction() as conn:
+            for method, args, kwargs, _ in group:
+                apply, changes = WRITES[method]
+                conn.execute('SAVEPOINT request')
+                try:
+                    outcomes.append(apply(self.db, conn, *args, **kwargs))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO request')
+                    outcomes.append(e)
+                else:
+                    if kwargs.get('notify', True):
+                        tables.update(changes)
+                conn.execute('RELEASE request')
+        return outcomes, tables
+
+    async def watch_loop(self):
+        # Commits by processes that open the file directly, such as
+        # manage.py, are announced too
+        conn = self.db.pool.connect()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            current = conn.execute('PRAGMA data_version').fetchone()[0]
+            if current == data_version:
+                continue
+            data_version = current
+            versions = await self.loop.run_in_executor(self.readers, self.db.table_versions)
+            tables = [table for table, version in versions.items()
+                      if self.versions.get(table) != version]
+            self.versions = versions
+            if tables:
+                self.broadcast(tables)
+
+
+def start_in_thread(path=None, host=DEFAULT_HOST, port=0):
+    # A stand-in server on a background thread, for running the service
+    # and its clients in one process. Returns the (host, port) it bound.
+    service = InventoryService(Database(path))
+    ready = threading.Event()
+    address = []
+
+    def bound(sockname):
+        address.extend(sockname)
+        ready.set()
+
+    def run():
+        try:
+            asyncio.run(service.serve(host, port, ready=bound))
+        except Exception:
+            traceback.print_exc()
+            ready.set()
+
+    threading.Thread(target=run, name='inventory-service', daemon=True).start()
+    ready.wait()
+    if not address:
+        raise RuntimeError("Inventory service failed to start")
+    return tuple(address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    service = InventoryService(db)
+    start_scheduler(db.pool)
+    print(f"Serving {args.db} on {args.host}:{args.port}; backups go to {backup_directory(args.db)}")
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Streaming profit leaderboards.
+
+Keeps per-SKU profit totals for all time and for the current day, week
+and month, each with its top K maintained as sales arrive, so a ranking
+is read in O(K) whatever the size of the sales history. Recent sales
+are also summed into one bucket per day; when a new day moves a
+window's start on, the window is rebuilt by merging the day buckets it
+still covers, and buckets no window can reach are dropped.
+
+    board = Leaderboard()
+    board.add(sku_ids, days, revenue, cost)     # NumPy arrays, any length
+    board.top('week', 5)                        # [(sku_id, revenue, cost)]
+"""
+import heapq
+from datetime import timedelta
+
+import numpy as np
+
+from database import EPOCH, today
+
+# Ranking length kept per window; the dashboard shows the first five
+SIZE = 10
+
+WINDOWS = ('today', 'week', 'month', 'all')
+
+
+def window_starts(day):
+    # First day of each window that contains day (weeks start on Monday)
+    current = EPOCH + timedelta(days=day)
+    return {'today': day, 'week': day - current.weekday(), 'month': day - current.day + 1}
+
+
+class TopK:
+    # Running (revenue, cost) per key, with the k most profitable kept in
+    # order. An addition re-sorts at most those k keys; only a key in the
+    # top falling behind the rest of it, or a bulk merge, costs a pass
+    # over every key, and that is put off until the next read.
+    def __init__(self, k=SIZE):
+        self.k = k
+        self.totals = {}
+        self._top = []
+        self._stale = False
+
+    def profit(self, key):
+        revenue, cost = self.totals[key]
+        return revenue - cost
+
+    def add(self, key, revenue, cost):
+        before = self.totals.get(key)
+        self.totals[key] = (revenue, cost) if before is None else (before[0] + revenue, before[1] + cost)
+        if self._stale:
+            return
+        top = self._top
+        if key in top:
+            if revenue < cost and len(self.totals) > len(top):
+                # Every key outside the top is at most the last one in it,
+                # so the key keeps its place only if it stays ahead of that
+                last = top[-1] if top[-1] != key else None
+                if last is None or self.profit(key) < self.profit(last):
+                    self._stale = True
+                    return
+        elif len(top) < self.k:
+            top.append(key)
+        elif self.profit(key) > self.profit(top[-1]):
+            top[-1] = key
+        else:
+            return
+        top.sort(key=self.profit, reverse=True)
+
+    def add_many(self, items):
+        # (key, revenue, cost) items, merged without keeping the order
+        totals = self.totals
+        for key, revenue, cost in items:
+            before = totals.get(key)
+            totals[key] = (revenue, cost) if before is None else (before[0] + revenue, before[1] + cost)
+        self._stale = True
+
+    def top(self, limit=None):
+        # [(key, revenue, cost)], most profitable first
+        if self._stale:
+            self._top = heapq.nlargest(self.k, self.totals, key=self.profit)
+            self._stale = False
+        return [(key, *self.totals[key]) for key in self._top[:limit]]
+
+
+class Leaderboard:
+    def __init__(self, k=SIZE):
+        self.k = k
+        self.starts = window_starts(today())
+        self.windows = {name: TopK(k) for name in WINDOWS}
+        # day -> {sku_id: (revenue, cost)}, for the days a window covers
+        self.buckets = {}
+
+    def oldest(self):
+        # This week may have begun last month
+        return min(self.starts['week'], self.starts['month'])
+
+    def add(self, sku_ids, days, revenue, cost):
+        # One block of sales. Summed per SKU, and per (day, SKU) for recent
+        # days, before anything is ranked, so loading the history costs an
+        # update per SKU rather than per sale.
+        self.roll()
+        sku_ids = np.asarray(sku_ids, dtype=np.int64)
+        days = np.asarray(days, dtype=np.int64)
+        self._merge(self.windows['all'], *self._sum_by(sku_ids, revenue, cost))
+
+        recent = days >= self.oldest()
+        if not recent.any():
+            return
+        keys, revenue, cost = self._sum_by(days[recent] << 32 | sku_ids[recent],
+                                           revenue[recent], cost[recent])
+        items = []
+        for key, item_revenue, item_cost in zip(keys, revenue, cost):
+            day, sku_id = key >> 32, key & 0xFFFFFFFF
+            bucket = self.buckets.setdefault(day, {})
+            before = bucket.get(sku_id, (0.0, 0.0))
+            bucket[sku_id] = (before[0] + item_revenue, before[1] + item_cost)
+            items.append((day, sku_id, item_revenue, item_cost))
+        for name in ('today', 'week', 'month'):
+            start = self.starts[name]
+            self._merge(self.windows[name], [item[1] for item in items if item[0] >= start],
+                        [item[2] for item in items if item[0] >= start],
+                        [item[3] for item in items if item[0] >= start])
+
+    def _sum_by(self, keys, revenue, cost):
+        unique, inverse = np.unique(keys, return_inverse=True)
+        return (unique.tolist(), np.bincount(inverse, weights=revenue).tolist(),
+                np.bincount(inverse, weights=cost).tolist())
+
+    def _merge(self, window, keys, revenue, cost):
+        # A few keys keep the ranking current; many are cheaper re-ranked once
+        if len(keys) > self.k:
+            window.add_many(zip(keys, revenue, cost))
+        else:
+            for item in zip(keys, revenue, cost):
+                window.add(*item)
+
+    def roll(self):
+        # A new day: rebuild the windows whose start moved from the buckets
+        # they still cover
+        starts = window_starts(today())
+        if starts == self.starts:
+            return
+        self.starts = starts
+        oldest = self.oldest()
+        self.buckets = {day: bucket for day, bucket in self.buckets.items() if day >= oldest}
+        for name, start in starts.items():
+            window = TopK(self.k)
+            for day, bucket in self.buckets.items():
+                if day >= start:
+                    window.add_many((sku_id, *sums) for sku_id, sums in bucket.items())
+            self.windows[name] = window
+
+    def top(self, window='all', limit=5):
+        # [(sku_id, revenue, cost)] for up to limit <= k SKUs
+        self.roll()
+        return self.windows[window].top(limit)
@@ -1,12 +1,21 @@
 import sys
+import importlib
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QHBoxLayout, QPushButton, QLabel, QStackedWidget,
                            QFrame)
-from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve
-from PyQt6.QtGui import QFont, QIcon, QColor, QPalette
-from warehouse_tab import WarehouseTab
-from sales_tab import SalesTab
-from dashboard_tab import DashboardTab
+from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QTimer, QThreadPool
+from PyQt6.QtGui import QFont, QIcon, QColor, QPalette, QShortcut, QKeySequence
+
+# Tabs are imported and built the first time they are shown, so startup
+# does not pay for matplotlib or any database queries up front
+TABS = [
+    ('warehouse_tab', 'WarehouseTab'),
+    ('sales_tab', 'SalesTab'),
+    ('dashboard_tab', 'DashboardTab'),
+]
+
+# Milliseconds after startup before closed months of sales are archived
+ARCHIVE_DELAY = 5000
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -39,17 +48,67 @@ class MainWindow(QMainWindow):
         self.content = QStackedWidget()
         layout.addWidget(self.content)
         
-        # Add tabs
-        self.warehouse_tab = WarehouseTab()
-        self.sales_tab = SalesTab()
-        self.dashboard_tab = DashboardTab()
+        # Add placeholder pages; real tabs replace them on first use
+        self.tabs = [None] * len(TABS)
+        for _ in TABS:
+            self.content.addWidget(QWidget())
+        
+        # Set initial tab once the window is up
+        QTimer.singleShot(0, lambda: self.switch_tab(0))
         
-        self.content.addWidget(self.warehouse_tab)
-        self.content.addWidget(self.sales_tab)
-        self.content.addWidget(self.dashboard_tab)
+        # Hidden query diagnostics, built on first use
+        self.diagnostics = None
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self).activated.connect(self.show_diagnostics)
         
-        # Set initial tab
-        self.content.setCurrentWidget(self.warehouse_tab)
+        # Move closed months of sales out of the database once things are quiet
+        self.archive_worker = None
+        QTimer.singleShot(ARCHIVE_DELAY, self.archive_sales)
+        QTimer.singleShot(ARCHIVE_DELAY, self.start_backups)
+
+    def tab(self, index):
+        if self.tabs[index] is None:
+            module_name, class_name = TABS[index]
+            tab_class = getattr(importlib.import_module(module_name), class_name)
+            self.tabs[index] = tab_class()
+            
+            placeholder = self.content.widget(index)
+            self.content.insertWidget(index, self.tabs[index])
+            self.content.removeWidget(placeholder)
+            placeholder.deleteLater()
+        return self.tabs[index]
+
+    def show_diagnostics(self):
+        if self.diagnostics is None:
+            from diagnostics_panel import DiagnosticsPanel
+            self.diagnostics = DiagnosticsPanel(self)
+        self.diagnostics.show()
+        self.diagnostics.raise_()
+
+    def archive_sales(self):
+        # Only a process with the database file at hand archives; with the
+        # inventory service, run 'manage.py archive-sales' next to it
+        from database import get_database
+        from sales_archive import ArchiveError, require_pyarrow
+        from workers import Worker
+        db = get_database()
+        if db.remote:
+            return
+        try:
+            require_pyarrow()
+        except ArchiveError:
+            return
+        self.archive_worker = Worker(db.archive.archive_closed)
+        QThreadPool.globalInstance().start(self.archive_worker)
+
+    def start_backups(self):
+        # Likewise, the inventory service backs up its own database
+        from backup import start_scheduler
+        from database import get_database
+        db = get_database()
+        if db.remote:
+            return
+        scheduler = start_scheduler(db.pool)
+        QApplication.instance().aboutToQuit.connect(scheduler.stop)
 
     def create_sidebar(self):
         sidebar = QFrame()
@@ -114,8 +173,8 @@ class MainWindow(QMainWindow):
         animation.setDuration(300)
         animation.setEasingCurve(QEasingCurve.Type.OutCubic)
         
-        # Set the new widget
-        self.content.setCurrentIndex(index)
+        # Set the new widget, building it on first use
+        self.content.setCurrentWidget(self.tab(index))
         
         # Update button styles
         buttons = [self.warehouse_btn, self.sales_btn, self.dashboard_btn]
@@ -171,4 +230,10 @@ if __name__ == '__main__':
     
     window = MainWindow()
     window.show()
+    
+    # Log the slots that block the event loop, with sampled stacks
+    from stall_watchdog import start_watchdog
+    watchdog = start_watchdog()
+    app.aboutToQuit.connect(watchdog.stop)
+    
     app.exec() 
\ No newline at end of file
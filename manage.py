@@ -0,0 +1,196 @@
+import argparse
+import json
+import sys
+
+from database import Database, DB_PATH
+from bulk_import import import_manifest, ManifestError
+from pos_feed import SalesFeed
+from sales_archive import ArchiveError, KEEP_MONTHS
+from backup import (BackupError, backup_database, backup_path, restore_database,
+                    release_free_pages)
+
+
+def migrate(db, args):
+    print(f"Schema is at version {db.setup_schema()}")
+    return 0
+
+
+def check_plans(db, args):
+    offenders = db.check_query_plans()
+    if not offenders:
+        print("All hot queries use an index")
+        return 0
+    for name, scans in offenders.items():
+        print(f"{name}: {'; '.join(scans)}")
+    return 1
+
+
+def rebuild_totals(db, args):
+    totals = db.stats.rebuild_summary()
+    print(f"Rebuilt sales summary: revenue ${totals.revenue:,.2f}, cost ${totals.cost:,.2f}")
+    return 0
+
+
+def check_totals(db, args):
+    check = db.stats.check_summary()
+    print(f"stored:     revenue ${check.stored.revenue:,.2f}, cost ${check.stored.cost:,.2f}")
+    print(f"recomputed: revenue ${check.recomputed.revenue:,.2f}, cost ${check.recomputed.cost:,.2f}")
+    if check.consistent:
+        print("Sales summary is consistent")
+        return 0
+    print("Sales summary has drifted; run 'manage.py rebuild-totals'")
+    return 1
+
+
+def import_manifest_command(db, args):
+    def report(progress):
+        print(f"\r{progress.rows:,} rows read ({progress.fraction:.0%})", end='', flush=True)
+
+    try:
+        result = import_manifest(db, args.path, progress=report)
+    except (ManifestError, OSError) as e:
+        print(f"\nImport failed: {e}")
+        return 1
+    print(f"\nImported {result.inserted:,} products, rejected {result.rejected:,}")
+    for line, error in result.errors:
+        print(f"  line {line}: {error}")
+    if result.rejected > len(result.errors):
+        print(f"  ... and {result.rejected - len(result.errors):,} more")
+    return 0
+
+
+def ingest_sales(db, args):
+    # Results go to stdout as JSONL, one per input line; the counters to stderr
+    def report(results):
+        for result in results:
+            print(json.dumps(result._asdict()))
+
+    feed = SalesFeed(db, on_results=report).start()
+    stream = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8')
+    try:
+        for number, text in enumerate(stream, 1):
+            if text.strip():
+                feed.submit(text, line=number)
+    finally:
+        feed.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    stats = feed.stats()
+    print(f"{stats.lines:,} lines in {stats.batches:,} batches: {stats.accepted:,} accepted, "
+          f"{stats.rejected:,} rejected, {stats.sales_per_sec:,.0f} sales/sec, batch latency "
+          f"p50 {stats.batch_p50_ms:.1f} ms / p95 {stats.batch_p95_ms:.1f} ms / "
+          f"max {stats.batch_max_ms:.1f} ms", file=sys.stderr)
+    return 0
+
+
+def archive_sales(db, args):
+    def report(progress):
+        number, count, month = progress
+        print(f"archived {month} ({number}/{count})")
+
+    try:
+        result = db.archive.archive_closed(args.keep, progress=report)
+    except ArchiveError as e:
+        print(f"Archive failed: {e}")
+        return 1
+    if not result.months:
+        print(f"No closed months older than the last {args.keep} to archive")
+        return 0
+    print(f"Moved {result.sales:,} sales in {len(result.months)} months to {db.archive.directory}")
+    return 0
+
+
+def progress_bar(progress):
+    print(f"\r{progress.copied:,}/{progress.total:,} pages ({progress.copied / progress.total:.0%})",
+          end='', flush=True)
+
+
+def backup_command(db, args):
+    destination = args.path or backup_path(db.pool.path)
+    try:
+        result = backup_database(db.pool, destination, compact=args.compact, progress=progress_bar)
+    except (BackupError, OSError) as e:
+        print(f"\nBackup failed: {e}")
+        return 1
+    print(f"\nBacked up to {result.path}: {result.bytes / 1e6:,.1f} MB in {result.seconds:.1f} s "
+          f"({result.mb_per_sec:,.1f} MB/s), {result.archive_files} archive files, "
+          f"longest writer stall {result.longest_stall_ms:.1f} ms")
+    return 0
+
+
+def restore_command(db, args):
+    try:
+        archive_files = restore_database(db.pool, args.path, progress=progress_bar)
+    except (BackupError, OSError) as e:
+        print(f"\nRestore failed: {e}")
+        return 1
+    print(f"\nRestored {db.pool.path} from {args.path} ({archive_files} archive files put back); "
+          f"restart any terminal that was running")
+    return 0
+
+
+def compact(db, args):
+    if args.enable_incremental:
+        # A full VACUUM rewrites the file and blocks every writer meanwhile
+        with db.pool.connection() as conn:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        print("Incremental vacuum enabled")
+    released = release_free_pages(db.pool)
+    if released is None:
+        print("The database is not set up for incremental vacuum; run 'manage.py compact "
+              "--enable-incremental' while nobody is using it, or 'manage.py backup --compact'")
+        return 1
+    print(f"Released {released:,} free pages")
+    return 0
+
+
+COMMANDS = {
+    'migrate': (migrate, "Apply pending schema migrations"),
+    'check-plans': (check_plans, "Fail if a hot query falls back to a full table scan"),
+    'rebuild-totals': (rebuild_totals, "Recompute the dashboard running totals from scratch"),
+    'check-totals': (check_totals, "Compare the running totals against a full recompute"),
+    'import-manifest': (import_manifest_command, "Bulk-load a CSV or Parquet receiving manifest"),
+    'ingest-sales': (ingest_sales, "Record a JSONL stream of POS sales in micro-batches"),
+    'archive-sales': (archive_sales, "Move closed months of sales out to Parquet files"),
+    'backup': (backup_command, "Copy the live database (and its sales archive) to a backup"),
+    'restore': (restore_command, "Replace the database with a backup; close every terminal first"),
+    'compact': (compact, "Return free pages to the file system"),
+}
+
+# Arguments for the commands that take any: (name, help[, add_argument options])
+ARGUMENTS = {
+    'import-manifest': [('path', "manifest file (.csv or .parquet)")],
+    'ingest-sales': [('path', "JSONL file of sales, or - to read standard input")],
+    'archive-sales': [('--keep', "closed months to keep in the database (default: %(default)s)",
+                       {'type': int, 'default': KEEP_MONTHS})],
+    'backup': [('path', "backup file (default: a timestamped file in <db>_backups/)", {'nargs': '?'}),
+               ('--compact', "write a defragmented copy with VACUUM INTO", {'action': 'store_true'})],
+    'restore': [('path', "backup file to restore")],
+    'compact': [('--enable-incremental', "switch to auto_vacuum = INCREMENTAL first (blocks writers)",
+                 {'action': 'store_true'})],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warehouse database maintenance")
+    parser.add_argument('--db', default=DB_PATH, help="database file (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (handler, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.set_defaults(handler=handler)
+        for argument, argument_help, *options in ARGUMENTS.get(name, ()):
+            subparser.add_argument(argument, help=argument_help, **(options[0] if options else {}))
+    args = parser.parse_args(argv)
+
+    # Opening the database applies any pending migrations
+    db = Database(args.db)
+    try:
+        return args.handler(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
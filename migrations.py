@@ -0,0 +1,412 @@
+# Each migration upgrades the schema by one PRAGMA user_version step.
+# Databases created before versioning existed report version 0, so the
+# early steps use IF NOT EXISTS and column checks to adopt them as-is.
+import sqlite3
+
+
+def create_base_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS products
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 name TEXT NOT NULL,
+                 quantity INTEGER NOT NULL,
+                 cost_per_unit REAL NOT NULL,
+                 has_arrived BOOLEAN DEFAULT 0,
+                 date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    # Add has_arrived column to databases created before it existed
+    if 'has_arrived' not in table_columns(conn, 'products'):
+        conn.execute('ALTER TABLE products ADD COLUMN has_arrived BOOLEAN DEFAULT 0')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS sales
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 product_id INTEGER NOT NULL,
+                 quantity INTEGER NOT NULL,
+                 sale_price REAL NOT NULL,
+                 date_sold TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                 FOREIGN KEY (product_id) REFERENCES products (id))''')
+
+
+def create_product_change_log(conn):
+    # Append-only log of touched product ids; its seq is the version
+    # other views use to catch up without a full reload
+    conn.execute('''CREATE TABLE IF NOT EXISTS product_changes
+                (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                 product_id INTEGER NOT NULL)''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS products_log_insert
+                AFTER INSERT ON products BEGIN
+                    INSERT INTO product_changes (product_id) VALUES (NEW.id);
+                END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS products_log_update
+                AFTER UPDATE ON products BEGIN
+                    INSERT INTO product_changes (product_id) VALUES (NEW.id);
+                END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS products_log_delete
+                AFTER DELETE ON products BEGIN
+                    INSERT INTO product_changes (product_id) VALUES (OLD.id);
+                END''')
+
+
+def create_hot_query_indexes(conn):
+    # In-stock listing: the partial index walks rows already in
+    # (date_added, id) order, so keyset pages never sort
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_products_quantity_date
+                ON products (quantity, date_added)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_products_in_stock
+                ON products (date_added, id) WHERE quantity > 0''')
+    # Products offered for sale
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_products_arrived
+                ON products (has_arrived, quantity)''')
+    # Sales joins and date ranges
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sales_product ON sales (product_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sales_date_sold ON sales (date_sold)')
+
+
+def create_sales_summary(conn):
+    # Single-row running totals kept current by triggers, so the dashboard
+    # cards read four numbers instead of summing the whole sales history
+    conn.execute('''CREATE TABLE IF NOT EXISTS sales_summary
+                (id INTEGER PRIMARY KEY CHECK (id = 1),
+                 revenue REAL NOT NULL DEFAULT 0,
+                 cost REAL NOT NULL DEFAULT 0,
+                 units INTEGER NOT NULL DEFAULT 0,
+                 sale_count INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute('''INSERT OR REPLACE INTO sales_summary (id, revenue, cost, units, sale_count)
+                SELECT 1,
+                       COALESCE(SUM(s.quantity * s.sale_price), 0),
+                       COALESCE(SUM(s.quantity * p.cost_per_unit), 0),
+                       COALESCE(SUM(s.quantity), 0),
+                       COUNT(*)
+                FROM sales s
+                LEFT JOIN products p ON s.product_id = p.id''')
+
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS sales_summary_insert
+                AFTER INSERT ON sales BEGIN
+                    UPDATE sales_summary SET
+                        revenue = revenue + NEW.quantity * NEW.sale_price,
+                        cost = cost + NEW.quantity * COALESCE(
+                            (SELECT cost_per_unit FROM products WHERE id = NEW.product_id), 0),
+                        units = units + NEW.quantity,
+                        sale_count = sale_count + 1
+                    WHERE id = 1;
+                END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS sales_summary_delete
+                AFTER DELETE ON sales BEGIN
+                    UPDATE sales_summary SET
+                        revenue = revenue - OLD.quantity * OLD.sale_price,
+                        cost = cost - OLD.quantity * COALESCE(
+                            (SELECT cost_per_unit FROM products WHERE id = OLD.product_id), 0),
+                        units = units - OLD.quantity,
+                        sale_count = sale_count - 1
+                    WHERE id = 1;
+                END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS sales_summary_update
+                AFTER UPDATE OF product_id, quantity, sale_price ON sales BEGIN
+                    UPDATE sales_summary SET
+                        revenue = revenue - OLD.quantity * OLD.sale_price
+                                          + NEW.quantity * NEW.sale_price,
+                        cost = cost - OLD.quantity * COALESCE(
+                                   (SELECT cost_per_unit FROM products WHERE id = OLD.product_id), 0)
+                                    + NEW.quantity * COALESCE(
+                                   (SELECT cost_per_unit FROM products WHERE id = NEW.product_id), 0),
+                        units = units - OLD.quantity + NEW.quantity
+                    WHERE id = 1;
+                END''')
+
+    # Cost is derived from the product, so repricing or removing a product
+    # shifts the cost of every sale already recorded against it
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS sales_summary_product_cost
+                AFTER UPDATE OF cost_per_unit ON products BEGIN
+                    UPDATE sales_summary SET
+                        cost = cost + (NEW.cost_per_unit - OLD.cost_per_unit) * COALESCE(
+                            (SELECT SUM(quantity) FROM sales WHERE product_id = NEW.id), 0)
+                    WHERE id = 1;
+                END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS sales_summary_product_delete
+                AFTER DELETE ON products BEGIN
+                    UPDATE sales_summary SET
+                        cost = cost - OLD.cost_per_unit * COALESCE(
+                            (SELECT SUM(quantity) FROM sales WHERE product_id = OLD.id), 0)
+                    WHERE id = 1;
+                END''')
+
+
+def drop_product_insert_log(conn):
+    # New products are found by id range, so logging every insert only
+    # slowed down bulk receiving
+    conn.execute('DROP TRIGGER IF EXISTS products_log_insert')
+
+
+def create_product_search(conn):
+    # Word-prefix index over product names for the sales product picker.
+    # Names stay stored only in products (external content). Prefixes of
+    # up to six characters are indexed, so a type-ahead lookup reads one
+    # term instead of merging every word that starts with it; positions
+    # are dropped (detail=none) because prefix matching never uses them.
+    # There is no insert trigger: a per-row trigger cut bulk imports to a
+    # fifth of their speed, so ProductRepository indexes the names of the
+    # rows it inserts with one INSERT ... SELECT per transaction.
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    name, content='products', content_rowid='id',
+                    prefix='1 2 3 4 5 6', detail=none, columnsize=0)''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_delete
+                AFTER DELETE ON products BEGIN
+                    INSERT INTO products_fts (products_fts, rowid, name)
+                    VALUES ('delete', OLD.id, OLD.name);
+                END''')
+    # Stock changes do not touch the index; only renames do
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_update
+                AFTER UPDATE OF name ON products BEGIN
+                    INSERT INTO products_fts (products_fts, rowid, name)
+                    VALUES ('delete', OLD.id, OLD.name);
+                    INSERT INTO products_fts (rowid, name) VALUES (NEW.id, NEW.name);
+                END''')
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+def allocate_sale_costs(conn):
+    # Each products row is one receipt (a cost lot). Sales now consume the
+    # lots of their product name oldest first and store the cost they
+    # allocated, so cost of goods sold is fixed when the sale is made and
+    # reports no longer join every sale back to a product price.
+    if 'cost' not in table_columns(conn, 'sales'):
+        conn.execute('ALTER TABLE sales ADD COLUMN cost REAL NOT NULL DEFAULT 0')
+    conn.execute('''CREATE TABLE IF NOT EXISTS sale_allocations
+                (sale_id INTEGER NOT NULL REFERENCES sales (id),
+                 lot_id INTEGER NOT NULL REFERENCES products (id),
+                 quantity INTEGER NOT NULL,
+                 cost_per_unit REAL NOT NULL,
+                 PRIMARY KEY (sale_id, lot_id)) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sale_allocations_lot ON sale_allocations (lot_id)')
+    # FIFO queue of lots with stock left, per name, oldest receipt first;
+    # a sale seeks to its name and reads only the lots it consumes
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_products_fifo
+                ON products (name, id) WHERE quantity > 0 AND has_arrived = 1''')
+
+    # Sales made before lots existed drew on the row they were recorded against
+    conn.execute('''UPDATE sales SET cost = quantity * COALESCE(
+                    (SELECT cost_per_unit FROM products WHERE id = sales.product_id), 0)''')
+    conn.execute('''INSERT OR IGNORE INTO sale_allocations (sale_id, lot_id, quantity, cost_per_unit)
+                SELECT s.id, s.product_id, s.quantity, p.cost_per_unit
+                FROM sales s JOIN products p ON p.id = s.product_id''')
+
+    # The running totals follow the stored cost; repricing or removing a
+    # lot no longer rewrites the cost of sales already made
+    for trigger in ('sales_summary_insert', 'sales_summary_delete', 'sales_summary_update',
+                    'sales_summary_product_cost', 'sales_summary_product_delete'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    conn.execute('''CREATE TRIGGER sales_summary_insert
+                AFTER INSERT ON sales BEGIN
+                    UPDATE sales_summary SET
+                        revenue = revenue + NEW.quantity * NEW.sale_price,
+                        cost = cost + NEW.cost,
+                        units = units + NEW.quantity,
+                        sale_count = sale_count + 1
+                    WHERE id = 1;
+                END''')
+    conn.execute('''CREATE TRIGGER sales_summary_delete
+                AFTER DELETE ON sales BEGIN
+                    UPDATE sales_summary SET
+                        revenue = revenue - OLD.quantity * OLD.sale_price,
+                        cost = cost - OLD.cost,
+                        units = units - OLD.quantity,
+                        sale_count = sale_count - 1
+                    WHERE id = 1;
+                END''')
+    conn.execute('''CREATE TRIGGER sales_summary_update
+                AFTER UPDATE OF quantity, sale_price, cost ON sales BEGIN
+                    UPDATE sales_summary SET
+                        revenue = revenue - OLD.quantity * OLD.sale_price
+                                          + NEW.quantity * NEW.sale_price,
+                        cost = cost - OLD.cost + NEW.cost,
+                        units = units - OLD.quantity + NEW.quantity
+                    WHERE id = 1;
+                END''')
+    conn.execute('''INSERT OR REPLACE INTO sales_summary (id, revenue, cost, units, sale_count)
+                SELECT 1, COALESCE(SUM(quantity * sale_price), 0), COALESCE(SUM(cost), 0),
+                       COALESCE(SUM(quantity), 0), COUNT(*)
+                FROM sales''')
+
+
+def create_sku_catalog(conn):
+    # One row per distinct product name (SKU), holding its stock summed
+    # over its lots, so the warehouse table and the sales picker list
+    # items rather than receipts. Lot updates and deletes keep the sums
+    # current through triggers; new lots are added to them set-based by
+    # ProductRepository, for the same reason names are indexed that way.
+    conn.execute('''CREATE TABLE IF NOT EXISTS skus
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 name TEXT NOT NULL UNIQUE,
+                 quantity INTEGER NOT NULL DEFAULT 0,
+                 incoming INTEGER NOT NULL DEFAULT 0,
+                 stock_value REAL NOT NULL DEFAULT 0,
+                 last_received TIMESTAMP)''')
+    for table in ('products', 'sales'):
+        if 'sku_id' not in table_columns(conn, table):
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN sku_id INTEGER REFERENCES skus (id)')
+
+    conn.execute('''INSERT OR IGNORE INTO skus (name)
+                SELECT name FROM products GROUP BY name ORDER BY MIN(id)''')
+    conn.execute('''UPDATE products SET sku_id = (SELECT id FROM skus WHERE skus.name = products.name)
+                WHERE sku_id IS NULL''')
+    conn.execute('''UPDATE sales SET sku_id = (SELECT sku_id FROM products WHERE id = sales.product_id)
+                WHERE sku_id IS NULL''')
+    conn.execute('''UPDATE skus SET quantity = t.quantity, incoming = t.incoming,
+                                stock_value = t.stock_value, last_received = t.last_received
+                FROM (SELECT sku_id,
+                             SUM(CASE WHEN has_arrived THEN quantity ELSE 0 END) AS quantity,
+                             SUM(CASE WHEN has_arrived THEN 0 ELSE quantity END) AS incoming,
+                             SUM(CASE WHEN has_arrived THEN quantity * cost_per_unit ELSE 0 END)
+                                 AS stock_value,
+                             MAX(date_added) AS last_received
+                      FROM products GROUP BY sku_id) AS t
+                WHERE skus.id = t.sku_id''')
+
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS skus_stock_update
+                AFTER UPDATE OF quantity, has_arrived, cost_per_unit ON products BEGIN
+                    UPDATE skus SET
+                        quantity = quantity
+                            - CASE WHEN OLD.has_arrived THEN OLD.quantity ELSE 0 END
+                            + CASE WHEN NEW.has_arrived THEN NEW.quantity ELSE 0 END,
+                        incoming = incoming
+                            - CASE WHEN OLD.has_arrived THEN 0 ELSE OLD.quantity END
+                            + CASE WHEN NEW.has_arrived THEN 0 ELSE NEW.quantity END,
+                        stock_value = stock_value
+                            - CASE WHEN OLD.has_arrived THEN OLD.quantity * OLD.cost_per_unit ELSE 0 END
+                            + CASE WHEN NEW.has_arrived THEN NEW.quantity * NEW.cost_per_unit ELSE 0 END
+                    WHERE id = NEW.sku_id;
+                END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS skus_stock_delete
+                AFTER DELETE ON products BEGIN
+                    UPDATE skus SET
+                        quantity = quantity - CASE WHEN OLD.has_arrived THEN OLD.quantity ELSE 0 END,
+                        incoming = incoming - CASE WHEN OLD.has_arrived THEN 0 ELSE OLD.quantity END,
+                        stock_value = stock_value
+                            - CASE WHEN OLD.has_arrived THEN OLD.quantity * OLD.cost_per_unit ELSE 0 END
+                    WHERE id = OLD.sku_id;
+                END''')
+
+    # The FIFO queue is per SKU now
+    conn.execute('DROP INDEX IF EXISTS idx_products_fifo')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_products_fifo
+                ON products (sku_id, id) WHERE quantity > 0 AND has_arrived = 1''')
+    # Warehouse pages: SKUs with stock on hand or on the way, most
+    # recently received first
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_skus_in_stock
+                ON skus (last_received, id) WHERE quantity + incoming > 0''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sales_sku ON sales (sku_id)')
+    # Nothing lists lots any more; these only slowed down every sale
+    for index in ('idx_products_in_stock', 'idx_products_quantity_date', 'idx_products_arrived'):
+        conn.execute(f'DROP INDEX IF EXISTS {index}')
+
+    # The product picker searches SKU names instead of lot names. SKUs
+    # are never renamed or removed, so only new ones need indexing.
+    conn.execute('DROP TRIGGER IF EXISTS products_fts_delete')
+    conn.execute('DROP TRIGGER IF EXISTS products_fts_update')
+    conn.execute('DROP TABLE IF EXISTS products_fts')
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS skus_fts USING fts5(
+                    name, content='skus', content_rowid='id',
+                    prefix='1 2 3 4 5 6', detail=none, columnsize=0)''')
+    conn.execute("INSERT INTO skus_fts (skus_fts) VALUES ('rebuild')")
+
+
+def create_sales_archive(conn):
+    # Closed months moved out to Parquet files by sales_archive, with
+    # their totals so reports can count them without opening the files
+    conn.execute('''CREATE TABLE IF NOT EXISTS archived_months
+                (month TEXT PRIMARY KEY,
+                 sale_count INTEGER NOT NULL,
+                 revenue REAL NOT NULL,
+                 cost REAL NOT NULL,
+                 units INTEGER NOT NULL,
+                 path TEXT NOT NULL,
+                 archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+
+def add_sales_day(conn):
+    # Day bucket of each sale, in days since 1970-01-01 like the analytics
+    # snapshot, so profit series group and range on a plain column instead
+    # of date(date_sold). Stored rather than generated: SQLite will not
+    # answer a query from an index on a virtual column alone. With the
+    # summed columns beside it, any range of days is read from the index
+    # in day order without touching the table.
+    if 'day' not in table_columns(conn, 'sales'):
+        conn.execute('ALTER TABLE sales ADD COLUMN day INTEGER')
+        conn.execute("UPDATE sales SET day = CAST(julianday(date_sold) - 2440587.5 AS INTEGER)")
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_sales_day
+                ON sales (day, quantity, sale_price, cost)''')
+    # SaleRepository sets day itself; this covers any other writer
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS sales_day_default
+                AFTER INSERT ON sales WHEN NEW.day IS NULL BEGIN
+                    UPDATE sales SET day = CAST(julianday(NEW.date_sold) - 2440587.5 AS INTEGER)
+                    WHERE id = NEW.id;
+                END''')
+
+
+MIGRATIONS = [
+    create_base_tables,
+    create_product_change_log,
+    create_hot_query_indexes,
+    create_sales_summary,
+    drop_product_insert_log,
+    create_product_search,
+    allocate_sale_costs,
+    create_sku_catalog,
+    create_sales_archive,
+    add_sales_day,
+]
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def prepare_new_database(conn):
+    # Incremental vacuum, which lets backups give the pages freed by
+    # archiving back to the file system, can only be chosen before the
+    # first table exists. The connection has already put the file in WAL
+    # mode, so the setting only sticks through a VACUUM, which is instant
+    # on an empty file. Existing databases need 'manage.py compact
+    # --enable-incremental'.
+    if conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0]:
+        return
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    except sqlite3.OperationalError:
+        # Another terminal is creating the database right now
+        pass
+
+
+def migrate(pool):
+    with pool.connection() as conn:
+        version = schema_version(conn)
+        if version == 0:
+            prepare_new_database(conn)
+
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with pool.transaction() as conn:
+            # Another terminal may have applied this step while we waited for the lock
+            if schema_version(conn) >= target:
+                continue
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {target}')
+
+    with pool.connection() as conn:
+        return schema_version(conn)
+
+
+def is_table_scan(detail):
+    # "SCAN products" reads every row; "SCAN s USING INDEX ..." walks an index
+    # in order and "SEARCH ..." seeks, both of which are fine, as is a
+    # "SCAN ... VIRTUAL TABLE INDEX" answered by the full-text index
+    return (detail.startswith('SCAN ') and ' USING ' not in detail
+            and ' VIRTUAL TABLE INDEX ' not in detail)
+
+
+def table_scans(conn, sql, params=()):
+    plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    return [row[3] for row in plan if is_table_scan(row[3])]
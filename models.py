@@ -0,0 +1,254 @@
+from PyQt6.QtCore import Qt, QAbstractListModel, QAbstractTableModel, QModelIndex
+
+
+class SkuTableModel(QAbstractTableModel):
+    # One row per SKU, with its stock summed over all of its lots
+    HEADERS = ["ID", "Product Name", "Quantity", "Cost per Unit", "Total Cost", "Status"]
+    PAGE_SIZE = 200
+
+    def __init__(self, db, cache=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.cache = cache
+        self._rows = []
+        self._has_more = True
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        # Cells are formatted on demand, only for rows the view actually paints
+        sku = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return str(sku.id)
+            if column == 1:
+                return sku.name
+            if column == 2:
+                return str(sku.quantity)
+            if column == 3:
+                # Average over the lots on hand
+                return f"${sku.stock_value / sku.quantity:.2f}" if sku.quantity else "-"
+            if column == 4:
+                return f"${sku.stock_value:.2f}"
+            if column == 5:
+                return f"⏳ {sku.incoming} Pending" if sku.incoming else "✓ Arrived"
+        elif role == Qt.ItemDataRole.TextAlignmentRole and column == 5:
+            return Qt.AlignmentFlag.AlignCenter
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+
+        after = None
+        if self._rows:
+            last = self._rows[-1]
+            after = (last.last_received, last.id)
+        page = self.db.skus.page_in_stock(after, self.PAGE_SIZE)
+        self._has_more = len(page) == self.PAGE_SIZE
+        if not page:
+            return
+        if self.cache is not None:
+            self.cache.put_many(page)
+
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+        self._rows.extend(page)
+        self.endInsertRows()
+
+    def reload(self):
+        # Drop everything loaded so far and start again from the first page
+        self.beginResetModel()
+        self._rows = []
+        self._has_more = True
+        self.endResetModel()
+        self.fetchMore()
+
+    def _position(self, key):
+        # Rows are sorted by (last_received, id) descending; binary search
+        # for the first row whose key is not greater than key
+        lo, hi = 0, len(self._rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = self._rows[mid]
+            if (row.last_received, row.id) > key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def upsert(self, sku):
+        key = (sku.last_received, sku.id)
+        row = self._position(key)
+        exists = row < len(self._rows) and self._rows[row].id == sku.id
+        if not exists:
+            # A new lot moves its SKU up to the top
+            self.remove(sku.id)
+            row = self._position(key)
+
+        if sku.quantity + sku.incoming <= 0:
+            if exists:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._rows[row]
+                self.endRemoveRows()
+        elif exists:
+            self._rows[row] = sku
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+        elif row < len(self._rows) or not self._has_more:
+            # Rows past the loaded window arrive with a later fetchMore
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._rows.insert(row, sku)
+            self.endInsertRows()
+
+    def remove(self, sku_id):
+        for row, sku in enumerate(self._rows):
+            if sku.id == sku_id:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._rows[row]
+                self.endRemoveRows()
+                return
+
+    def sku_at(self, row):
+        return self._rows[row]
+
+
+class SaleTableModel(QAbstractTableModel):
+    # The sales still in the database, newest first and fetched a page at
+    # a time as the view scrolls, followed by whichever archived months
+    # have been asked for. Pages fetched after a month was shown go in
+    # above it, so the rows stay in order.
+    HEADERS = ["ID", "Product Name", "Quantity", "Sale Price", "Total Revenue", "Profit"]
+    PAGE_SIZE = 200
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._rows = []
+        self._archived = []
+        self._has_more = True
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows) + len(self._archived)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+
+        row = index.row()
+        sale = self._rows[row] if row < len(self._rows) else self._archived[row - len(self._rows)]
+        column = index.column()
+        if column == 0:
+            return str(sale.id)
+        if column == 1:
+            return sale.product_name
+        if column == 2:
+            return str(sale.quantity)
+        if column == 3:
+            return f"${sale.sale_price:.2f}"
+        revenue = sale.quantity * sale.sale_price
+        if column == 4:
+            return f"${revenue:.2f}"
+        if column == 5:
+            return f"${revenue - sale.quantity * sale.cost_per_unit:.2f}"
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+
+        before = self._rows[-1].id if self._rows else None
+        page = self.db.sales.page(before, self.PAGE_SIZE)
+        self._has_more = len(page) == self.PAGE_SIZE
+        if not page:
+            return
+
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+        self._rows.extend(page)
+        self.endInsertRows()
+
+    def reload(self):
+        # Drop everything loaded so far, archived months included, and
+        # start again from the first page
+        self.beginResetModel()
+        self._rows = []
+        self._archived = []
+        self._has_more = True
+        self.endResetModel()
+        self.fetchMore()
+
+    def newest_id(self):
+        # 0 when no sale in the database is shown, so every sale is new
+        return self._rows[0].id if self._rows else 0
+
+    def add_new(self, sales):
+        # Sales recorded since the newest one shown, newest first
+        if not sales:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(sales) - 1)
+        self._rows[:0] = sales
+        self.endInsertRows()
+
+    def add_archived(self, sales):
+        # An archived month, older than everything shown
+        if not sales:
+            return
+        start = self.rowCount()
+        self.beginInsertRows(QModelIndex(), start, start + len(sales) - 1)
+        self._archived.extend(sales)
+        self.endInsertRows()
+
+
+def product_label(product):
+    return f"{product.name} (Stock: {product.quantity}, Cost: ${product.cost_per_unit:.2f})"
+
+
+class ProductSearchModel(QAbstractListModel):
+    # Holds only the current top SKU matches for the sales product picker; the
+    # tab replaces them on each (debounced) keystroke
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._products = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._products)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        product = self._products[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return product_label(product)
+        if role == Qt.ItemDataRole.UserRole:
+            return product
+        return None
+
+    def set_products(self, products):
+        self.beginResetModel()
+        self._products = list(products)
+        self.endResetModel()
\ No newline at end of file
@@ -0,0 +1,151 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from queue import Queue, Empty
+
+from service_client import ServiceError
+
+# A batch is written once it holds this many sales, or once its oldest
+# sale has waited MAX_DELAY seconds, whichever comes first
+BATCH_SIZE = 500
+MAX_DELAY = 0.05
+
+# Batch latencies kept for the percentile counters
+LATENCY_SAMPLES = 1000
+
+LineResult = namedtuple('LineResult', 'line sale_id error')
+FeedStats = namedtuple('FeedStats', 'lines accepted rejected batches sales_per_sec '
+                                    'batch_p50_ms batch_p95_ms batch_max_ms')
+
+
+def parse_sale(text):
+    # One JSONL line from a terminal:
+    #   {"sku_id": 12, "quantity": 2, "sale_price": 9.5}
+    # Raises ValueError with a readable message for anything else
+    try:
+        sale = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e.msg}")
+    if not isinstance(sale, dict):
+        raise ValueError("expected a JSON object")
+
+    try:
+        sku_id = sale['sku_id']
+        quantity = sale['quantity']
+        sale_price = sale['sale_price']
+    except KeyError as e:
+        raise ValueError(f"missing field {e.args[0]!r}")
+
+    if not isinstance(sku_id, int) or isinstance(sku_id, bool):
+        raise ValueError(f"invalid sku_id {sku_id!r}")
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+        raise ValueError(f"quantity must be a positive integer, got {quantity!r}")
+    if not isinstance(sale_price, (int, float)) or isinstance(sale_price, bool) or sale_price < 0:
+        raise ValueError(f"invalid sale_price {sale_price!r}")
+    return (sku_id, quantity, float(sale_price))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class SalesFeed:
+    # Ingests POS sales pushed as JSONL lines. submit() may be called from
+    # any thread; a single writer thread groups the queued lines into
+    # micro-batches and records each batch in one transaction through
+    # SaleRepository.record_many, so the stock rules are the same as for
+    # sales keyed in on the Sales tab. on_results, if given, is called on
+    # the writer thread with the LineResults of every batch, in order.
+    def __init__(self, db, on_results=None, batch_size=BATCH_SIZE, max_delay=MAX_DELAY):
+        self.db = db
+        self.on_results = on_results
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._lines = self._accepted = self._rejected = self._batches = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._started = None
+        self._thread = threading.Thread(target=self._run, name='sales-feed', daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def submit(self, text, line=None):
+        self._queue.put((line, text))
+
+    def close(self):
+        # Writes whatever is still queued, then stops the writer
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._started if self._started else 0
+            latencies = list(self._latencies)
+            return FeedStats(self._lines, self._accepted, self._rejected, self._batches,
+                             self._accepted / elapsed if elapsed else 0.0,
+                             percentile(latencies, 0.50) * 1000,
+                             percentile(latencies, 0.95) * 1000,
+                             max(latencies, default=0) * 1000)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.max_delay
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        results = [None] * len(batch)
+        sales, positions = [], []
+        for i, (line, text) in enumerate(batch):
+            try:
+                sales.append(parse_sale(text))
+                positions.append(i)
+            except ValueError as e:
+                results[i] = LineResult(line, None, str(e))
+
+        try:
+            outcomes = self.db.sales.record_many(sales) if sales else []
+        except (sqlite3.Error, ServiceError) as e:
+            # The whole batch failed, here or in the inventory service;
+            # report it on every line rather than lose the writer
+            outcomes = [e] * len(sales)
+        for i, outcome in zip(positions, outcomes):
+            if isinstance(outcome, Exception):
+                results[i] = LineResult(batch[i][0], None, str(outcome))
+            else:
+                results[i] = LineResult(batch[i][0], outcome, None)
+
+        accepted = sum(1 for result in results if result.error is None)
+        with self._lock:
+            self._lines += len(batch)
+            self._accepted += accepted
+            self._rejected += len(batch) - accepted
+            self._batches += 1
+            self._latencies.append(time.perf_counter() - started)
+
+        if self.on_results is not None:
+            self.on_results(results)
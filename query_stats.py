@@ -0,0 +1,239 @@
+import contextlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+
+# Statements slower than this (milliseconds, execute plus fetch) are flagged
+SLOW_QUERY_MS = 50.0
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; the
+# last bucket catches everything slower
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Per statement, only the busiest call sites are worth keeping
+MAX_CALL_SITES = 20
+SLOW_LOG_SIZE = 200
+
+# Frames in these files are plumbing; the call site is the first frame
+# outside them
+_PLUMBING = {os.path.abspath(__file__), os.path.abspath(contextlib.__file__)}
+
+
+def add_plumbing(filename):
+    _PLUMBING.add(os.path.abspath(filename))
+
+
+def normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def call_site():
+    # Kept raw here, on the hot path; format_site makes it readable
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename in _PLUMBING:
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return (frame.f_code, frame.f_lineno)
+
+
+def format_site(site):
+    if site is None:
+        return '?'
+    code, line = site
+    return f"{os.path.basename(code.co_filename)}:{line} {code.co_name}"
+
+
+class StatementStats:
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+        self.call_sites = Counter()
+
+    def add(self, ms, rows, site, slow):
+        self.calls += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.rows += rows
+        self.slow += slow
+        self.histogram[bisect_left(BUCKETS_MS, ms)] += 1
+        if site in self.call_sites or len(self.call_sites) < MAX_CALL_SITES:
+            self.call_sites[site] += 1
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of calls
+        wanted = self.calls * fraction
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= wanted:
+                return min(BUCKETS_MS[bucket], self.max) if bucket < len(BUCKETS_MS) else self.max
+        return 0.0
+
+    def as_dict(self):
+        return {
+            'sql': self.sql,
+            'calls': self.calls,
+            'total_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max, 3),
+            'rows': self.rows,
+            'slow': self.slow,
+            'histogram': dict(zip([f'<={bound}' for bound in BUCKETS_MS] + ['>' + str(BUCKETS_MS[-1])],
+                                  self.histogram)),
+            'call_sites': {format_site(site): count for site, count in self.call_sites.most_common()},
+        }
+
+
+class QueryStats:
+    # Collects latency, rows and call sites per SQL statement from every
+    # instrumented connection, whichever thread it runs on
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._started = time.time()
+
+    def record(self, sql, seconds, rows, site):
+        ms = seconds * 1000
+        slow = ms >= self.slow_ms
+        with self._lock:
+            stats = self._statements.get(sql)
+            if stats is None:
+                stats = self._statements[sql] = StatementStats(normalize(sql))
+            stats.add(ms, rows, site, slow)
+            if slow:
+                self._slow.append({'time': time.time(), 'sql': stats.sql, 'ms': round(ms, 3),
+                                   'rows': rows, 'call_site': format_site(site)})
+
+    def statements(self):
+        # Busiest first: total time spent is what a hot path costs
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._statements.values()]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def slow_queries(self):
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+            self._started = time.time()
+
+    def as_dict(self):
+        return {
+            'since': self._started,
+            'exported': time.time(),
+            'slow_ms': self.slow_ms,
+            'statements': self.statements(),
+            'slow_queries': self.slow_queries(),
+        }
+
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times each statement from execute until its rows have been fetched.
+    # Statements without a result set are recorded as soon as they run;
+    # queries when they are fetched with fetchone, fetchmany or fetchall,
+    # when iterating over the cursor runs out of rows, or, if the reader
+    # stops early, when the cursor is closed, reused or freed.
+    _pending = None
+    _rows = 0
+
+    def execute(self, sql, parameters=()):
+        self._finish(self._rows)
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._track(sql, started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish(self._rows)
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._track(sql, started)
+        return self
+
+    def _track(self, sql, started):
+        stats = self.connection.query_stats
+        self._rows = 0
+        if not stats.enabled:
+            self._pending = None
+        elif self.description is None:
+            self._pending = None
+            stats.record(sql, time.perf_counter() - started, max(self.rowcount, 0), call_site())
+        else:
+            self._pending = (sql, started, call_site())
+
+    def _finish(self, rows):
+        if self._pending is not None:
+            sql, started, site = self._pending
+            self._pending = None
+            self.connection.query_stats.record(sql, time.perf_counter() - started, rows, site)
+
+    def __next__(self):
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish(self._rows)
+            raise
+        self._rows += 1
+        return row
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._finish(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._finish(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._finish(len(rows))
+        return rows
+
+    def close(self):
+        self._finish(self._rows)
+        super().close()
+
+    def __del__(self):
+        # A loop that returns half way through leaves the cursor to be freed
+        self._finish(self._rows)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Pass as factory= to sqlite3.connect, then set query_stats
+    query_stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The built-in shortcuts bypass cursor(), so route them through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
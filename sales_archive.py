@@ -0,0 +1,258 @@
+"""Cold storage for old sales.
+
+Closed months of sales are moved out of the database into one Parquet
+file per month, next to the database file (warehouse.db keeps its
+archive in warehouse_archive/). A month is written and fsynced first,
+then deleted from SQLite in one transaction that also records it in
+archived_months, so a crash leaves either the hot rows or the archive in
+charge, never both and never neither.
+
+The running totals keep counting archived sales, and the reports combine
+the hot rows with the archive: see StatsRepository, SalesAnalytics and
+the archived-history pager on the Sales tab. Files are read memory-mapped
+and each month's per-SKU and per-day sums are cached, since an archived
+month never changes.
+
+Needs pyarrow, which is optional; without it nothing is archived and
+databases that have no archive work as before.
+"""
+import os
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timezone
+
+from database import SaleRow, day_label
+
+# Closed months kept in the database, besides the current one
+KEEP_MONTHS = 3
+
+ArchivedMonth = namedtuple('ArchivedMonth', 'month sale_count revenue cost units path')
+ArchiveResult = namedtuple('ArchiveResult', 'months sales')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ArchiveError("Archiving sales requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def month_bounds(month):
+    # 'YYYY-MM' -> ('YYYY-MM-01', first day of the next month), which
+    # bracket date_sold as strings
+    year, number = map(int, month.split('-'))
+    following = date(year + number // 12, number % 12 + 1, 1)
+    return f'{month}-01', following.isoformat()
+
+
+def archive_directory(db_path):
+    return os.path.splitext(os.path.abspath(db_path))[0] + '_archive'
+
+
+def archive_cutoff(keep=KEEP_MONTHS, today=None):
+    # First day of the oldest month that stays in the database. date_sold
+    # is UTC, so the months are counted from the UTC date.
+    today = today or datetime.now(timezone.utc).date()
+    index = today.year * 12 + today.month - 1 - keep
+    return date(index // 12, index % 12 + 1, 1).isoformat()
+
+
+class SalesArchive:
+    OLDEST_SALE = 'SELECT MIN(date_sold) FROM sales'
+    MONTHS = '''SELECT month, sale_count, revenue, cost, units, path
+                FROM archived_months ORDER BY month'''
+    IS_ARCHIVED = 'SELECT 1 FROM archived_months WHERE month = ?'
+    MONTH_SALES = '''SELECT s.id, s.sku_id, s.product_id, k.name, s.quantity, s.sale_price,
+                            s.cost, s.date_sold, s.day
+                     FROM sales s
+                     LEFT JOIN skus k ON k.id = s.sku_id
+                     WHERE s.date_sold >= ? AND s.date_sold < ?
+                     ORDER BY s.id'''
+    MONTH_ALLOCATIONS = '''SELECT a.sale_id, a.lot_id, a.quantity, a.cost_per_unit
+                           FROM sale_allocations a
+                           JOIN sales s ON s.id = a.sale_id
+                           WHERE s.date_sold >= ? AND s.date_sold < ?'''
+    MONTH_CHECK = '''SELECT COUNT(*), COALESCE(MAX(id), 0)
+                     FROM sales WHERE date_sold >= ? AND date_sold < ?'''
+    DELETE_ALLOCATIONS = '''DELETE FROM sale_allocations WHERE sale_id IN
+                            (SELECT id FROM sales WHERE date_sold >= ? AND date_sold < ?)'''
+    DELETE_SALES = 'DELETE FROM sales WHERE date_sold >= ? AND date_sold < ?'
+    RECORD_MONTH = '''INSERT INTO archived_months (month, sale_count, revenue, cost, units, path)
+                      VALUES (?, ?, ?, ?, ?, ?)'''
+    # The delete triggers took the month out of the running totals; the
+    # totals cover archived sales too, so put it back
+    RESTORE_TOTALS = '''UPDATE sales_summary SET revenue = revenue + ?, cost = cost + ?,
+                                                 units = units + ?, sale_count = sale_count + ?
+                        WHERE id = 1'''
+
+    # Parquet columns, in the order MONTH_SALES selects them
+    SALE_COLUMNS = ('id', 'sku_id', 'product_id', 'product_name', 'quantity', 'sale_price',
+                    'cost', 'date_sold', 'day')
+    ALLOCATION_COLUMNS = ('sale_id', 'lot_id', 'quantity', 'cost_per_unit')
+
+    def __init__(self, pool, notify=None):
+        self.pool = pool
+        self.notify = notify or (lambda *tables: None)
+        self.directory = archive_directory(pool.path)
+        self._lock = threading.Lock()
+        # month -> (per-SKU sums, per-day sums); archived months never change
+        self._cache = {}
+
+    def months(self):
+        with self.pool.connection() as conn:
+            return [ArchivedMonth._make(row) for row in conn.execute(self.MONTHS)]
+
+    def closed_months(self, keep=KEEP_MONTHS):
+        # Months with sales in the database that are old enough to archive,
+        # oldest first. Walks the date index one month at a time.
+        cutoff = archive_cutoff(keep)
+        months = []
+        with self.pool.connection() as conn:
+            oldest = conn.execute(self.OLDEST_SALE).fetchone()[0]
+            while oldest is not None and oldest < cutoff:
+                month = oldest[:7]
+                # Sales back-dated into a month already archived stay hot
+                if not conn.execute(self.IS_ARCHIVED, (month,)).fetchone():
+                    months.append(month)
+                oldest = conn.execute('SELECT MIN(date_sold) FROM sales WHERE date_sold >= ?',
+                                      (month_bounds(month)[1],)).fetchone()[0]
+        return months
+
+    def archive_closed(self, keep=KEEP_MONTHS, progress=None):
+        # Archives every closed month older than the last keep, one
+        # transaction each, so other terminals only ever wait for one month
+        months = self.closed_months(keep)
+        total = 0
+        for number, month in enumerate(months, 1):
+            total += self.archive_month(month)
+            if progress is not None:
+                progress((number, len(months), month))
+        if months:
+            self.notify('sales')
+        return ArchiveResult(months, total)
+
+    def archive_month(self, month):
+        # Returns the number of sales moved out of the database
+        pa = require_pyarrow()
+        import pyarrow.parquet as pq
+
+        start, end = month_bounds(month)
+        with self.pool.transaction('DEFERRED') as conn:
+            if conn.execute(self.IS_ARCHIVED, (month,)).fetchone():
+                raise ArchiveError(f"{month} is already archived")
+            sales = conn.execute(self.MONTH_SALES, (start, end)).fetchall()
+            allocations = conn.execute(self.MONTH_ALLOCATIONS, (start, end)).fetchall()
+        if not sales:
+            return 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'sales-{month}.parquet')
+        sales_table = pa.Table.from_pydict(
+            {name: [row[i] for row in sales] for i, name in enumerate(self.SALE_COLUMNS)})
+        allocation_table = pa.Table.from_pydict(
+            {name: [row[i] for row in allocations] for i, name in enumerate(self.ALLOCATION_COLUMNS)},
+            schema=pa.schema([(name, pa.int64()) for name in self.ALLOCATION_COLUMNS[:3]] +
+                             [('cost_per_unit', pa.float64())]))
+        # Allocations go to a sibling file so the sales file stays one flat table
+        self._write(pq, sales_table, path)
+        self._write(pq, allocation_table, os.path.join(self.directory, f'allocations-{month}.parquet'))
+
+        revenue = sum(row[4] * row[5] for row in sales)
+        cost = sum(row[6] for row in sales)
+        units = sum(row[4] for row in sales)
+        with self.pool.transaction() as conn:
+            # A sale dated into the month since it was read would be lost
+            if conn.execute(self.MONTH_CHECK, (start, end)).fetchone() != (len(sales), sales[-1][0]):
+                raise ArchiveError(f"Sales for {month} changed while it was being archived")
+            conn.execute(self.DELETE_ALLOCATIONS, (start, end))
+            conn.execute(self.DELETE_SALES, (start, end))
+            conn.execute(self.RESTORE_TOTALS, (revenue, cost, units, len(sales)))
+            conn.execute(self.RECORD_MONTH, (month, len(sales), revenue, cost, units,
+                                             os.path.basename(path)))
+        return len(sales)
+
+    def _write(self, pq, table, path):
+        # Written aside and renamed into place, so a file that exists is whole
+        temporary = path + '.tmp'
+        pq.write_table(table, temporary, compression='zstd')
+        with open(temporary, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def read(self, month, columns=None):
+        # One month as a pyarrow Table, memory-mapped rather than copied
+        require_pyarrow()
+        import pyarrow.parquet as pq
+        return pq.read_table(os.path.join(self.directory, f'sales-{month}.parquet'),
+                             columns=columns, memory_map=True)
+
+    def sales(self, month):
+        # An archived month as Sales tab rows, newest first
+        table = self.read(month, ['id', 'product_name', 'quantity', 'sale_price', 'cost', 'date_sold'])
+        rows = zip(*(table.column(name).to_pylist() for name in table.column_names))
+        rows = sorted(rows, key=lambda row: (row[5], row[0]), reverse=True)
+        return [SaleRow(sale_id, name, quantity, price, cost / quantity)
+                for sale_id, name, quantity, price, cost, _ in rows]
+
+    def columns(self, month):
+        # (sku_id, day, quantity, revenue, cost) NumPy arrays for one month
+        table = self.read(month, ['sku_id', 'day', 'quantity', 'sale_price', 'cost'])
+        column = lambda name: table.column(name).fill_null(0).to_numpy()
+        quantity = column('quantity')
+        return {'sku_id': column('sku_id'), 'day': column('day'), 'quantity': quantity,
+                'revenue': quantity * column('sale_price'), 'cost': column('cost')}
+
+    def column_lists(self, month):
+        # columns() as plain lists, which the inventory service can send
+        return {name: values.tolist() for name, values in self.columns(month).items()}
+
+    def _sums(self, month):
+        with self._lock:
+            sums = self._cache.get(month)
+        if sums is None:
+            import numpy as np
+            data = self.columns(month)
+            sold = np.bincount(data['sku_id'])
+            revenue = np.bincount(data['sku_id'], weights=data['revenue'])
+            cost = np.bincount(data['sku_id'], weights=data['cost'])
+            by_sku = {int(sku_id): (float(revenue[sku_id]), float(cost[sku_id]))
+                      for sku_id in np.flatnonzero(sold)}
+            base = int(data['day'].min())
+            offsets = data['day'] - base
+            sold = np.bincount(offsets)
+            revenue = np.bincount(offsets, weights=data['revenue'])
+            cost = np.bincount(offsets, weights=data['cost'])
+            by_day = {base + int(offset): (float(revenue[offset]), float(cost[offset]))
+                      for offset in np.flatnonzero(sold)}
+            sums = (by_sku, by_day)
+            with self._lock:
+                self._cache[month] = sums
+        return sums
+
+    def by_sku(self):
+        # {sku_id: (revenue, cost)} over every archived month
+        totals = {}
+        for month in self.months():
+            for sku_id, (revenue, cost) in self._sums(month.month)[0].items():
+                before = totals.get(sku_id, (0.0, 0.0))
+                totals[sku_id] = (before[0] + revenue, before[1] + cost)
+        return totals
+
+    def daily(self, start, end):
+        # {day: (revenue, cost)} for archived sales from day start to day
+        # end inclusive, in days since 1970-01-01
+        first, last = day_label(start)[:7], day_label(end)[:7]
+        totals = {}
+        for month in self.months():
+            if not first <= month.month <= last:
+                continue
+            for day, sums in self._sums(month.month)[1].items():
+                if start <= day <= end:
+                    totals[day] = sums
+        return totals
@@ -1,17 +1,36 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-                           QTableWidget, QTableWidgetItem, QLabel, QComboBox,
-                           QSpinBox, QDoubleSpinBox, QMessageBox)
-from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve
-from PyQt6.QtGui import QFont, QColor, QPalette
-import sqlite3
-from datetime import datetime
+                           QTableView, QAbstractItemView, QLabel, QLineEdit,
+                           QCompleter, QSpinBox, QDoubleSpinBox, QMessageBox)
+from PyQt6.QtCore import Qt, QTimer, QModelIndex
+from database import get_database, InsufficientStockError
+from change_bus import get_change_bus
+from sku_cache import get_sku_cache
+from models import ProductSearchModel, SaleTableModel, product_label
 
 class SalesTab(QWidget):
+    # Wait this long after the last keystroke before searching, and show
+    # at most this many matches
+    SEARCH_DELAY = 150
+    SEARCH_LIMIT = 20
+
     def __init__(self):
         super().__init__()
+        self.db = get_database()
+        self.cache = get_sku_cache()
+        self.selected_product = None
+        # Archived months not shown yet, newest first
+        self.archived_months = None
+        # Oldest sale in the database when the table was loaded
+        self.oldest_sale_id = None
         self.init_ui()
-        self.setup_database()
-        self.load_data()
+        self.stale = False
+        
+        # Load after the tab has been painted once
+        QTimer.singleShot(0, self.load_data)
+        
+        # Refresh when products or sales change, here or on another terminal
+        self.cache.subscribe(lambda skus: self.update_product_list())
+        get_change_bus().subscribe(['sales'], self.on_sales_changed)
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -49,10 +68,13 @@ class SalesTab(QWidget):
         product_label.setStyleSheet("color: white; font-size: 14px;")
         form_layout.addWidget(product_label)
         
-        self.product_combo = QComboBox()
-        self.product_combo.setMinimumWidth(300)
-        self.product_combo.setStyleSheet("""
-            QComboBox {
+        # Type-ahead search: the completer only ever holds the top matches,
+        # fetched from the full-text index once typing pauses
+        self.product_search = QLineEdit()
+        self.product_search.setPlaceholderText("Type to search products...")
+        self.product_search.setMinimumWidth(300)
+        self.product_search.setStyleSheet("""
+            QLineEdit {
                 background-color: #2c3e50;
                 border: 1px solid #3498db;
                 border-radius: 5px;
@@ -60,15 +82,23 @@ class SalesTab(QWidget):
                 color: white;
                 font-size: 14px;
             }
-            QComboBox::drop-down {
-                border: none;
-                width: 20px;
-            }
-            QComboBox::down-arrow {
-                image: none;
+            QLineEdit:focus {
+                border: 1px solid #2980b9;
             }
         """)
-        form_layout.addWidget(self.product_combo)
+        self.search_model = ProductSearchModel(self)
+        self.completer = QCompleter(self.search_model, self)
+        self.completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.completer.setMaxVisibleItems(10)
+        self.completer.activated[QModelIndex].connect(self.select_product)
+        self.product_search.setCompleter(self.completer)
+        self.product_search.textEdited.connect(self.schedule_search)
+        form_layout.addWidget(self.product_search)
+        
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.search_products)
         
         # Quantity with modern styling
         quantity_label = QLabel("Quantity:")
@@ -147,18 +177,20 @@ class SalesTab(QWidget):
                 background-color: #2980b9;
             }
         """)
-        refresh_btn.clicked.connect(self.update_product_list)
+        refresh_btn.clicked.connect(self.cache.sync)
         form_layout.addWidget(refresh_btn)
         
         layout.addWidget(form_card)
         
-        # Table with modern styling
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(["ID", "Product Name", "Quantity", "Sale Price", "Total Revenue", "Profit"])
+        # Table with modern styling; the model pages sales in as it scrolls
+        self.model = SaleTableModel(self.db, self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setVisible(False)
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: #34495e;
                 border: none;
                 border-radius: 10px;
@@ -166,7 +198,7 @@ class SalesTab(QWidget):
                 color: white;
                 font-size: 14px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 5px;
             }
             QHeaderView::section {
@@ -179,119 +211,134 @@ class SalesTab(QWidget):
         """)
         layout.addWidget(self.table)
         
-        # Update product list
-        self.update_product_list()
+        # Older sales live in the archive; page them in a month at a time
+        self.archive_btn = QPushButton("Show Archived Month")
+        self.archive_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #3498db;
+                color: white;
+                border: none;
+                border-radius: 5px;
+                padding: 8px 15px;
+                font-size: 14px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #2980b9;
+            }
+            QPushButton:disabled {
+                background-color: #7f8c8d;
+            }
+        """)
+        self.archive_btn.clicked.connect(self.show_archived_month)
+        layout.addWidget(self.archive_btn)
+
+    def schedule_search(self, text):
+        # Editing the text drops the previous pick; restart the debounce
+        self.selected_product = None
+        self.search_timer.start()
 
-    def setup_database(self):
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS sales
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     product_id INTEGER NOT NULL,
-                     quantity INTEGER NOT NULL,
-                     sale_price REAL NOT NULL,
-                     date_sold TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                     FOREIGN KEY (product_id) REFERENCES products (id))''')
-        conn.commit()
-        conn.close()
+    def search_products(self):
+        products = self.db.skus.search_available(self.product_search.text(), self.SEARCH_LIMIT)
+        self.search_model.set_products(products)
+        if products and self.product_search.hasFocus():
+            self.completer.complete()
+
+    def select_product(self, index):
+        self.selected_product = index.data(Qt.ItemDataRole.UserRole)
+        self.product_search.setText(product_label(self.selected_product))
 
     def update_product_list(self):
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        
-        # Debug: Print all products first
-        c.execute('SELECT id, name, quantity, has_arrived FROM products')
-        all_products = c.fetchall()
-        print("All products in database:", all_products)
-        
-        # Now get only available products
-        c.execute('''SELECT id, name, quantity, cost_per_unit 
-                    FROM products 
-                    WHERE quantity > 0 AND has_arrived = 1''')
-        products = c.fetchall()
-        print("Available products for sale:", products)
-        
-        conn.close()
-        
-        self.product_combo.clear()
-        if not products:
-            self.product_combo.addItem("No products available")
-            self.product_combo.setEnabled(False)
+        # Stock moved: refresh the picked product, and the open matches.
+        # The cache has just re-read whatever changed.
+        if self.completer.popup().isVisible():
+            self.search_products()
+        if self.selected_product is None:
             return
-            
-        self.product_combo.setEnabled(True)
-        self.product_data = {}
-        for p in products:
-            display_text = f"{p[1]} (Stock: {p[2]}, Cost: ${p[3]:.2f})"
-            self.product_data[display_text] = p
-            self.product_combo.addItem(display_text)
+        sku = self.cache.get(self.selected_product.id)
+        if sku is None or sku.quantity <= 0:
+            self.selected_product = None
+            self.product_search.clear()
+            return
+        self.selected_product = self.selected_product._replace(
+            quantity=sku.quantity, cost_per_unit=sku.stock_value / sku.quantity)
+        self.product_search.setText(product_label(self.selected_product))
 
     def record_sale(self):
-        if not self.product_combo.isEnabled() or self.product_combo.currentText() == "No products available":
-            QMessageBox.warning(self, "Error", "No products available for sale")
-            return
-            
-        product_key = self.product_combo.currentText()
-        if product_key not in self.product_data:
-            QMessageBox.warning(self, "Error", "Please select a valid product")
+        product = self.selected_product
+        if product is None:
+            QMessageBox.warning(self, "Error", "Please search for a product and select it from the list")
             return
             
-        product = self.product_data[product_key]
         quantity = self.quantity_input.value()
         
-        # Verify stock again
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        c.execute('SELECT quantity FROM products WHERE id = ?', (product[0],))
-        current_stock = c.fetchone()[0]
-        
-        if quantity > current_stock:
-            conn.close()
-            QMessageBox.warning(self, "Error", f"Not enough stock available. Current stock: {current_stock}")
-            return
-            
         sale_price = self.price_input.value()
         
-        # Record the sale
-        c.execute('''INSERT INTO sales (product_id, quantity, sale_price)
-                    VALUES (?, ?, ?)''', (product[0], quantity, sale_price))
-        
-        # Update product quantity
-        c.execute('''UPDATE products 
-                    SET quantity = quantity - ? 
-                    WHERE id = ?''', (quantity, product[0]))
+        # Turn away what the cached stock already rules out without a round
+        # trip; the cache may trail another terminal's delivery by a poll,
+        # so catch up once before saying no
+        sku = self.cache.get(product.id)
+        if sku is not None and quantity > sku.quantity:
+            self.cache.sync()
+            sku = self.cache.get(product.id)
+        if sku is not None and quantity > sku.quantity:
+            QMessageBox.warning(self, "Error", f"Not enough stock available. Current stock: {sku.quantity}")
+            return
         
-        conn.commit()
-        conn.close()
+        # Record the sale and update product quantity in one transaction;
+        # the stock check happens inside it so concurrent terminals cannot oversell
+        try:
+            self.db.sales.record(product.id, quantity, sale_price)
+        except InsufficientStockError as e:
+            QMessageBox.warning(self, "Error", f"Not enough stock available. Current stock: {e.available}")
+            return
         
-        self.load_data()
-        self.update_product_list()
+        # The change bus refreshes the sales table and product list
         self.clear_inputs()
         
         QMessageBox.information(self, "Success", "Sale recorded successfully!")
 
+    def show_archived_month(self):
+        if self.archived_months is None:
+            self.archived_months = [month.month for month in reversed(self.db.archive.months())]
+        if self.archived_months:
+            month = self.archived_months.pop(0)
+            # Older than everything shown, so they go at the bottom
+            self.model.add_archived(self.db.archive.sales(month))
+        if not self.archived_months:
+            self.archive_btn.setText("No Older Sales")
+            self.archive_btn.setEnabled(False)
+
+    def on_sales_changed(self):
+        # Nobody is looking at a hidden table; catch up when it is shown
+        if self.isVisible():
+            self.add_new_sales()
+        else:
+            self.stale = True
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.stale:
+            self.stale = False
+            self.add_new_sales()
+
+    def add_new_sales(self):
+        # New sales only ever arrive at the top. Archiving takes the oldest
+        # away instead, and then the table is rebuilt.
+        if self.db.sales.oldest_id() != self.oldest_sale_id:
+            self.load_data()
+            return
+        self.model.add_new(self.db.sales.list_after(self.model.newest_id()))
+
     def load_data(self):
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        c.execute('''
-            SELECT s.id, p.name, s.quantity, s.sale_price, p.cost_per_unit
-            FROM sales s
-            JOIN products p ON s.product_id = p.id
-            ORDER BY s.date_sold DESC
-        ''')
-        sales = c.fetchall()
-        conn.close()
-        
-        self.table.setRowCount(len(sales))
-        for i, sale in enumerate(sales):
-            self.table.setItem(i, 0, QTableWidgetItem(str(sale[0])))
-            self.table.setItem(i, 1, QTableWidgetItem(sale[1]))
-            self.table.setItem(i, 2, QTableWidgetItem(str(sale[2])))
-            self.table.setItem(i, 3, QTableWidgetItem(f"${sale[3]:.2f}"))
-            total_revenue = sale[2] * sale[3]
-            self.table.setItem(i, 4, QTableWidgetItem(f"${total_revenue:.2f}"))
-            profit = total_revenue - (sale[2] * sale[4])
-            self.table.setItem(i, 5, QTableWidgetItem(f"${profit:.2f}"))
+        # Read the oldest id first: a month archived after this point is
+        # caught by the next change instead of being missed. The archived
+        # months are listed afresh, since that month is one of them now.
+        self.oldest_sale_id = self.db.sales.oldest_id()
+        self.archived_months = None
+        self.archive_btn.setText("Show Archived Month")
+        self.archive_btn.setEnabled(True)
+        self.model.reload()
 
     def clear_inputs(self):
         self.quantity_input.setValue(1)
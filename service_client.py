@@ -0,0 +1,214 @@
+import json
+import socket
+import threading
+import time
+
+from database import (InsufficientStockError, Product, ProductVersion, ProductChanges, Sku,
+                      SkuChanges, AvailableSku, SaleRow, Totals, SummaryCheck, DailyProfit,
+                      DayProfit, ProductProfit)
+from sales_archive import ArchivedMonth
+from query_stats import QueryStats, call_site, add_plumbing
+
+# Seconds to wait for the service to answer before giving up
+CALL_TIMEOUT = 30.0
+
+add_plumbing(__file__)
+
+
+def rows_of(row_type):
+    return lambda rows: [row_type._make(row) for row in rows]
+
+
+def one_of(row_type):
+    return lambda row: None if row is None else row_type._make(row)
+
+
+def changes(value):
+    if value is None:
+        return None
+    version, products, removed_ids = value
+    return ProductChanges(ProductVersion._make(version), rows_of(Product)(products), removed_ids)
+
+
+def sku_changes(value):
+    if value is None:
+        return None
+    version, skus = value
+    return SkuChanges(ProductVersion._make(version), rows_of(Sku)(skus))
+
+
+def summary_check(value):
+    stored, recomputed, consistent = value
+    return SummaryCheck(Totals._make(stored), Totals._make(recomputed), consistent)
+
+
+def sale_results(results):
+    return [decode_error(item['error']) if isinstance(item, dict) else item for item in results]
+
+
+def table_versions(versions):
+    # JSON turns the version tuples into lists; compare like for like
+    return {table: tuple(version) for table, version in versions.items()}
+
+
+# Turns JSON results back into the namedtuples the local repositories return
+DECODERS = {
+    'products.get': one_of(Product),
+    'products.latest_change': one_of(ProductVersion),
+    'products.changes_since': changes,
+    'skus.page_in_stock': rows_of(Sku),
+    'skus.search_available': rows_of(AvailableSku),
+    'skus.get': one_of(Sku),
+    'skus.latest_change': one_of(ProductVersion),
+    'skus.changes_since': sku_changes,
+    'sales.page': rows_of(SaleRow),
+    'sales.list_after': rows_of(SaleRow),
+    'sales.record_many': sale_results,
+    'stats.totals': one_of(Totals),
+    'stats.check_summary': summary_check,
+    'stats.daily_profit': rows_of(DailyProfit),
+    'stats.profit_series': rows_of(DailyProfit),
+    'stats.day_profit': rows_of(DayProfit),
+    'stats.top_products': rows_of(ProductProfit),
+    'archive.months': rows_of(ArchivedMonth),
+    'archive.sales': rows_of(SaleRow),
+    'db.table_versions': table_versions,
+}
+
+
+class ServiceError(Exception):
+    pass
+
+
+def decode_error(error):
+    if error['type'] == 'InsufficientStockError':
+        return InsufficientStockError(error['sku_id'], error['requested'], error['available'])
+    return ServiceError(f"{error['type']}: {error['message']}")
+
+
+class ServiceClient:
+    # One connection shared by every thread of the process. Calls block the
+    # calling thread until their answer arrives; a reader thread matches
+    # answers to calls by id and hands change events to listeners.
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self.sock.makefile('rb')
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._next_id = 0
+        self._listeners = []
+        self._closed = False
+        threading.Thread(target=self._read, name='service-client', daemon=True).start()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def call(self, method, *args, **kwargs):
+        slot = [threading.Event(), None]
+        with self._send_lock:
+            # Once the reader has stopped nothing would ever answer
+            if self._closed:
+                raise ServiceError("Connection to the inventory service was lost")
+            self._next_id += 1
+            request_id = self._next_id
+            self._pending[request_id] = slot
+            message = {'id': request_id, 'method': method, 'args': args, 'kwargs': kwargs}
+            try:
+                self.sock.sendall(json.dumps(message).encode() + b'\n')
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                raise ServiceError(f"Could not reach the inventory service: {e}")
+        if not slot[0].wait(CALL_TIMEOUT):
+            self._pending.pop(request_id, None)
+            raise ServiceError(f"{method} timed out")
+        response = slot[1]
+        if response is None:
+            raise ServiceError("Connection to the inventory service was lost")
+        if 'error' in response:
+            raise decode_error(response['error'])
+        return response['result']
+
+    def _read(self):
+        try:
+            for line in self._file:
+                message = json.loads(line)
+                if 'event' in message:
+                    for callback in list(self._listeners):
+                        callback(tuple(message['tables']))
+                    continue
+                slot = self._pending.pop(message.get('id'), None)
+                if slot is not None:
+                    slot[1] = message
+                    slot[0].set()
+        except (OSError, ValueError):
+            pass
+        finally:
+            # Wake every caller still waiting; they will see no response.
+            # Under the send lock, so no call can slip in afterwards.
+            with self._send_lock:
+                self._closed = True
+                for slot in list(self._pending.values()):
+                    slot[0].set()
+                self._pending.clear()
+
+    def close(self):
+        with self._send_lock:
+            self._closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class RemoteRepository:
+    def __init__(self, db, name):
+        self._db = db
+        self._name = name
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('_'):
+            raise AttributeError(attribute)
+        method = f'{self._name}.{attribute}'
+        return lambda *args, **kwargs: self._db.call(method, *args, **kwargs)
+
+
+class RemoteDatabase:
+    # Stands in for Database when the tabs are clients of the inventory
+    # service: the same repositories, listeners and table versions, with
+    # every call timed in query_stats under the method name
+    remote = True
+
+    def __init__(self, host, port):
+        self.client = ServiceClient(host, port)
+        self.query_stats = QueryStats()
+        self.products = RemoteRepository(self, 'products')
+        self.skus = RemoteRepository(self, 'skus')
+        self.sales = RemoteRepository(self, 'sales')
+        self.stats = RemoteRepository(self, 'stats')
+        self.archive = RemoteRepository(self, 'archive')
+
+    def call(self, method, *args, **kwargs):
+        started = time.perf_counter()
+        result = self.client.call(method, *args, **kwargs)
+        decoder = DECODERS.get(method)
+        if decoder is not None:
+            result = decoder(result)
+        if self.query_stats.enabled:
+            rows = len(result) if isinstance(result, list) else 1
+            self.query_stats.record(method, time.perf_counter() - started, rows, call_site())
+        return result
+
+    def add_listener(self, callback):
+        # The service announces every commit, from any terminal
+        self.client.add_listener(callback)
+
+    def notify(self, *tables):
+        self.call('db.notify', *tables)
+
+    def table_versions(self):
+        return self.call('db.table_versions')
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+from database import get_database
+from change_bus import get_change_bus
+
+
+class SkuCache:
+    # The session's copy of SKU rows by id, shared by the tabs so the
+    # product picker, the stock check and the warehouse table stop issuing
+    # their own queries for the same rows. Bounded, least recently used
+    # first out. Kept current through the products change log: each sync
+    # re-reads only the SKUs whose lots changed since the version it last
+    # saw, then hands those rows to the subscribed tabs. Used on the UI
+    # thread only, like the change bus that drives it.
+    CAPACITY = 5000
+    # More changed SKUs than this in one sync (a bulk import) and the
+    # cache starts over instead
+    CHANGE_LIMIT = 1000
+
+    def __init__(self, db, capacity=CAPACITY):
+        self.db = db
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._rows = OrderedDict()
+        self._subscribers = []
+        self.version = db.skus.latest_change()
+
+    def subscribe(self, callback):
+        # callback(skus) gets the changed Sku rows, or None when too much
+        # changed and everything shown should be reloaded
+        self._subscribers.append(callback)
+
+    def get(self, sku_id):
+        sku = self._rows.get(sku_id)
+        if sku is not None:
+            self.hits += 1
+            self._rows.move_to_end(sku_id)
+            return sku
+        self.misses += 1
+        sku = self.db.skus.get(sku_id)
+        if sku is not None:
+            self.put(sku)
+        return sku
+
+    def put(self, sku):
+        self._rows[sku.id] = sku
+        self._rows.move_to_end(sku.id)
+        if len(self._rows) > self.capacity:
+            self._rows.popitem(last=False)
+
+    def put_many(self, skus):
+        # Rows read for some other reason (a table page) are cached on the way
+        for sku in skus:
+            self.put(sku)
+
+    def sync(self):
+        changes = self.db.skus.changes_since(self.version, limit=self.CHANGE_LIMIT)
+        if changes is None:
+            self._rows.clear()
+            self.version = self.db.skus.latest_change()
+            self._publish(None)
+            return
+        if changes.version == self.version:
+            return
+        self.version = changes.version
+        # Changed rows replace what was cached; they are read anyway, so
+        # new SKUs go in too
+        self.put_many(changes.skus)
+        self._publish(changes.skus)
+
+    def _publish(self, skus):
+        for callback in self._subscribers:
+            callback(skus)
+
+
+_sku_cache = None
+
+
+def get_sku_cache():
+    # Created lazily on the UI thread and shared by every tab
+    global _sku_cache
+    if _sku_cache is None:
+        _sku_cache = SkuCache(get_database())
+        get_change_bus().subscribe(['products'], _sku_cache.sync)
+    return _sku_cache
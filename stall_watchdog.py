@@ -0,0 +1,213 @@
+"""UI stall watchdog.
+
+A timer on the UI thread beats every HEARTBEAT_MS. A helper thread
+watches the beats: while none has come for two intervals it samples the
+UI thread's Python stack every SAMPLE_MS. Once a gap passes STALL_MS it
+goes to a rotating log, while it is still going on, so a UI that never
+recovers is on record too. Each entry names the slot that was running
+(the outermost Python frame under the event loop), the line seen most
+often in the samples and the stack of that sample. When the event loop
+gets going again, a second entry gives the full length and the samples
+of the whole stall. Per-slot totals rank the worst offenders; the
+diagnostics panel shows them and they are written to the log on exit.
+
+A modal dialog runs its own event loop, so the beats go on while one is
+open; a slot that stalls underneath it is attributed to the code that
+opened the dialog.
+"""
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+
+from PyQt6.QtCore import QObject, QTimer
+
+HEARTBEAT_MS = 50
+SAMPLE_MS = 10
+# Gaps between beats longer than this are stalls
+STALL_MS = 250
+
+STALL_LOG = 'ui_stalls.log'
+LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+# Recent stalls kept in memory for the diagnostics panel
+RECENT_STALLS = 100
+
+Stall = namedtuple('Stall', 'started ms slot hottest samples stack')
+SlotStalls = namedtuple('SlotStalls', 'slot stalls total_ms max_ms hottest')
+
+# Time spent in Qt with no Python frame running: painting, layout, style
+EVENT_LOOP = '(event loop)'
+
+
+def sample_stack(thread_id):
+    # (filename, line, function) from the outermost frame in
+    frame = sys._current_frames().get(thread_id)
+    stack = []
+    while frame is not None:
+        stack.append((frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def slot_of(stack):
+    # The first frame past the script's top level, which is where Qt
+    # called into Python
+    for filename, _, function in stack:
+        if function != '<module>':
+            return f"{os.path.basename(filename)} {function}"
+    return EVENT_LOOP
+
+
+def format_time(timestamp):
+    # Matches the two log entries of one stall
+    return time.strftime('%H:%M:%S', time.localtime(timestamp)) + f'.{int(timestamp * 1000) % 1000:03d}'
+
+
+def format_frame(frame):
+    filename, line, function = frame
+    return f"{os.path.basename(filename)}:{line} {function}"
+
+
+def stall_logger(path=STALL_LOG):
+    logger = logging.getLogger('wms.stalls')
+    if not logger.handlers:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_BYTES,
+                                                       backupCount=LOG_BACKUPS, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+class StallWatchdog(QObject):
+    def __init__(self, stall_ms=STALL_MS, log_path=STALL_LOG, parent=None):
+        super().__init__(parent)
+        self.stall_ms = stall_ms
+        self.log = stall_logger(log_path)
+        self.recent = []
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._ui_thread = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stopped = threading.Event()
+        self._helper = threading.Thread(target=self._watch, name='stall-watchdog', daemon=True)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(HEARTBEAT_MS)
+        self._timer.timeout.connect(self._beat)
+
+    def start(self):
+        # Call on the UI thread
+        self._ui_thread = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._timer.start()
+        self._helper.start()
+        return self
+
+    def stop(self):
+        self._timer.stop()
+        self._stopped.set()
+        self.write_summary()
+
+    def _beat(self):
+        self._last_beat = time.perf_counter()
+
+    def _watch(self):
+        samples = Counter()
+        beat = self._last_beat
+        logged = False
+        while not self._stopped.wait(SAMPLE_MS / 1000):
+            last_beat = self._last_beat
+            if last_beat != beat:
+                # The loop is running again; the gap is the stall
+                if samples:
+                    gap_ms = (last_beat - beat) * 1000
+                    if gap_ms >= self.stall_ms:
+                        self._record(beat, gap_ms, samples)
+                    samples = Counter()
+                beat = last_beat
+                logged = False
+                continue
+            waited_ms = (time.perf_counter() - beat) * 1000
+            if waited_ms > 2 * HEARTBEAT_MS:
+                samples[sample_stack(self._ui_thread)] += 1
+                if not logged and waited_ms >= self.stall_ms:
+                    self._log_ongoing(beat, waited_ms, samples)
+                    logged = True
+
+    def _summarize(self, beat, ms, samples):
+        # The slot with most samples wins, and within the stall the line
+        # sampled most often is where the time went
+        slots = Counter()
+        lines = Counter()
+        for stack, count in samples.items():
+            slots[slot_of(stack)] += count
+            if stack:
+                lines[stack[-1]] += count
+        slot = slots.most_common(1)[0][0]
+        hottest = format_frame(lines.most_common(1)[0][0]) if lines else EVENT_LOOP
+        stack = max(samples, key=samples.get)
+        started = time.time() - (time.perf_counter() - beat)
+        return Stall(started, ms, slot, hottest, sum(samples.values()),
+                     [format_frame(frame) for frame in stack])
+
+    def _log_ongoing(self, beat, ms, samples):
+        stall = self._summarize(beat, ms, samples)
+        self.log.info("stall since %s still going after %.0f ms in %s (%d samples), hottest %s\n    %s",
+                      format_time(stall.started), ms, stall.slot, stall.samples, stall.hottest,
+                      '\n    '.join(stall.stack))
+
+    def _record(self, beat, ms, samples):
+        stall = self._summarize(beat, ms, samples)
+        slot, hottest = stall.slot, stall.hottest
+
+        with self._lock:
+            self.recent.append(stall)
+            del self.recent[:-RECENT_STALLS]
+            # [stalls, total ms, worst ms, hottest line of the worst one]
+            totals = self._slots.setdefault(slot, [0, 0.0, 0.0, hottest])
+            totals[0] += 1
+            totals[1] += ms
+            if ms >= totals[2]:
+                totals[2] = ms
+                totals[3] = hottest
+        self.log.info("stall since %s ended after %.0f ms in %s (%d samples), hottest %s\n    %s",
+                      format_time(stall.started), ms, slot, stall.samples, hottest,
+                      '\n    '.join(stall.stack))
+
+    def worst(self, limit=10):
+        # SlotStalls for the slots that stalled longest in total
+        with self._lock:
+            slots = [SlotStalls(slot, *values) for slot, values in self._slots.items()]
+        slots.sort(key=lambda row: row.total_ms, reverse=True)
+        return slots[:limit]
+
+    def write_summary(self):
+        worst = self.worst()
+        if not worst:
+            return
+        lines = [f"{row.slot}: {row.stalls} stalls, {row.total_ms:.0f} ms total, "
+                 f"{row.max_ms:.0f} ms worst, hottest {row.hottest}" for row in worst]
+        self.log.info("worst offenders\n    %s", '\n    '.join(lines))
+
+
+_watchdog = None
+
+
+def start_watchdog(**kwargs):
+    # One per process, started on the UI thread once the window is up
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = StallWatchdog(**kwargs).start()
+    return _watchdog
+
+
+def get_watchdog():
+    return _watchdog
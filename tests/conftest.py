@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The application modules sit at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'warehouse.db'))
+    yield database
+    database.close()
+
+
+def sku_of(db, product_id):
+    with db.pool.connection() as conn:
+        return conn.execute('SELECT sku_id FROM products WHERE id = ?', (product_id,)).fetchone()[0]
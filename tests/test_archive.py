@@ -0,0 +1,62 @@
+from datetime import date
+
+import pytest
+
+from conftest import sku_of
+from database import EPOCH
+
+pytest.importorskip('pyarrow')
+
+MONTH = '2020-01'
+DAY = (date(2020, 1, 15) - EPOCH).days
+
+
+@pytest.fixture
+def history(db):
+    # Four sales of two SKUs, the first three back-dated into MONTH
+    widget = sku_of(db, db.products.add('Widget', 10, 1.0, True))
+    gadget = sku_of(db, db.products.add('Gadget', 10, 2.0, True))
+    ids = db.sales.record_many([(widget, 2, 5.0), (gadget, 1, 9.0), (widget, 3, 4.0), (gadget, 4, 3.0)])
+    with db.pool.transaction() as conn:
+        conn.executemany("UPDATE sales SET date_sold = '2020-01-15 12:00:00', day = ? WHERE id = ?",
+                         [(DAY, sale_id) for sale_id in ids[:3]])
+    return ids
+
+
+def test_archiving_keeps_the_totals(db, history):
+    before = db.stats.totals()
+    top = db.stats.top_products()
+
+    result = db.archive.archive_closed()
+
+    assert result.months == [MONTH]
+    assert result.sales == 3
+    assert db.sales.oldest_id() == history[3]
+    assert db.stats.totals() == pytest.approx(before)
+    assert db.stats.check_summary().consistent
+    assert [(row.name, pytest.approx(row.revenue), pytest.approx(row.cost))
+            for row in db.stats.top_products()] == top
+
+
+def test_archived_days_still_count(db, history):
+    db.archive.archive_closed()
+
+    day = db.stats.day_profit(DAY, DAY)
+    assert len(day) == 1
+    assert day[0].revenue == pytest.approx(2 * 5.0 + 1 * 9.0 + 3 * 4.0)
+    assert day[0].cost == pytest.approx(2 * 1.0 + 1 * 2.0 + 3 * 1.0)
+
+
+def test_archived_month_lists_its_sales(db, history):
+    db.archive.archive_closed()
+
+    (month,) = db.archive.months()
+    assert (month.month, month.sale_count, month.units) == (MONTH, 3, 6)
+    assert sorted(sale.id for sale in db.archive.sales(MONTH)) == history[:3]
+
+
+def test_rebuild_counts_archived_months(db, history):
+    db.archive.archive_closed()
+    before = db.stats.totals()
+
+    assert db.stats.rebuild_summary() == pytest.approx(before)
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+from backup import (BackupError, backup_database, release_free_pages, restore_database,
+                    quick_check)
+from conftest import sku_of
+from database import ConnectionPool
+
+
+def sale_ids(db):
+    with db.pool.connection() as conn:
+        return [row[0] for row in conn.execute('SELECT id FROM sales ORDER BY id')]
+
+
+@pytest.fixture
+def stocked(db):
+    sku_id = sku_of(db, db.products.add('Widget', 100, 1.0, True))
+    db.sales.record_many([(sku_id, 2, 5.0)] * 10)
+    return sku_id
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_restore_puts_the_backup_back(db, stocked, tmp_path, compact):
+    destination = str(tmp_path / 'copy.db')
+    result = backup_database(db.pool, destination, compact=compact)
+    saved = sale_ids(db)
+    totals = db.stats.totals()
+
+    db.sales.record(stocked, 5, 5.0)
+    restore_database(db.pool, destination)
+
+    assert result.bytes > 0
+    assert sale_ids(db) == saved
+    assert db.stats.totals() == pytest.approx(totals)
+    assert db.skus.get(stocked).quantity == 80
+    assert db.stats.check_summary().consistent
+
+
+def test_backup_is_a_single_file(db, stocked, tmp_path):
+    destination = str(tmp_path / 'copy.db')
+    backup_database(db.pool, destination)
+
+    conn = sqlite3.connect(destination)
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    finally:
+        conn.close()
+
+
+def test_backup_carries_archived_months(db, stocked, tmp_path):
+    pytest.importorskip('pyarrow')
+    with db.pool.transaction() as conn:
+        conn.execute("UPDATE sales SET date_sold = '2020-01-15 12:00:00' WHERE id <= 4")
+    db.archive.archive_closed()
+    destination = str(tmp_path / 'backups' / 'copy.db')
+    result = backup_database(db.pool, destination)
+    for path in (tmp_path / 'warehouse_archive').iterdir():
+        path.unlink()
+
+    restore_database(db.pool, destination)
+
+    assert result.archive_files == 2
+    assert len(db.archive.sales('2020-01')) == 4
+
+
+def test_damaged_backup_is_refused(db, tmp_path):
+    damaged = tmp_path / 'damaged.db'
+    damaged.write_bytes(b'not a database' * 1000)
+
+    with pytest.raises(BackupError):
+        quick_check(str(damaged))
+    with pytest.raises(BackupError):
+        restore_database(db.pool, str(damaged))
+    with pytest.raises(BackupError):
+        restore_database(db.pool, str(tmp_path / 'missing.db'))
+
+
+def test_free_pages_are_released(db):
+    db.products.add_many([(f'Item {i}', 5, 1.0, True) for i in range(5000)])
+    with db.pool.transaction() as conn:
+        conn.execute('DELETE FROM products')
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+    released = release_free_pages(db.pool, pages=10)
+
+    assert released == free > 10
+    with db.pool.connection() as conn:
+        assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_release_needs_incremental_vacuum(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE t (x)')
+    conn.close()
+    pool = ConnectionPool(path)
+    try:
+        assert release_free_pages(pool) is None
+    finally:
+        pool.close()
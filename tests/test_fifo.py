@@ -0,0 +1,77 @@
+import pytest
+
+from conftest import sku_of
+from database import InsufficientStockError
+
+
+def lot_quantities(db, sku_id):
+    with db.pool.connection() as conn:
+        return conn.execute('SELECT quantity FROM products WHERE sku_id = ? ORDER BY id',
+                            (sku_id,)).fetchall()
+
+
+def test_sale_draws_on_the_oldest_lots_first(db):
+    first = db.products.add('Widget', 5, 1.0, True)
+    db.products.add('Widget', 5, 2.0, True)
+    sku_id = sku_of(db, first)
+
+    sale_id = db.sales.record(sku_id, 7, 10.0)
+
+    assert lot_quantities(db, sku_id) == [(0,), (3,)]
+    with db.pool.connection() as conn:
+        allocations = conn.execute('SELECT quantity, cost_per_unit FROM sale_allocations '
+                                   'WHERE sale_id = ? ORDER BY lot_id', (sale_id,)).fetchall()
+        cost = conn.execute('SELECT cost FROM sales WHERE id = ?', (sale_id,)).fetchone()[0]
+    assert allocations == [(5, 1.0), (2, 2.0)]
+    assert cost == pytest.approx(5 * 1.0 + 2 * 2.0)
+
+
+def test_sale_keeps_its_cost_when_a_lot_is_repriced(db):
+    lot = db.products.add('Widget', 4, 3.0, True)
+    sku_id = sku_of(db, lot)
+    db.sales.record(sku_id, 2, 5.0)
+    with db.pool.transaction() as conn:
+        conn.execute('UPDATE products SET cost_per_unit = 9.0 WHERE id = ?', (lot,))
+
+    assert db.stats.totals().cost == pytest.approx(6.0)
+
+
+def test_pending_lots_are_not_sold(db):
+    arrived = db.products.add('Widget', 2, 1.0, True)
+    db.products.add('Widget', 5, 3.0, False)
+    sku_id = sku_of(db, arrived)
+
+    with pytest.raises(InsufficientStockError) as error:
+        db.sales.record(sku_id, 3, 10.0)
+
+    assert error.value.available == 2
+    assert lot_quantities(db, sku_id) == [(2,), (5,)]
+    assert db.sales.oldest_id() is None
+
+
+@pytest.mark.parametrize('quantity, price', [(0, 1.0), (-1, 1.0), (1, -0.5)])
+def test_invalid_sales_are_rejected(db, quantity, price):
+    sku_id = sku_of(db, db.products.add('Widget', 5, 1.0, True))
+
+    with pytest.raises(ValueError):
+        db.sales.record(sku_id, quantity, price)
+
+    assert lot_quantities(db, sku_id) == [(5,)]
+
+
+def test_sku_stock_follows_its_lots(db):
+    first = db.products.add('Widget', 5, 1.0, True)
+    db.products.add('Widget', 5, 2.0, True)
+    db.products.add('Widget', 4, 4.0, False)
+    sku_id = sku_of(db, first)
+    db.sales.record_many([(sku_id, 3, 5.0), (sku_id, 4, 5.0), (sku_id, 9, 5.0)])
+
+    sku = db.skus.get(sku_id)
+    # 3 + 4 sold of the 10 on hand; the 9 was turned away
+    assert (sku.quantity, sku.incoming) == (3, 4)
+    assert sku.stock_value == pytest.approx(3 * 2.0)
+
+    db.skus.receive_pending(sku_id)
+    sku = db.skus.get(sku_id)
+    assert (sku.quantity, sku.incoming) == (7, 0)
+    assert sku.stock_value == pytest.approx(3 * 2.0 + 4 * 4.0)
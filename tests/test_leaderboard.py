@@ -0,0 +1,68 @@
+import random
+
+import numpy as np
+import pytest
+
+from database import today
+from leaderboard import Leaderboard, TopK, window_starts
+
+
+def ranked(totals, limit):
+    # Profits of the best limit keys by a full sort
+    return sorted((revenue - cost for revenue, cost in totals.values()), reverse=True)[:limit]
+
+
+def profits(top):
+    return [revenue - cost for _, revenue, cost in top]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_topk_matches_a_full_sort(seed):
+    rng = random.Random(seed)
+    top = TopK(k=5)
+    totals = {}
+    for _ in range(500):
+        # Mostly single sales, some of them at a loss, and now and then a bulk merge
+        if rng.random() < 0.05:
+            items = [(rng.randrange(40), rng.uniform(0, 50), rng.uniform(0, 50)) for _ in range(20)]
+            top.add_many(items)
+        else:
+            items = [(rng.randrange(40), rng.uniform(0, 50), rng.uniform(0, 60))]
+            top.add(*items[0])
+        for key, revenue, cost in items:
+            before = totals.get(key, (0.0, 0.0))
+            totals[key] = (before[0] + revenue, before[1] + cost)
+        if rng.random() < 0.2:
+            assert profits(top.top()) == pytest.approx(ranked(totals, 5))
+
+    assert profits(top.top(3)) == pytest.approx(ranked(totals, 3))
+
+
+def test_topk_with_fewer_keys_than_k():
+    top = TopK(k=5)
+    top.add(1, 10.0, 4.0)
+    top.add(2, 3.0, 5.0)
+
+    assert top.top() == [(1, 10.0, 4.0), (2, 3.0, 5.0)]
+
+
+def test_leaderboard_windows_match_a_full_sort():
+    rng = np.random.default_rng(1)
+    day = today()
+    sku_ids = rng.integers(1, 60, 5000)
+    days = day - rng.integers(0, 90, 5000)
+    revenue = rng.uniform(0, 100, 5000)
+    cost = rng.uniform(0, 80, 5000)
+    board = Leaderboard()
+    for start in range(0, 5000, 1000):
+        block = slice(start, start + 1000)
+        board.add(sku_ids[block], days[block], revenue[block], cost[block])
+
+    starts = dict(window_starts(day), all=0)
+    for window, start in starts.items():
+        totals = {}
+        for sku_id, sale_day, sale_revenue, sale_cost in zip(sku_ids, days, revenue, cost):
+            if sale_day >= start:
+                before = totals.get(sku_id, (0.0, 0.0))
+                totals[sku_id] = (before[0] + sale_revenue, before[1] + sale_cost)
+        assert profits(board.top(window, 5)) == pytest.approx(ranked(totals, 5)), window
@@ -1,17 +1,27 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-                           QTableWidget, QTableWidgetItem, QLabel, QLineEdit,
-                           QSpinBox, QDoubleSpinBox, QMessageBox, QCheckBox)
-from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve
-from PyQt6.QtGui import QFont, QColor, QPalette
-import sqlite3
-from datetime import datetime
+                           QTableView, QAbstractItemView, QLabel, QLineEdit,
+                           QSpinBox, QDoubleSpinBox, QMessageBox, QCheckBox,
+                           QFileDialog, QProgressBar)
+from PyQt6.QtCore import QTimer, QThreadPool
+from database import get_database
+from sku_cache import get_sku_cache
+from models import SkuTableModel
+from workers import Worker
+from bulk_import import import_manifest
 
 class WarehouseTab(QWidget):
     def __init__(self):
         super().__init__()
+        self.db = get_database()
+        self.cache = get_sku_cache()
+        self.import_worker = None
         self.init_ui()
-        self.setup_database()
-        self.load_data()
+        
+        # Load after the tab has been painted once
+        QTimer.singleShot(0, self.load_data)
+        
+        # Pick up stock changes from sales and other terminals
+        self.cache.subscribe(self.apply_changes)
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -132,12 +142,14 @@ class WarehouseTab(QWidget):
         layout.addWidget(form_card)
         
         # Table with modern styling
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(["ID", "Product Name", "Quantity", "Cost per Unit", "Total Cost", "Status"])
+        self.model = SkuTableModel(self.db, self.cache, self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setVisible(False)
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: #34495e;
                 border: none;
                 border-radius: 10px;
@@ -145,7 +157,7 @@ class WarehouseTab(QWidget):
                 color: white;
                 font-size: 14px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 5px;
             }
             QHeaderView::section {
@@ -158,9 +170,9 @@ class WarehouseTab(QWidget):
         """)
         layout.addWidget(self.table)
         
-        # Toggle button with modern styling
-        self.toggle_btn = QPushButton("Toggle Arrived Status")
-        self.toggle_btn.setStyleSheet("""
+        # Receive button with modern styling
+        self.receive_btn = QPushButton("Mark Arrived")
+        self.receive_btn.setStyleSheet("""
             QPushButton {
                 background-color: #3498db;
                 color: white;
@@ -174,28 +186,44 @@ class WarehouseTab(QWidget):
                 background-color: #2980b9;
             }
         """)
-        self.toggle_btn.clicked.connect(self.toggle_arrived_status)
-        layout.addWidget(self.toggle_btn)
-
-    def setup_database(self):
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
+        self.receive_btn.clicked.connect(self.receive_pending)
         
-        # Add has_arrived column if it doesn't exist
-        try:
-            c.execute('ALTER TABLE products ADD COLUMN has_arrived BOOLEAN DEFAULT 0')
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-            
-        c.execute('''CREATE TABLE IF NOT EXISTS products
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     name TEXT NOT NULL,
-                     quantity INTEGER NOT NULL,
-                     cost_per_unit REAL NOT NULL,
-                     has_arrived BOOLEAN DEFAULT 0,
-                     date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        conn.commit()
-        conn.close()
+        # Bulk receiving: import a supplier manifest in the background
+        self.import_btn = QPushButton("Import Manifest")
+        self.import_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #9b59b6;
+                color: white;
+                border: none;
+                border-radius: 5px;
+                padding: 8px 15px;
+                font-size: 14px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #8e44ad;
+            }
+            QPushButton:disabled {
+                background-color: #7f8c8d;
+            }
+        """)
+        self.import_btn.clicked.connect(self.start_import)
+        
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.receive_btn)
+        button_layout.addWidget(self.import_btn)
+        layout.addLayout(button_layout)
+        
+        self.import_progress = QProgressBar()
+        self.import_progress.setRange(0, 1000)
+        self.import_progress.setTextVisible(False)
+        self.import_progress.setVisible(False)
+        layout.addWidget(self.import_progress)
+        
+        self.import_status = QLabel()
+        self.import_status.setStyleSheet("color: #bdc3c7; font-size: 13px;")
+        self.import_status.setVisible(False)
+        layout.addWidget(self.import_status)
 
     def add_product(self):
         name = self.name_input.text().strip()
@@ -207,14 +235,10 @@ class WarehouseTab(QWidget):
         cost_per_unit = self.cost_input.value()
         has_arrived = 1 if self.arrived_checkbox.isChecked() else 0
         
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO products (name, quantity, cost_per_unit, has_arrived)
-                    VALUES (?, ?, ?, ?)''', (name, quantity, cost_per_unit, has_arrived))
-        conn.commit()
-        conn.close()
+        # A new lot; its SKU's row is updated through the change log
+        self.db.products.add(name, quantity, cost_per_unit, has_arrived)
         
-        self.load_data()
+        self.cache.sync()
         self.clear_inputs()
         
         # Show success message with animation
@@ -232,44 +256,73 @@ class WarehouseTab(QWidget):
         """)
         success_msg.exec()
 
-    def toggle_arrived_status(self):
-        selected_items = self.table.selectedItems()
-        if not selected_items:
-            QMessageBox.warning(self, "Error", "Please select a product to toggle status")
+    def receive_pending(self):
+        selected_rows = self.table.selectionModel().selectedRows()
+        if not selected_rows:
+            QMessageBox.warning(self, "Error", "Please select a product to mark as arrived")
             return
             
-        row = selected_items[0].row()
-        product_id = int(self.table.item(row, 0).text())
+        row = selected_rows[0].row()
+        sku_id = self.model.sku_at(row).id
         
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        c.execute('UPDATE products SET has_arrived = NOT has_arrived WHERE id = ?', (product_id,))
-        conn.commit()
-        conn.close()
+        # Every lot of the product still on its way; the row comes back
+        # through the cache's change log
+        self.db.skus.receive_pending(sku_id)
         
-        self.load_data()
+        self.cache.sync()
 
-    def load_data(self):
-        conn = sqlite3.connect('warehouse.db')
-        c = conn.cursor()
-        # Only show products that haven't been sold (quantity > 0)
-        c.execute('''SELECT * FROM products 
-                    WHERE quantity > 0 
-                    ORDER BY date_added DESC''')
-        products = c.fetchall()
-        conn.close()
+    def start_import(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import Receiving Manifest", "",
+                                              "Manifests (*.csv *.parquet *.pq)")
+        if not path:
+            return
+        
+        # The import commits in chunks on a pool thread; the table catches
+        # up once, through the change bus, when it is done
+        self.import_btn.setEnabled(False)
+        self.import_progress.setValue(0)
+        self.import_progress.setVisible(True)
+        self.import_status.setText("Importing manifest...")
+        self.import_status.setVisible(True)
         
-        self.table.setRowCount(len(products))
-        for i, product in enumerate(products):
-            self.table.setItem(i, 0, QTableWidgetItem(str(product[0])))
-            self.table.setItem(i, 1, QTableWidgetItem(product[1]))
-            self.table.setItem(i, 2, QTableWidgetItem(str(product[2])))
-            self.table.setItem(i, 3, QTableWidgetItem(f"${product[3]:.2f}"))
-            self.table.setItem(i, 4, QTableWidgetItem(f"${product[2] * product[3]:.2f}"))
-            status = "✓ Arrived" if product[4] else "⏳ Pending"
-            status_item = QTableWidgetItem(status)
-            status_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            self.table.setItem(i, 5, status_item)
+        self.import_worker = Worker(import_manifest, self.db, path, progress=True)
+        self.import_worker.signals.progress.connect(self.show_import_progress)
+        self.import_worker.signals.finished.connect(self.import_finished)
+        self.import_worker.signals.failed.connect(self.import_failed)
+        QThreadPool.globalInstance().start(self.import_worker)
+
+    def show_import_progress(self, generation, progress):
+        self.import_progress.setValue(int(progress.fraction * 1000))
+        self.import_status.setText(f"Importing manifest... {progress.rows:,} rows read")
+
+    def import_finished(self, generation, result):
+        self.import_worker = None
+        self.import_btn.setEnabled(True)
+        self.import_progress.setVisible(False)
+        message = f"Imported {result.inserted:,} products"
+        if result.rejected:
+            line, error = result.errors[0]
+            message += f" ({result.rejected:,} rejected, first at line {line}: {error})"
+        self.import_status.setText(message)
+
+    def import_failed(self, generation, error):
+        self.import_worker = None
+        self.import_btn.setEnabled(True)
+        self.import_progress.setVisible(False)
+        self.import_status.setText("Import failed: " + error.strip().splitlines()[-1])
+
+    def load_data(self):
+        # Rows are paged in lazily by the model as the view scrolls
+        self.model.reload()
+
+    def apply_changes(self, skus):
+        # The SKUs changed here or elsewhere, as the cache re-read them;
+        # more than a page of changes (a bulk import) is cheaper to reload
+        if skus is None or len(skus) > self.model.PAGE_SIZE:
+            self.load_data()
+            return
+        for sku in skus:
+            self.model.upsert(sku)
 
     def clear_inputs(self):
         self.name_input.clear()
@@ -0,0 +1,87 @@
+import traceback
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    progress = pyqtSignal(int, object)
+
+
+class Worker(QRunnable):
+    # Runs fn(*args, **kwargs) on a QThreadPool thread. Results come back
+    # through signals, tagged with the caller's generation number. With
+    # progress=True, fn also gets a progress callback that emits the
+    # progress signal.
+    def __init__(self, fn, *args, generation=0, progress=False, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.generation = generation
+        self.signals = WorkerSignals()
+        if progress:
+            self.kwargs['progress'] = self.report_progress
+
+    def report_progress(self, value):
+        self.signals.progress.emit(self.generation, value)
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception:
+            self.signals.failed.emit(self.generation, traceback.format_exc())
+        else:
+            self.signals.finished.emit(self.generation, result)
+
+
+class CoalescingRunner(QObject):
+    # Runs fn in the background on request, with at most one run in flight
+    # and at most one queued behind it. Requests arriving while a run is in
+    # flight collapse into the queued one, and a result that was superseded
+    # by a newer request before it arrived is dropped.
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, fn, pool=None, parent=None):
+        super().__init__(parent)
+        self.fn = fn
+        self.pool = pool or QThreadPool.globalInstance()
+        self._generation = 0
+        self._running = None
+        self._pending = False
+
+    def request(self):
+        if self._running is not None:
+            self._pending = True
+            return
+        self._start()
+
+    def _start(self):
+        self._generation += 1
+        self._running = Worker(self.fn, generation=self._generation)
+        self._running.signals.finished.connect(self._on_finished)
+        self._running.signals.failed.connect(self._on_failed)
+        self.pool.start(self._running)
+
+    def _settle(self, generation):
+        # Returns True when the result for generation is still current
+        if generation != self._generation:
+            return False
+        self._running = None
+        if self._pending:
+            self._pending = False
+            self._start()
+            return False
+        return True
+
+    @pyqtSlot(int, object)
+    def _on_finished(self, generation, result):
+        if self._settle(generation):
+            self.finished.emit(result)
+
+    @pyqtSlot(int, str)
+    def _on_failed(self, generation, error):
+        if self._settle(generation):
+            self.failed.emit(error)